@@ -0,0 +1,46 @@
+from src.Script import Script, p2pkh_script, p2sh_script
+from src.ScriptClassifier import ScriptPubKeyClassification
+
+import os
+import random
+import time
+
+def output_mix(n, seed=0):
+    """Returns n raw ScriptPubKeys: 60% p2pkh, 30% p2sh, 10% OP_RETURN"""
+    rng = random.Random(seed)
+    scripts = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.6:
+            scripts.append(p2pkh_script(os.urandom(20)).raw_serialize())
+        elif roll < 0.9:
+            scripts.append(p2sh_script(os.urandom(20)).raw_serialize())
+        else:
+            scripts.append(Script([0x6a, os.urandom(32)]).raw_serialize())
+    return scripts
+
+def script_addresses(raw_scripts):
+    """The per-script way: build a Script and ask it for its address"""
+    addresses = []
+    for raw in raw_scripts:
+        try:
+            addresses.append(Script(raw=raw).address())
+        except ValueError:
+            addresses.append(None)
+    return addresses
+
+def timed(name, n, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {n:>8} scripts {elapsed * 1000:>10.2f} ms {n / elapsed:>12,.0f} scripts/s")
+    return result
+
+if __name__ == '__main__':
+    n = 200000
+    raw_scripts = output_mix(n)
+    expected = timed("Script.address", n, lambda: script_addresses(raw_scripts))
+    classification = timed("classify", n, lambda: ScriptPubKeyClassification.classify(raw_scripts))
+    addresses = timed("classify + addresses", n, lambda: list(ScriptPubKeyClassification.classify(raw_scripts).addresses()))
+    assert addresses == expected
+    print(classification.counts())
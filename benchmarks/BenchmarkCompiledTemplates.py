@@ -0,0 +1,61 @@
+from src.Script import Script, p2sh_script, verify_script, encode_num
+from src.ScriptTemplateCache import SCRIPT_TEMPLATE_CACHE
+from src.SignatureCache import SIGNATURE_CACHE
+from src.utils import hash160
+
+import hashlib
+import time
+
+Z = 0x1234
+
+def multisig_inputs(n):
+    """n 2-of-3 p2sh multisig (ScriptSig, ScriptPubKey) pairs, each with its own keys and signatures"""
+    pairs = []
+    for i in range(n):
+        keys = [b'key %d %d' % (i, j) for j in range(3)]
+        sigs = [b'sig %d %d\x01' % (i, j) for j in range(3)]
+        for sig, key in zip(sigs, keys):
+            SIGNATURE_CACHE.add(Z, sig[:-1], key)
+        redeem_script = Script([0x52] + keys + [0x53, 0xae]).raw_serialize()
+        pairs.append((Script([0x00, sigs[0], sigs[1], redeem_script]), p2sh_script(hash160(redeem_script))))
+    return pairs
+
+def timelock_scripts(n):
+    """n hash time locked contracts alternately spent through the hash and the timeout branch"""
+    scripts = []
+    for i in range(n):
+        preimage = b'preimage %d' % i
+        key_a, key_b = b'key a %d' % i, b'key b %d' % i
+        sig = b'sig %d\x01' % i
+        SIGNATURE_CACHE.add(Z, sig[:-1], key_a)
+        SIGNATURE_CACHE.add(Z, sig[:-1], key_b)
+        script_pubkey = Script([0x63, 0xa8, hashlib.sha256(preimage).digest(), 0x88, key_a,
+                                0x67, encode_num(500000 + i), 0xb1, 0x75, key_b, 0x68, 0xac])
+        if i % 2:
+            scripts.append(Script([sig, preimage, 0x51]) + script_pubkey)
+        else:
+            scripts.append(Script([sig, 0x00]) + script_pubkey)
+    return scripts
+
+def timed(name, n, function):
+    start = time.perf_counter()
+    if not function():
+        raise RuntimeError(f"{name}: a script failed")
+    elapsed = time.perf_counter() - start
+    print(f"{name:<36} {n:>8} scripts {elapsed * 1000:>10.2f} ms {n / elapsed:>12,.0f} scripts/s")
+
+if __name__ == '__main__':
+    n = 20000
+    pairs = multisig_inputs(n)
+    scripts = timelock_scripts(n)
+    verify_pairs = lambda: all(verify_script(script_sig, script_pubkey, Z) for script_sig, script_pubkey in pairs)
+    evaluate_scripts = lambda: all(script.evaluate(Z, locktime=600000, sequence=0) for script in scripts)
+    max_entries = SCRIPT_TEMPLATE_CACHE.max_entries
+    SCRIPT_TEMPLATE_CACHE.max_entries = 0
+    timed("p2sh 2-of-3 multisig, interpreter", n, verify_pairs)
+    timed("htlc, interpreter", n, evaluate_scripts)
+    SCRIPT_TEMPLATE_CACHE.max_entries = max_entries
+    SCRIPT_TEMPLATE_CACHE.clear()
+    timed("p2sh 2-of-3 multisig, compiled", n, verify_pairs)
+    timed("htlc, compiled", n, evaluate_scripts)
+    print(SCRIPT_TEMPLATE_CACHE.stats())
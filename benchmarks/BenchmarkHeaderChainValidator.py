@@ -0,0 +1,56 @@
+from src.Block import Block
+from src.HeaderChainValidator import HeaderChainValidator
+from src.utils import bits_to_target, hash256
+
+from io import BytesIO
+import os
+import sys
+import time
+
+REGTEST_BITS = bytes.fromhex('ffff7f20')
+
+def mined_chain(count, timestamp):
+    """Returns count linked serialized headers with enough work for REGTEST_BITS, 600 seconds apart"""
+    target = bits_to_target(REGTEST_BITS)
+    prev = bytes(32)
+    raws = []
+    for i in range(count):
+        nonce = 0
+        while True:
+            raw = b'\x01\x00\x00\x00' + prev + os.urandom(32) + (timestamp + i * 600).to_bytes(4, 'little') + REGTEST_BITS + nonce.to_bytes(4, 'little')
+            if int.from_bytes(hash256(raw), 'little') < target:
+                break
+            nonce += 1
+        prev = hash256(raw)
+        raws.append(raw)
+    return raws
+
+def manual_validate(blocks):
+    """The per header way: hash_block, check_pow and a linkage check on Block objects"""
+    previous = blocks[0].prev_block
+    for block in blocks:
+        if block.prev_block != previous or not block.check_pow():
+            return False
+        previous = block.hash_block()
+    return True
+
+def timed(name, count, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {count:>7} headers {elapsed * 1000:>10.2f} ms {count / elapsed:>12,.0f} headers/s")
+    return result
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    count = 2000
+    raws = mined_chain(count + 1, 1296688602)
+    blocks = [Block.parse_block(BytesIO(raw)) for raw in raws[1:]]
+    buffer = b''.join(raws[1:])
+    genesis = Block.parse_block(BytesIO(raws[0]))
+    def validator():
+        return HeaderChainValidator(0, genesis.hash_block(), REGTEST_BITS, [genesis.timestamp], genesis.timestamp, REGTEST_BITS)
+    assert timed("Block.check_pow per header", count, lambda: manual_validate(blocks))
+    assert timed("validator, Blocks", count, lambda: validator().validate(blocks)) is None
+    assert timed("validator, raw buffer", count, lambda: validator().validate(buffer)) is None
+    assert timed(f"validator, {workers} processes", count, lambda: validator().validate(buffer, workers)) is None
@@ -0,0 +1,42 @@
+from src.HeaderStore import HeaderStore, HEADER_SIZE
+from src.utils import hash256
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+def linked_headers(count):
+    """Yields count serialized headers, each pointing to the previous one"""
+    prev = bytes(32)
+    for i in range(count):
+        raw = b'\x01\x00\x00\x00' + prev + os.urandom(32) + (1231006505 + i * 600).to_bytes(4, 'little') + b'\xff\xff\x00\x1d' + i.to_bytes(4, 'little')
+        prev = hash256(raw)
+        yield raw
+
+def timed(name, function):
+    start = time.perf_counter()
+    result = function()
+    print(f"{name:<36} {(time.perf_counter() - start) * 1000:>10.2f} ms")
+    return result
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 800000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'headers.dat')
+        with HeaderStore(path) as store:
+            timed(f"append {count} headers", lambda: store.extend(linked_headers(count)))
+        store = timed("open store", lambda: HeaderStore(path))
+        heights = [random.randrange(count) for _ in range(100000)]
+        timed("100000 raw headers by height", lambda: [store.raw_header(h) for h in heights])
+        timed("100000 Blocks by height", lambda: [store[h] for h in heights])
+        hashes = [store.hash_at(h) for h in heights]
+        timed("build hash index", store.build_index)
+        assert timed("100000 heights by hash", lambda: [store.height_of(h) for h in hashes]) == heights
+        index_bytes = store.index.keys.itemsize * len(store.index.keys) + store.index.values.itemsize * len(store.index.values)
+        print(f"{HEADER_SIZE} bytes per header on disk, {index_bytes / count:.1f} bytes per header in the hash index")
+        timed("save hash index on close", store.close)
+        store = HeaderStore(path)
+        timed("load saved hash index", store.build_index)
+        store.close()
@@ -0,0 +1,49 @@
+from src.Block import Block
+from src.MerkleBlock import MerkleBlock
+from src.Script import Script, p2pkh_script
+from src.Transaction import Transaction, TransactionInput, TransactionOutput
+from src.utils import encode_varint
+
+from io import BytesIO
+import os
+import sys
+import time
+import tracemalloc
+
+def object_size(obj):
+    """Returns the bytes taken by obj itself and its attribute dict, if it has one"""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def synthetic_block(tx_count):
+    """Returns a serialized block of tx_count two input, two output p2pkh transactions"""
+    txs = []
+    for _ in range(tx_count):
+        tx_ins = [TransactionInput(os.urandom(32), 0, Script([os.urandom(72), os.urandom(33)])) for _ in range(2)]
+        tx_outs = [TransactionOutput(50000, p2pkh_script(os.urandom(20))) for _ in range(2)]
+        txs.append(Transaction(1, tx_ins, tx_outs, 0).serialize_transaction())
+    header = Block(0x20000000, bytes(32), bytes(32), 1231006505, bytes.fromhex('ffff001d'), bytes(4)).serialize_block_header()
+    return header + encode_varint(tx_count) + b''.join(txs)
+
+def measured(name, function):
+    """Runs function, printing the time taken and the memory its result holds on to"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{name:<36} {elapsed * 1000:>10.2f} ms {current / 1024:>12.1f} KiB held")
+    return result
+
+if __name__ == '__main__':
+    raw_block = synthetic_block(2000)
+    block = measured("parse a 2000 transaction block", lambda: Block.parse_full_block(BytesIO(raw_block)))
+    headers = os.urandom(80 * 2000)
+    measured("parse 2000 headers", lambda: [Block.parse_block(BytesIO(headers[i:i + 80])) for i in range(0, len(headers), 80)])
+    tx = block.transactions[0]
+    merkle_block = MerkleBlock(1, bytes(32), bytes(32), 0, bytes(4), bytes(4), 1, [bytes(32)], b'\x01')
+    for obj in (block, merkle_block, tx, tx.tx_ins[0], tx.tx_outs[0], tx.tx_outs[0].script_pubkey):
+        print(f"{type(obj).__name__:<36} {object_size(obj):>10} bytes per object")
@@ -0,0 +1,27 @@
+from src.MerkleEngine import compute_merkle_root
+from src.utils import merkle_parent_level
+
+import os
+import time
+
+def list_merkle_root(hashes):
+    """The list based computation: a new list per level of concatenated pairs"""
+    level = list(hashes)
+    while len(level) > 1:
+        level = merkle_parent_level(level)
+    return level[0]
+
+def timed(name, count, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {count:>9} leaves {elapsed * 1000:>10.2f} ms {count / elapsed:>12,.0f} leaves/s")
+    return result
+
+if __name__ == '__main__':
+    for count in (1000, 10000, 100000, 1000000):
+        hashes = [os.urandom(32) for _ in range(count)]
+        buffer = b''.join(hashes)
+        want = timed("list levels", count, lambda: list_merkle_root(hashes))
+        assert timed("engine, list input", count, lambda: compute_merkle_root(hashes))[0] == want
+        assert timed("engine, contiguous buffer", count, lambda: compute_merkle_root(buffer))[0] == want
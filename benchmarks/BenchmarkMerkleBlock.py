@@ -0,0 +1,74 @@
+from src.Block import Block
+from src.MerkleBlock import MerkleProofBuilder, MerkleTree, SparseMerkleTree
+from src.utils import bytes_to_bit_field, merkle_parent, merkle_root
+
+import os
+import random
+import time
+import tracemalloc
+
+def pop_populate_tree(tree, flag_bits, hashes):
+    """The previous traversal: pop(0) from a list of flag bits and from the hashes"""
+    while tree.root() is None:
+        if tree.is_leaf():
+            flag_bits.pop(0)
+            tree.set_current_node(hashes.pop(0))
+            tree.up()
+        else:
+            left_hash = tree.get_left_node()
+            if left_hash is None:
+                if flag_bits.pop(0) == 0:
+                    tree.set_current_node(hashes.pop(0))
+                    tree.up()
+                else:
+                    tree.left()
+            elif tree.right_exists():
+                right_hash = tree.get_right_node()
+                if right_hash is None:
+                    tree.right()
+                else:
+                    tree.set_current_node(merkle_parent(left_hash, right_hash))
+                    tree.up()
+            else:
+                tree.set_current_node(merkle_parent(left_hash, left_hash))
+                tree.up()
+
+def pop_is_valid(mb):
+    tree = MerkleTree(mb.total)
+    pop_populate_tree(tree, bytes_to_bit_field(mb.flags), [h[::-1] for h in mb.hashes])
+    return tree.root()[::-1] == mb.merkle_root
+
+def filtered_block(total, matches, seed=0):
+    """Returns a MerkleBlock of total txids with matches of them matched"""
+    txids = [os.urandom(32) for _ in range(total)]
+    root = merkle_root([h[::-1] for h in txids])[::-1]
+    block = Block(0x20000000, b'\x00' * 32, root, 0, bytes.fromhex('ffff001d'), b'\x00' * 4, txids)
+    matched = random.Random(seed).sample(txids, matches)
+    return MerkleProofBuilder(block).merkle_block(matched)
+
+def timed(name, mb, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {mb.total:>7} txids {len(mb.hashes):>7} hashes {elapsed * 1000:>10.2f} ms")
+    return result
+
+def tree_memory(cls, mb):
+    """Returns the peak bytes allocated while populating a tree of class cls from mb"""
+    hashes = [h[::-1] for h in mb.hashes]
+    tracemalloc.start()
+    tree = cls(mb.total)
+    tree.populate_tree(mb.flags, hashes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+if __name__ == '__main__':
+    for total, matches in ((4000, 1000), (20000, 5000), (100000, 25000)):
+        mb = filtered_block(total, matches)
+        assert timed("pop(0) traversal", mb, lambda: pop_is_valid(mb))
+        assert timed("cursor traversal", mb, lambda: mb.is_valid())
+    for total in (4000, 100000):
+        mb = filtered_block(total, 2)
+        for cls in (MerkleTree, SparseMerkleTree):
+            print(f"{cls.__name__:<20} {total:>7} txids {len(mb.hashes):>7} hashes {tree_memory(cls, mb) / 1024:>10.1f} KiB")
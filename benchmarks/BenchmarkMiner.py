@@ -0,0 +1,34 @@
+from src.Block import Block
+from src.Miner import mine, scan_nonces
+
+import os
+import sys
+import time
+
+def check_pow_search(block, count):
+    """The per attempt way: assign the nonce, serialize the header and check_pow"""
+    for nonce in range(count):
+        block.nonce = nonce.to_bytes(4, 'little')
+        if block.check_pow():
+            return nonce
+    return None
+
+def timed(name, hashes, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<36} {hashes:>9} hashes {elapsed * 1000:>10.2f} ms {hashes / elapsed:>12,.0f} H/s")
+    return result
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    count = 200000
+    # a target no nonce meets, so every method tries all count nonces
+    block = Block(0x20000000, bytes(32), os.urandom(32), 1296688602, bytes.fromhex('01000003'), bytes(4))
+    timed("check_pow per nonce", count, lambda: check_pow_search(block, count))
+    timed("midstate scan", count, lambda: scan_nonces(block.serialize_block_header(), block.target(), 0, count))
+    for bits in ('ffff0320', 'ffff001f'):
+        for w in (1, workers):
+            block = Block(0x20000000, bytes(32), os.urandom(32), 1296688602, bytes.fromhex(bits), bytes(4))
+            result = mine(block, workers=w, chunk_size=1 << 16)
+            print(f"mine bits {bits}, {w} workers{'':<14} {result.hashes:>9} hashes {result.seconds * 1000:>10.2f} ms {result.hashes_per_second():>12,.0f} H/s")
@@ -0,0 +1,58 @@
+from src.Script import Script
+from src.ScriptProfiler import SCRIPT_PROFILER
+
+import sys
+import time
+
+def time_evaluate(name, script, number=1000, repeat=5):
+    """Evaluates script number times per round and prints the best time per evaluation and opcodes per second"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            result = script.evaluate(0)
+        elapsed = (time.perf_counter() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    print(f"{name:<40} {len(script.cmds):>8} cmds {best * 1e6:>10.2f} us {len(script.cmds) / best:>14,.0f} cmds/s  result={result}")
+
+def push_drop_script(n):
+    """OP_1 OP_DROP repeated n times followed by OP_1"""
+    return Script([0x51, 0x75] * n + [0x51])
+
+def hash_chain_script(n):
+    """A push hashed n times with OP_SHA256 then checked with OP_SIZE"""
+    return Script([b'seed'] + [0xa8] * n + [0x82])
+
+def branch_script(n):
+    """n sequential OP_IF/OP_ELSE/OP_ENDIF blocks alternately taking each branch"""
+    cmds = []
+    for i in range(n):
+        cmds += [0x51 if i % 2 else 0x00, 0x63, 0x51, 0x75, 0x67, 0x52, 0x75, 0x68]
+    return Script(cmds + [0x51])
+
+def nested_branch_script(depth, body=20):
+    """depth nested OP_IF blocks whose false branch contains a long body"""
+    cmds = []
+    for _ in range(depth):
+        cmds += [0x51, 0x63]
+    cmds += [0x51, 0x75] * body
+    for _ in range(depth):
+        cmds += [0x67, 0x51, 0x75, 0x68]
+    return Script(cmds + [0x51])
+
+if __name__ == '__main__':
+    # --profile prints the per-opcode table of SCRIPT_PROFILER after the runs
+    if '--profile' in sys.argv:
+        SCRIPT_PROFILER.enable()
+    # sizes stay within MAX_OPS_PER_SCRIPT, longer scripts are rejected before running
+    for n in (50, 200):
+        time_evaluate(f"push/drop x{n}", push_drop_script(n))
+    for n in (50, 200):
+        time_evaluate(f"sha256 chain x{n}", hash_chain_script(n))
+    for n in (10, 40):
+        time_evaluate(f"if/else blocks x{n}", branch_script(n))
+    for depth in (10, 45):
+        time_evaluate(f"nested if depth {depth}", nested_branch_script(depth))
+    if SCRIPT_PROFILER.enabled:
+        print(SCRIPT_PROFILER.report())
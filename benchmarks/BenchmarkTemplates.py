@@ -0,0 +1,44 @@
+from src.Script import Script, p2pkh_script, p2sh_script, verify_script
+from src.SignatureCache import SIGNATURE_CACHE
+from src.utils import hash160
+
+import hashlib
+import random
+import time
+
+Z = 0x7c076ff316692a3d7eb3c3bb0f8b1488cf72e1afcd929e29307032997a838a3d
+SEC = bytes.fromhex('04887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34')
+SIG = bytes.fromhex('3045022000eff69ef2b1bd93a66ed5219add4fb51e11a840f404876325a1e8ffe0529a2c022100c7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab601')
+
+def realistic_mix(n, seed=0):
+    """Returns n (ScriptSig, ScriptPubKey) pairs: 70% p2pkh, 20% p2sh-wrapped p2pk, 10% p2sh hash locks"""
+    rng = random.Random(seed)
+    p2pk_redeem = Script([SEC, 0xac]).raw_serialize()
+    hash_lock_redeem = Script([0xa8, hashlib.sha256(b'preimage').digest(), 0x87]).raw_serialize()
+    pairs = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.7:
+            pairs.append((Script([SIG, SEC]), p2pkh_script(hash160(SEC))))
+        elif roll < 0.9:
+            pairs.append((Script([SIG, p2pk_redeem]), p2sh_script(hash160(p2pk_redeem))))
+        else:
+            pairs.append((Script([b'preimage', hash_lock_redeem]), p2sh_script(hash160(hash_lock_redeem))))
+    return pairs
+
+def time_inputs(name, pairs, verify):
+    start = time.perf_counter()
+    for script_sig, script_pubkey in pairs:
+        if not verify(script_sig, script_pubkey):
+            raise RuntimeError(f"{name}: input failed to verify")
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {len(pairs):>8} inputs {elapsed * 1000:>10.2f} ms {len(pairs) / elapsed:>12,.0f} inputs/s")
+
+if __name__ == '__main__':
+    # one real verification warms the signature cache so the numbers measure script handling, not curve math
+    print('warming signature cache...')
+    assert verify_script(Script([SIG, SEC]), p2pkh_script(hash160(SEC)), Z)
+    pairs = realistic_mix(100000)
+    time_inputs('generic interpreter', pairs, lambda script_sig, script_pubkey: (script_sig + script_pubkey).evaluate(Z))
+    time_inputs('template fast paths', pairs, lambda script_sig, script_pubkey: verify_script(script_sig, script_pubkey, Z))
+    print(SIGNATURE_CACHE)
@@ -1,41 +1,104 @@
 from __future__ import annotations
+from src.MerkleEngine import compute_merkle_root
+from src.Transaction import HashingReader, Transaction
 from src.utils import (
     bits_to_target,
+    decode_varint,
     hash256,
     int_to_little_endian,
     little_endian_to_int,
-    merkle_root
 )
 
+# header fields whose assignment invalidates the cached serialization and hash
+HEADER_FIELDS = frozenset(('version', 'prev_block', 'merkle_root', 'timestamp', 'bits', 'nonce'))
+
 class Block:
+    __slots__ = ('version', 'prev_block', 'merkle_root', 'timestamp', 'bits', 'nonce', 'tx_hashes', 'transactions',
+                 '_raw_header', '_hash', '_leaves')
+
     def __init__(self, version, prev_block, merkle_root, timestamp, bits, nonce, transaction_hashes = None):
-        self.version = version
-        self.prev_block = prev_block
-        self.merkle_root = merkle_root
-        self.timestamp = timestamp
-        self.bits = bits
-        self.nonce = nonce
-        self.transaction_hashes = transaction_hashes
+        # the fields are set past __setattr__, there is no cache to invalidate yet
+        set_field = object.__setattr__
+        set_field(self, 'version', version)
+        set_field(self, 'prev_block', prev_block)
+        set_field(self, 'merkle_root', merkle_root)
+        set_field(self, 'timestamp', timestamp)
+        set_field(self, 'bits', bits)
+        set_field(self, 'nonce', nonce)
+        # txids of the transactions in block order
+        set_field(self, 'tx_hashes', transaction_hashes)
+        # the same txids in internal byte order as read by iter_transactions, dropped when tx_hashes is assigned
+        set_field(self, '_leaves', None)
+        # parsed transactions, only kept by parse_full_block
+        set_field(self, 'transactions', None)
+        # the 80 byte header and its hash, dropped whenever a header field is assigned
+        set_field(self, '_raw_header', None)
+        set_field(self, '_hash', None)
+
+    def __setattr__(self, name, value) -> None:
+        object.__setattr__(self, name, value)
+        if name in HEADER_FIELDS:
+            object.__setattr__(self, '_raw_header', None)
+            object.__setattr__(self, '_hash', None)
+        elif name == 'tx_hashes':
+            object.__setattr__(self, '_leaves', None)
+
+    @property
+    def transaction_hashes(self) -> list:
+        """The txids of the transactions, under the name the attribute had before tx_hashes"""
+        return self.tx_hashes
+
+    @transaction_hashes.setter
+    def transaction_hashes(self, transaction_hashes) -> None:
+        self.tx_hashes = transaction_hashes
 
     @classmethod
     def parse_block(cls, byte_stream: bytes) -> Block:
         """Takes a byte stream and parses out a block and returns an instance of a Block object"""
+        raw = byte_stream.read(80)
         # version - 4 bytes, little endian, interpret as int
-        version = little_endian_to_int(byte_stream.read(4))
+        version = little_endian_to_int(raw[0:4])
         # prev_block - 32 bytes, little endian (use [::-1] to reverse)
-        prev_block = byte_stream.read(32)[::-1]
+        prev_block = raw[4:36][::-1]
         # merkle_root - 32 bytes, little endian (use [::-1] to reverse)
-        merkle_root = byte_stream.read(32)[::-1]
+        merkle_root = raw[36:68][::-1]
         # timestamp - 4 bytes, little endian, interpret as int
-        timestamp = little_endian_to_int(byte_stream.read(4))
+        timestamp = little_endian_to_int(raw[68:72])
         # bits - 4 bytes
-        bits = byte_stream.read(4)
+        bits = raw[72:76]
         # nonce - 4 bytes
-        nonce = byte_stream.read(4)
-        return Block(version, prev_block, merkle_root, timestamp, bits, nonce)
+        nonce = raw[76:80]
+        block = Block(version, prev_block, merkle_root, timestamp, bits, nonce)
+        # keep the bytes as read so serializing and hashing the header needs no work
+        if len(raw) == 80:
+            object.__setattr__(block, '_raw_header', bytes(raw))
+        return block
+
+    @classmethod
+    def parse_full_block(cls, byte_stream: bytes, testnet: bool = False) -> Block:
+        """Parses a serialized block (header, transaction count and transactions) keeping its transactions and txids"""
+        block = cls.parse_block(byte_stream)
+        block.transactions = list(block.iter_transactions(byte_stream, testnet))
+        return block
+
+    def iter_transactions(self, byte_stream: bytes, testnet: bool = False):
+        """Yields the transactions following the header in byte_stream one at a time, recording their txids in
+        tx_hashes as they are parsed so the merkle root can be validated once the stream is exhausted"""
+        tx_hashes = self.tx_hashes = []
+        leaves = []
+        object.__setattr__(self, '_leaves', leaves)
+        for _ in range(decode_varint(byte_stream)):
+            reader = HashingReader(byte_stream)
+            tx = Transaction.parse_transaction(reader, testnet=testnet, reader=reader)
+            leaf = reader.double_sha256()
+            leaves.append(leaf)
+            tx_hashes.append(leaf[::-1])
+            yield tx
 
     def serialize_block_header(self) -> bytes:
-        """Returns the 80 byte block header"""
+        """Returns the 80 byte block header, cached until a header field is assigned"""
+        if self._raw_header is not None:
+            return self._raw_header
         # version - 4 bytes, little endian
         result = int_to_little_endian(self.version, 4)
         # prev_block - 32 bytes, little endian
@@ -48,13 +111,15 @@ class Block:
         result += self.bits
         # nonce - 4 bytes
         result += self.nonce
+        self._raw_header = result
         return result
 
     def hash_block(self) -> bytes:
-        """Returns the hash256 interpreted little endian of the block"""
-        s = self.serialize_block_header()
-        sha = hash256(s)
-        return sha[::-1]
+        """Returns the hash256 interpreted little endian of the block, cached until a header field is assigned.
+        Fields mutated in place (a bytearray nonce) are not noticed, assign them instead"""
+        if self._hash is None:
+            self._hash = hash256(self.serialize_block_header())[::-1]
+        return self._hash
 
     def bip9(self) -> bool:
         """Returns whether this block is signaling readiness for BIP9"""
@@ -79,12 +144,15 @@ class Block:
 
     def check_pow(self) -> bool:
         """Returns whether this block satisfies proof of work"""
-        sha = hash256(self.serialize_block_header())
-        proof = little_endian_to_int(sha)
+        proof = int.from_bytes(self.hash_block(), 'big')
         return proof < self.target()
     
     def validate_merkle_root(self) -> bool:
-        """Validates a merkle root for the current block"""
-        hashes = [h[::-1] for h in self.tx_hashes]
-        root = merkle_root(hashes)
-        return root[::-1] == self.merkle_root
+        """Validates a merkle root for the current block, rejecting transaction lists that pair equal hashes (CVE-2012-2459).
+        Txids read by iter_transactions are used in the byte order they were hashed in, so nothing is reversed.
+        Like the header fields, tx_hashes changed in place is not noticed, assign it instead"""
+        leaves = self._leaves
+        if leaves is None:
+            leaves = [h[::-1] for h in self.tx_hashes]
+        root, mutated = compute_merkle_root(leaves)
+        return not mutated and root == self.serialize_block_header()[36:68]
@@ -0,0 +1,143 @@
+from __future__ import annotations
+from io import BytesIO
+from src.Block import Block
+from src.Network import NETWORK_MAGIC, TESTNET_NETWORK_MAGIC
+from src.utils import hash256
+
+import glob
+import json
+import mmap
+import os
+
+# magic and little endian block size in front of every block
+FRAME_SIZE = 8
+
+class BlockFileReader:
+    """Random access to the blocks stored in Bitcoin Core's blk*.dat files. Each file is memory mapped and scanned
+    once for its magic and size framing into a block hash -> (file name, offset, size) index, saved as JSON at
+    index_path when given so later runs only scan what was appended since. Files obfuscated with the key in
+    xor.dat (Bitcoin Core 28 and later) are read through that key"""
+    def __init__(self, directory: str, testnet: bool = False, index_path: str = None, magic: bytes = None):
+        self.directory = directory
+        self.magic = magic or (TESTNET_NETWORK_MAGIC if testnet else NETWORK_MAGIC)
+        self.testnet = testnet
+        self.index_path = index_path
+        # block hash -> (file name, offset of the block, size)
+        self.index = {}
+        # file name -> bytes scanned so far
+        self.scanned = {}
+        self.maps = {}
+        self.xor_key = None
+        xor_path = os.path.join(directory, 'xor.dat')
+        if os.path.exists(xor_path):
+            with open(xor_path, 'rb') as f:
+                key = f.read()
+            if any(key):
+                self.xor_key = key
+        if index_path is not None and os.path.exists(index_path):
+            self.load_index()
+        self.update()
+
+    def __repr__(self) -> str:
+        """Returns string representation of BlockFileReader"""
+        return f"BlockFileReader({self.directory}, {len(self.index)} blocks in {len(self.scanned)} files)"
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, block_hash: bytes) -> bool:
+        return block_hash in self.index
+
+    def __enter__(self) -> BlockFileReader:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmaps every file"""
+        for block_map in self.maps.values():
+            block_map.close()
+        self.maps.clear()
+
+    def load_index(self) -> None:
+        """Reads the index saved at index_path"""
+        with open(self.index_path) as f:
+            saved = json.load(f)
+        self.scanned = saved['files']
+        self.index = {bytes.fromhex(h): tuple(location) for h, location in saved['blocks'].items()}
+
+    def save_index(self) -> None:
+        """Writes the index to index_path"""
+        saved = {
+            'files': self.scanned,
+            'blocks': {h.hex(): list(location) for h, location in self.index.items()},
+        }
+        with open(self.index_path, 'w') as f:
+            json.dump(saved, f)
+
+    def read(self, name: str, offset: int, size: int) -> bytes:
+        """Returns size bytes of a block file from offset, unobfuscated. The file is mapped on first use and
+        mapped again when the range lies past the end of the map, after the file grew"""
+        block_map = self.maps.get(name)
+        if block_map is None or len(block_map) < offset + size:
+            if block_map is not None:
+                block_map.close()
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                block_map = self.maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = block_map[offset:offset + size]
+        if self.xor_key is None or len(data) == 0:
+            return data
+        key = self.xor_key
+        shift = offset % len(key)
+        stream = (key[shift:] + key[:shift]) * (len(data) // len(key) + 1)
+        return (int.from_bytes(data, 'little') ^ int.from_bytes(stream[:len(data)], 'little')).to_bytes(len(data), 'little')
+
+    def update(self) -> int:
+        """Scans blk*.dat files for blocks written since the last scan and saves the index if it has a path.
+        Returns the number of blocks added"""
+        added = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, 'blk*.dat'))):
+            name = os.path.basename(path)
+            size = os.path.getsize(path)
+            offset = self.scanned.get(name, 0)
+            while offset + FRAME_SIZE <= size:
+                frame = self.read(name, offset, FRAME_SIZE)
+                # a mismatch is the zero filled space Bitcoin Core preallocates, or a block still being written
+                if frame[:4] != self.magic:
+                    break
+                block_size = int.from_bytes(frame[4:], 'little')
+                if block_size < 80 or offset + FRAME_SIZE + block_size > size:
+                    break
+                block_hash = hash256(self.read(name, offset + FRAME_SIZE, 80))[::-1]
+                self.index[block_hash] = (name, offset + FRAME_SIZE, block_size)
+                offset += FRAME_SIZE + block_size
+                added += 1
+            self.scanned[name] = offset
+        if self.index_path is not None:
+            self.save_index()
+        return added
+
+    def raw_block(self, block_hash: bytes) -> bytes:
+        """Returns the serialized block with block_hash (as returned by Block.hash_block), raises KeyError if not indexed"""
+        name, offset, size = self.index[block_hash]
+        return self.read(name, offset, size)
+
+    def header(self, block_hash: bytes) -> Block:
+        """Returns the header of the block with block_hash, reading only its first 80 bytes"""
+        name, offset, size = self.index[block_hash]
+        return Block.parse_block(BytesIO(self.read(name, offset, 80)))
+
+    def block(self, block_hash: bytes) -> Block:
+        """Returns the block with block_hash parsed with all its transactions"""
+        return Block.parse_full_block(BytesIO(self.raw_block(block_hash)), self.testnet)
+
+    def iter_transactions(self, block_hash: bytes):
+        """Yields the transactions of the block with block_hash one at a time, see Block.iter_transactions"""
+        stream = BytesIO(self.raw_block(block_hash))
+        yield from Block.parse_block(stream).iter_transactions(stream, self.testnet)
+
+    def blocks(self):
+        """Yields every indexed block, parsed, in file order"""
+        for block_hash, location in sorted(self.index.items(), key=lambda item: item[1]):
+            yield self.block(block_hash)
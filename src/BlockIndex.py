@@ -0,0 +1,124 @@
+from __future__ import annotations
+from src.Block import Block
+from src.utils import bits_to_target
+
+def block_work(bits: bytes) -> int:
+    """Returns the expected number of hashes to find a block at bits, 2**256 / (target + 1)"""
+    return (1 << 256) // (bits_to_target(bits) + 1)
+
+def skip_height(height: int) -> int:
+    """Returns the height the skip pointer of a block at height points to. Heights are chosen like Bitcoin Core's
+    so that any ancestor is reached in O(log height) jumps"""
+    if height < 2:
+        return 0
+    # clear the lowest set bit once for even heights, twice (of height - 1) for odd ones
+    if height & 1:
+        n = height - 1
+        n &= n - 1
+        return (n & (n - 1)) + 1
+    return height & (height - 1)
+
+
+class BlockIndexEntry:
+    """A header in the BlockIndex with its height, cumulative chainwork and links back towards genesis"""
+    def __init__(self, header: Block, block_hash: bytes, parent: BlockIndexEntry = None):
+        self.header = header
+        self.hash = block_hash
+        self.parent = parent
+        if parent is None:
+            self.height = 0
+            self.chainwork = block_work(header.bits)
+            self.skip = None
+        else:
+            self.height = parent.height + 1
+            self.chainwork = parent.chainwork + block_work(header.bits)
+            self.skip = parent.ancestor(skip_height(self.height))
+
+    def __repr__(self) -> str:
+        """Returns string representation of BlockIndexEntry"""
+        return f"BlockIndexEntry({self.hash.hex()}, height {self.height}, chainwork {self.chainwork:#x})"
+
+    def ancestor(self, height: int) -> BlockIndexEntry:
+        """Returns the ancestor at height (self at its own height), None outside 0 to self.height. Follows skip
+        pointers unless they overshoot, the same walk as Bitcoin Core's CBlockIndex::GetAncestor"""
+        if height < 0 or height > self.height:
+            return None
+        walk = self
+        walk_height = self.height
+        while walk_height > height:
+            walk_skip = skip_height(walk_height)
+            previous_skip = skip_height(walk_height - 1)
+            if walk.skip is not None and (walk_skip == height or (walk_skip > height and not (
+                    previous_skip < walk_skip - 2 and previous_skip >= height))):
+                walk = walk.skip
+                walk_height = walk_skip
+            else:
+                walk = walk.parent
+                walk_height -= 1
+        return walk
+
+
+class BlockIndex:
+    """Every known header, stale branches included, keyed by hash. Tracks the tip with the most cumulative work,
+    the first one seen winning ties"""
+    def __init__(self, genesis: Block):
+        genesis_hash = genesis.hash_block()
+        self.entries = {genesis_hash: BlockIndexEntry(genesis, genesis_hash)}
+        self.genesis = self.entries[genesis_hash]
+        self.tip = self.genesis
+
+    def __repr__(self) -> str:
+        """Returns string representation of BlockIndex"""
+        return f"BlockIndex({len(self.entries)} headers, tip {self.tip.hash.hex()} at height {self.tip.height})"
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, block_hash: bytes) -> bool:
+        return block_hash in self.entries
+
+    def __getitem__(self, block_hash: bytes) -> BlockIndexEntry:
+        return self.entries[block_hash]
+
+    def add(self, header: Block) -> BlockIndexEntry:
+        """Adds a header whose parent is known, moving the tip to it when it has more chainwork. Returns its entry,
+        raises ValueError for headers with an unknown parent"""
+        block_hash = header.hash_block()
+        entry = self.entries.get(block_hash)
+        if entry is not None:
+            return entry
+        parent = self.entries.get(header.prev_block)
+        if parent is None:
+            raise ValueError(f'parent {header.prev_block.hex()} of {block_hash.hex()} is not in the index')
+        entry = self.entries[block_hash] = BlockIndexEntry(header, block_hash, parent)
+        if entry.chainwork > self.tip.chainwork:
+            self.tip = entry
+        return entry
+
+    def fork_point(self, a: BlockIndexEntry, b: BlockIndexEntry) -> BlockIndexEntry:
+        """Returns the last common ancestor of a and b, in O(log height) jumps to the same height then
+        O(fork depth) steps back together"""
+        if a.height > b.height:
+            a = a.ancestor(b.height)
+        elif b.height > a.height:
+            b = b.ancestor(a.height)
+        while a is not b:
+            a = a.parent
+            b = b.parent
+        return a
+
+    def reorg(self, old_tip: BlockIndexEntry, new_tip: BlockIndexEntry) -> tuple:
+        """Returns (fork point, entries to disconnect from old_tip down, entries to connect up to new_tip)"""
+        fork = self.fork_point(old_tip, new_tip)
+        disconnect = []
+        entry = old_tip
+        while entry is not fork:
+            disconnect.append(entry)
+            entry = entry.parent
+        connect = []
+        entry = new_tip
+        while entry is not fork:
+            connect.append(entry)
+            entry = entry.parent
+        connect.reverse()
+        return fork, disconnect, connect
@@ -0,0 +1,126 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.HeaderStore import HEADER_SIZE, HeaderStore
+from src.Network import HeadersMessage
+from src.utils import bits_to_target, calculate_new_bits
+
+import hashlib
+
+# blocks between difficulty adjustments
+RETARGET_INTERVAL = 2016
+# timestamps the median time past is taken over
+MEDIAN_TIME_SPAN = 11
+# bits of the easiest target allowed on mainnet (powLimit), the difficulty of the genesis block
+MAINNET_POW_LIMIT_BITS = bytes.fromhex('ffff001d')
+
+def hash_headers(buffer) -> list:
+    """Returns the double sha256 of every 80 byte header in buffer, in internal byte order"""
+    sha256 = hashlib.sha256
+    return [sha256(sha256(buffer[start:start + HEADER_SIZE]).digest()).digest()
+            for start in range(0, len(buffer), HEADER_SIZE)]
+
+
+def hash_headers_parallel(buffer: bytes, workers: int) -> list:
+    """hash_headers with the buffer split into one chunk of whole headers per worker process"""
+    count = len(buffer) // HEADER_SIZE
+    chunk = -(-count // workers) * HEADER_SIZE
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        hashes = []
+        for chunk_hashes in executor.map(hash_headers, [buffer[start:start + chunk] for start in range(0, len(buffer), chunk)]):
+            hashes.extend(chunk_hashes)
+    return hashes
+
+
+class HeaderChainValidator:
+    """Validates batches of headers extending a known tip: linkage to the previous header, proof of work,
+    the bits expected at each height (retargeting every RETARGET_INTERVAL blocks) and a timestamp above the median
+    of the previous MEDIAN_TIME_SPAN. Valid headers advance the tip, so consecutive batches continue the chain.
+    Retargets never go easier than the target of pow_limit_bits"""
+    def __init__(self, height: int, tip_hash: bytes, bits: bytes, timestamps, period_start_time: int,
+                 pow_limit_bits: bytes = MAINNET_POW_LIMIT_BITS):
+        self.height = height
+        # hash of the tip in the byte order of Block.hash_block
+        self.tip_hash = tip_hash
+        self.bits = bits
+        self.target = bits_to_target(bits)
+        self.timestamps = deque(timestamps, maxlen=MEDIAN_TIME_SPAN)
+        # timestamp of the first block of the current retarget period
+        self.period_start_time = period_start_time
+        self.pow_limit_bits = pow_limit_bits
+        self.pow_limit = bits_to_target(pow_limit_bits)
+        # why the last validate call stopped, None when every header was valid
+        self.reason = None
+
+    def __repr__(self) -> str:
+        """Returns string representation of HeaderChainValidator"""
+        return f"HeaderChainValidator(height {self.height}, tip {self.tip_hash.hex()})"
+
+    @classmethod
+    def from_store(cls, store: HeaderStore, pow_limit_bits: bytes = MAINNET_POW_LIMIT_BITS) -> HeaderChainValidator:
+        """Returns a validator extending the tip of a non empty HeaderStore"""
+        height = len(store) - 1
+        timestamps = [store[h].timestamp for h in range(max(0, height - MEDIAN_TIME_SPAN + 1), height + 1)]
+        period_start_time = store[height - height % RETARGET_INTERVAL].timestamp
+        return cls(height, store.hash_at(height), store[height].bits, timestamps, period_start_time, pow_limit_bits)
+
+    def median_time_past(self) -> int:
+        """Returns the median of the last MEDIAN_TIME_SPAN timestamps"""
+        times = sorted(self.timestamps)
+        return times[len(times) // 2]
+
+    def expected_bits(self, height: int) -> bytes:
+        """Returns the bits the header at height must have, following the tip"""
+        if height % RETARGET_INTERVAL != 0:
+            return self.bits
+        bits = calculate_new_bits(self.bits, self.timestamps[-1] - self.period_start_time)
+        if bits_to_target(bits) > self.pow_limit:
+            return self.pow_limit_bits
+        return bits
+
+    def validate(self, headers, workers: int = None) -> int:
+        """Validates a HeadersMessage, Blocks or one buffer of serialized headers in order, hashing them all up
+        front (in workers processes when workers is above 1). Returns the index of the first invalid header, with
+        the reason in self.reason, or None when all are valid. The tip advances past every header before the first invalid one"""
+        if isinstance(headers, HeadersMessage):
+            headers = headers.blocks
+        if isinstance(headers, (bytes, bytearray, memoryview)):
+            buffer = bytes(headers)
+            if len(buffer) % HEADER_SIZE != 0:
+                raise ValueError(f'buffer is not a whole number of {HEADER_SIZE} byte headers')
+        else:
+            buffer = b''.join(header.serialize_block_header() for header in headers)
+        if workers is not None and workers > 1:
+            hashes = hash_headers_parallel(buffer, workers)
+        else:
+            hashes = hash_headers(buffer)
+        self.reason = None
+        previous = self.tip_hash[::-1]
+        for index, block_hash in enumerate(hashes):
+            start = index * HEADER_SIZE
+            height = self.height + 1
+            if buffer[start + 4:start + 36] != previous:
+                self.reason = 'prev_block does not link to the previous header'
+                return index
+            bits = buffer[start + 72:start + 76]
+            timestamp = int.from_bytes(buffer[start + 68:start + 72], 'little')
+            expected_bits = self.expected_bits(height)
+            if bits != expected_bits:
+                self.reason = f'bits {bits.hex()} differ from the expected {expected_bits.hex()}'
+                return index
+            target = self.target if bits == self.bits else bits_to_target(bits)
+            if int.from_bytes(block_hash, 'little') >= target:
+                self.reason = 'hash above the target'
+                return index
+            if timestamp <= self.median_time_past():
+                self.reason = 'timestamp not above the median time past'
+                return index
+            if height % RETARGET_INTERVAL == 0:
+                self.period_start_time = timestamp
+            self.height = height
+            self.bits = bits
+            self.target = target
+            self.timestamps.append(timestamp)
+            self.tip_hash = block_hash[::-1]
+            previous = block_hash
+        return None
@@ -0,0 +1,283 @@
+from __future__ import annotations
+from array import array
+from io import BytesIO
+from src.Block import Block
+from src.utils import hash256
+
+import hashlib
+import mmap
+import os
+import sys
+
+HEADER_SIZE = 80
+# appended to the path of a HeaderStore for the file its hash index is saved in
+INDEX_SUFFIX = '.idx'
+
+class HeaderIndex:
+    """Open addressing hash table from block hash to height. Stores only the 8 byte prefix of each hash and the
+    height, so a lookup returns a candidate height that the caller confirms against the full hash"""
+    def __init__(self, capacity: int = 1024):
+        size = 1024
+        while size < capacity * 2:
+            size *= 2
+        self.mask = size - 1
+        self.keys = array('Q', bytes(8 * size))
+        # height + 1, 0 marks an empty slot
+        self.values = array('q', bytes(8 * size))
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @staticmethod
+    def key(block_hash: bytes) -> int:
+        """Returns the table key of a block hash given as returned by Block.hash_block. Its last 8 bytes are the
+        first bytes of the double sha256, the first are the leading zeros of the proof of work"""
+        return int.from_bytes(block_hash[24:], 'big') or 1
+
+    def insert(self, block_hash: bytes, height: int) -> None:
+        """Adds block_hash at height, doubling the table past half full"""
+        if (self.count + 1) * 2 > len(self.keys):
+            self.grow()
+        self.insert_key(self.key(block_hash), height)
+        self.count += 1
+
+    def insert_key(self, key: int, height: int) -> None:
+        keys = self.keys
+        values = self.values
+        slot = key & self.mask
+        while values[slot] != 0:
+            slot = (slot + 1) & self.mask
+        keys[slot] = key
+        values[slot] = height + 1
+
+    def grow(self) -> None:
+        """Rebuilds the table at twice the size from the stored keys"""
+        keys = self.keys
+        values = self.values
+        self.mask = len(keys) * 2 - 1
+        self.keys = array('Q', bytes(8 * len(keys) * 2))
+        self.values = array('q', bytes(8 * len(keys) * 2))
+        for key, value in zip(keys, values):
+            if value != 0:
+                self.insert_key(key, value - 1)
+
+    def reserve(self, count: int) -> None:
+        """Grows the table until count entries keep it at most half full"""
+        while count * 2 > len(self.keys):
+            self.grow()
+
+    def save(self, path: str, last_hash: bytes) -> None:
+        """Writes the table to path, replacing it at once so a crash leaves the previous file. last_hash is the hash
+        of the last header indexed, which load checks against the store"""
+        header = array('q', [self.count, len(self.keys)])
+        keys, values = self.keys, self.values
+        if sys.byteorder == 'big':
+            header, keys, values = array('q', header), array('Q', keys), array('q', values)
+            for table in (header, keys, values):
+                table.byteswap()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(header.tobytes() + last_hash)
+            keys.tofile(f)
+            values.tofile(f)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> tuple:
+        """Returns (HeaderIndex, hash of the last header indexed) saved at path, None when it is missing or damaged"""
+        try:
+            with open(path, 'rb') as f:
+                header = array('q')
+                header.frombytes(f.read(16))
+                if sys.byteorder == 'big':
+                    header.byteswap()
+                count, size = header
+                last_hash = f.read(32)
+                index = cls()
+                index.keys = array('Q')
+                index.keys.fromfile(f, size)
+                index.values = array('q')
+                index.values.fromfile(f, size)
+        except (OSError, EOFError, ValueError):
+            return None
+        if size & (size - 1) != 0 or count * 2 > size:
+            return None
+        if sys.byteorder == 'big':
+            index.keys.byteswap()
+            index.values.byteswap()
+        index.mask = size - 1
+        index.count = count
+        return index, last_hash
+
+    def candidates(self, block_hash: bytes):
+        """Yields the heights stored under the prefix of block_hash"""
+        key = self.key(block_hash)
+        keys = self.keys
+        values = self.values
+        slot = key & self.mask
+        while values[slot] != 0:
+            if keys[slot] == key:
+                yield values[slot] - 1
+            slot = (slot + 1) & self.mask
+
+
+class HeaderStore:
+    """Append only file of raw 80 byte headers, memory mapped for access by height. Blocks are parsed only when
+    asked for. The hash to height index is loaded or built on the first lookup by hash, kept up to date by append
+    and saved next to the file (at path + INDEX_SUFFIX) on close, so reopening only hashes the headers appended
+    since it was saved"""
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'a+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size % HEADER_SIZE != 0:
+            # drop a header torn by an interrupted append
+            size -= size % HEADER_SIZE
+            self.file.truncate(size)
+        self.count = size // HEADER_SIZE
+        self.map = None
+        self.mapped = 0
+        self.index = None
+        self.index_path = path + INDEX_SUFFIX
+        # headers in the saved index file
+        self.index_saved = None
+        self.tip_hash = None
+
+    def __repr__(self) -> str:
+        """Returns string representation of HeaderStore"""
+        return f"HeaderStore({self.path}, {self.count} headers)"
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> HeaderStore:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Saves the index if it changed, unmaps and closes the file"""
+        if self.index is not None and self.index.count != self.index_saved:
+            self.save_index()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def remap(self) -> None:
+        """Maps the whole file again after appends grew it"""
+        if self.map is not None:
+            self.map.close()
+        self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), self.count * HEADER_SIZE, access=mmap.ACCESS_READ)
+        self.mapped = self.count
+
+    def raw_header(self, height: int) -> bytes:
+        """Returns the 80 byte serialized header at height, negative heights count back from the tip"""
+        if height < 0:
+            height += self.count
+        if not 0 <= height < self.count:
+            raise IndexError(f'no header at height {height}')
+        if height >= self.mapped:
+            self.remap()
+        start = height * HEADER_SIZE
+        return self.map[start:start + HEADER_SIZE]
+
+    def __getitem__(self, height: int) -> Block:
+        """Returns the Block header at height, parsed from the mapped file"""
+        return Block.parse_block(BytesIO(self.raw_header(height)))
+
+    def hash_at(self, height: int) -> bytes:
+        """Returns the hash of the header at height, in the byte order of Block.hash_block"""
+        return hash256(self.raw_header(height))[::-1]
+
+    def tip(self) -> Block:
+        """Returns the last header, None for an empty store"""
+        if self.count == 0:
+            return None
+        return self[-1]
+
+    def append(self, header) -> int:
+        """Appends a Block or a serialized header extending the tip. Returns its height, raises ValueError
+        when it does not point to the current tip"""
+        return self.extend([header])
+
+    def extend(self, headers) -> int:
+        """Appends Blocks or serialized headers in one write, each extending the previous one. Returns the height
+        of the last header. Nothing is written when one of them does not link"""
+        tip_hash = self.tip_hash
+        if tip_hash is None and self.count > 0:
+            tip_hash = self.hash_at(self.count - 1)
+        raws = []
+        hashes = []
+        for header in headers:
+            raw = header.serialize_block_header() if isinstance(header, Block) else bytes(header)
+            if len(raw) != HEADER_SIZE:
+                raise ValueError(f'header is {len(raw)} bytes, not {HEADER_SIZE}')
+            if tip_hash is not None and raw[4:36][::-1] != tip_hash:
+                raise ValueError(f'header at height {self.count + len(raws)} does not extend {tip_hash.hex()}')
+            tip_hash = hash256(raw)[::-1]
+            raws.append(raw)
+            hashes.append(tip_hash)
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(b''.join(raws))
+        self.file.flush()
+        if self.index is not None:
+            for height, block_hash in enumerate(hashes, self.count):
+                self.index.insert(block_hash, height)
+        self.count += len(raws)
+        self.tip_hash = tip_hash
+        return self.count - 1
+
+    def save_index(self) -> None:
+        """Writes the hash index to index_path"""
+        last_hash = self.hash_at(self.index.count - 1) if self.index.count > 0 else bytes(32)
+        self.index.save(self.index_path, last_hash)
+        self.index_saved = self.index.count
+
+    def load_index(self) -> HeaderIndex:
+        """Returns the index saved at index_path if it covers a prefix of the stored headers, None otherwise"""
+        loaded = HeaderIndex.load(self.index_path)
+        if loaded is None:
+            return None
+        index, last_hash = loaded
+        if index.count > self.count:
+            return None
+        if index.count > 0 and self.hash_at(index.count - 1) != last_hash:
+            return None
+        self.index_saved = index.count
+        return index
+
+    def build_index(self) -> None:
+        """Loads the saved hash to height index, or starts an empty one, and hashes the stored headers it is missing"""
+        index = self.index
+        if index is None:
+            index = self.load_index()
+        if index is None:
+            index = HeaderIndex(self.count)
+        index.reserve(self.count)
+        if self.count > self.mapped:
+            self.remap()
+        sha256 = hashlib.sha256
+        raw = self.map
+        insert_key = index.insert_key
+        for height in range(index.count, self.count):
+            start = height * HEADER_SIZE
+            # the same key as HeaderIndex.key, without reversing the hash first
+            key = int.from_bytes(sha256(sha256(raw[start:start + HEADER_SIZE]).digest()).digest()[:8], 'little') or 1
+            insert_key(key, height)
+        index.count = self.count
+        self.index = index
+
+    def height_of(self, block_hash: bytes) -> int:
+        """Returns the height of the header with block_hash (as returned by Block.hash_block), None if not stored"""
+        if self.index is None:
+            self.build_index()
+        for height in self.index.candidates(block_hash):
+            if self.hash_at(height) == block_hash:
+                return height
+        return None
+
+    def __contains__(self, block_hash: bytes) -> bool:
+        return self.height_of(block_hash) is not None
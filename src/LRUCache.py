@@ -0,0 +1,88 @@
+from __future__ import annotations
+from collections import OrderedDict
+
+import threading
+
+class LRUCache:
+    """Bounded map evicting the least recently used entries past max_entries, with hit, miss and eviction counters.
+    Subclasses derive the keys and account for the size of their entries. Every access holds a reentrant lock,
+    so a cache can be shared by threads and subclasses can extend an update under the same lock"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self) -> str:
+        """Returns string representation of the cache"""
+        return f"{type(self).__name__}({len(self.entries)}/{self.max_entries} entries, hit rate {self.hit_rate():.2%})"
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """Returns the value of key, or default when it is missing, updating the hit counters"""
+        with self.lock:
+            if key in self.entries:
+                # least recently used eviction, move the entry to the fresh end
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def touch(self, key) -> bool:
+        """Returns whether key is cached, updating the hit counters"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def put(self, key, value=None) -> None:
+        """Records the value of key, evicting the least recently used entries past max_entries"""
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self._evicted(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes all entries and resets the counters"""
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def hit_rate(self) -> float:
+        """Returns the fraction of lookups that were answered from the cache"""
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def stats(self) -> dict:
+        """Returns the counters of the cache as a dictionary"""
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate(),
+        }
+
+    def _evicted(self, key) -> None:
+        pass
@@ -1,6 +1,9 @@
 from __future__ import annotations
+from src.MerkleEngine import hash_pairs
 from src.utils import (
-    bytes_to_bit_field,
+    bit_field_to_bytes,
+    encode_varint,
+    int_to_little_endian,
     little_endian_to_int,
     merkle_parent,
     decode_varint,
@@ -8,6 +11,9 @@ from src.utils import (
 
 import math
 
+# is_valid uses a SparseMerkleTree when the block has more than this many transactions per proof hash
+SPARSE_TREE_RATIO = 16
+
 class MerkleTree:
     def __init__(self, total):
         self.total = total
@@ -19,6 +25,8 @@ class MerkleTree:
             self.nodes.append(level_hashes)
         self.current_depth = 0
         self.current_index = 0
+        # (position, hash) of the leaves flagged as matches by populate_tree
+        self.matches = []
 
     def __repr__(self) -> str:
         """Returns a string representation of MerkleTree"""
@@ -71,38 +79,108 @@ class MerkleTree:
         return len(self.nodes[self.current_depth + 1]) > self.current_index * 2 + 1
 
     def populate_tree(self, flag_bits, hashes) -> None:
-        while self.root() is None:
-            if self.is_leaf():
-                flag_bits.pop(0)
-                self.set_current_node(hashes.pop(0))
+        """Fills the tree from the depth first flag bits and hashes of a MerkleBlock. flag_bits is either a list of
+        bits or the raw flags bytes, read least significant bit first. Both are read through cursors and left as is.
+        Leaves with their flag bit set are recorded in matches"""
+        if isinstance(flag_bits, (bytes, bytearray, memoryview)):
+            flags = flag_bits
+            bit_count = len(flags) * 8
+            read_bit = lambda index: (flags[index >> 3] >> (index & 7)) & 1
+        else:
+            bit_count = len(flag_bits)
+            read_bit = flag_bits.__getitem__
+        bit_index = 0
+        hash_index = 0
+        nodes = self.nodes
+        max_depth = self.max_depth
+        matches = self.matches
+        root_level = nodes[0]
+        while root_level[0] is None:
+            depth = self.current_depth
+            index = self.current_index
+            if depth == max_depth:
+                if bit_index >= bit_count or hash_index >= len(hashes):
+                    raise RuntimeError('ran out of flag bits or hashes')
+                if read_bit(bit_index) == 1:
+                    matches.append((index, hashes[hash_index]))
+                bit_index += 1
+                nodes[depth][index] = hashes[hash_index]
+                hash_index += 1
                 self.up()
             else:
-                left_hash = self.get_left_node()
+                children = nodes[depth + 1]
+                left_hash = children[index * 2]
                 if left_hash is None:
-                    if flag_bits.pop(0) == 0:
-                        self.set_current_node(hashes.pop(0))
+                    if bit_index >= bit_count:
+                        raise RuntimeError('ran out of flag bits')
+                    bit = read_bit(bit_index)
+                    bit_index += 1
+                    if bit == 0:
+                        if hash_index >= len(hashes):
+                            raise RuntimeError('ran out of hashes')
+                        nodes[depth][index] = hashes[hash_index]
+                        hash_index += 1
                         self.up()
                     else:
                         self.left()
-                elif self.right_exists():
-                    right_hash = self.get_right_node()
+                elif len(children) > index * 2 + 1:
+                    right_hash = children[index * 2 + 1]
                     if right_hash is None:
                         self.right()
                     else:
-                        self.set_current_node(merkle_parent(left_hash, 
-                        right_hash))
+                        nodes[depth][index] = merkle_parent(left_hash, right_hash)
                         self.up()
                 else:
-                    self.set_current_node(merkle_parent(left_hash, left_hash))
+                    nodes[depth][index] = merkle_parent(left_hash, left_hash)
                     self.up()
-        if len(hashes) != 0:
-            raise RuntimeError('hashes not all consumed {}'.format(len(hashes)))
-        for flag_bit in flag_bits:
-            if flag_bit != 0:
+        if hash_index != len(hashes):
+            raise RuntimeError('hashes not all consumed {}'.format(len(hashes) - hash_index))
+        for index in range(bit_index, bit_count):
+            if read_bit(index) != 0:
                 raise RuntimeError('flag bits not all consumed')
 
 
+class SparseLevel:
+    """One level of a SparseMerkleTree: a list of width slots where only the slots set are stored"""
+    __slots__ = ('width', 'items')
+
+    def __init__(self, width: int):
+        self.width = width
+        self.items = {}
+
+    def __len__(self) -> int:
+        return self.width
+
+    def __getitem__(self, index: int):
+        return self.items.get(index)
+
+    def __setitem__(self, index: int, value) -> None:
+        self.items[index] = value
+
+    def __iter__(self):
+        return (self.items.get(index) for index in range(self.width))
+
+
+class SparseMerkleTree(MerkleTree):
+    """MerkleTree storing only the nodes visited, so populating it from a partial merkle tree costs memory
+    proportional to the proof rather than to the number of transactions in the block"""
+    def __init__(self, total):
+        self.total = total
+        self.max_depth = math.ceil(math.log(self.total, 2))
+        self.nodes = [SparseLevel(-(-total >> (self.max_depth - depth))) for depth in range(self.max_depth + 1)]
+        self.current_depth = 0
+        self.current_index = 0
+        # (position, hash) of the leaves flagged as matches by populate_tree
+        self.matches = []
+
+    def node_count(self) -> int:
+        """Returns the number of nodes stored"""
+        return sum(len(level.items) for level in self.nodes)
+
+
 class MerkleBlock:
+    __slots__ = ('version', 'prev_block', 'merkle_root', 'timestamp', 'bits', 'nonce', 'total', 'hashes', 'flags')
+
     def __init__(self, version, prev_block, merkle_root, timestamp, bits, nonce, total, hashes, flags):
         self.version = version
         self.prev_block = prev_block
@@ -151,15 +229,117 @@ class MerkleBlock:
         # initialize class
         return MerkleBlock(version, prev_block, merkle_root, timestamp, bits, nonce, total, hashes, flags)
 
+    def serialize_merkle_block(self) -> bytes:
+        """Returns the merkle block in the format read by parse_merkle_block"""
+        result = int_to_little_endian(self.version, 4)
+        result += self.prev_block[::-1]
+        result += self.merkle_root[::-1]
+        result += int_to_little_endian(self.timestamp, 4)
+        result += self.bits
+        result += self.nonce
+        result += int_to_little_endian(self.total, 4)
+        result += encode_varint(len(self.hashes))
+        for h in self.hashes:
+            result += h[::-1]
+        result += encode_varint(len(self.flags))
+        result += self.flags
+        return result
+
     def is_valid(self) -> bool:
         """Verifies whether the merkle tree information validates to the merkle root"""
-        # convert the flags field to a bit field
-        flag_bits = bytes_to_bit_field(self.flags)
+        return self.verify_matches() is not None
+
+    def verify_matches(self) -> list:
+        """Validates the merkle tree information against the merkle root in one traversal. Returns the
+        (txid, position in block) of every matched transaction, in block order, or None when the root differs"""
         # reverse self.hashes for the merkle root calculation
         hashes = [h[::-1] for h in self.hashes]
-        # initialize the merkle tree
-        merkle_tree = MerkleTree(self.total)
-        # populate the tree with flag bits and hashes
-        merkle_tree.populate_tree(flag_bits, hashes)
+        # initialize the merkle tree, sparse when the proof touches a small part of the block
+        if len(hashes) * SPARSE_TREE_RATIO < self.total:
+            merkle_tree = SparseMerkleTree(self.total)
+        else:
+            merkle_tree = MerkleTree(self.total)
+        # populate the tree reading the flag bits straight from the flags field
+        merkle_tree.populate_tree(self.flags, hashes)
         # check if the computed root reversed is the same as the merkle root
-        return merkle_tree.root()[::-1] == self.merkle_root
+        if merkle_tree.root()[::-1] != self.merkle_root:
+            return None
+        return [(h[::-1], position) for position, h in merkle_tree.matches]
+
+
+class MerkleProofBuilder:
+    """Builds MerkleBlock partial merkle trees for a block. Every level of the tree is hashed once on construction,
+    each proof then only walks the paths from the matched transactions to the root"""
+    def __init__(self, block):
+        if block.tx_hashes is None or len(block.tx_hashes) == 0:
+            raise ValueError('block has no txids to build proofs from')
+        self.block = block
+        self.total = len(block.tx_hashes)
+        # levels[0] holds the txids in internal byte order, levels[-1] the root
+        level = [h[::-1] for h in block.tx_hashes]
+        self.levels = [level]
+        while len(level) > 1:
+            if len(level) % 2 == 1:
+                level = hash_pairs(level[0::2], level[1::2] + level[-1:])
+            else:
+                level = hash_pairs(level[0::2], level[1::2])
+            self.levels.append(level)
+        if level[0][::-1] != block.merkle_root:
+            raise ValueError('txids do not hash to the merkle root of the block')
+        # txid -> position of its first occurrence in the block
+        self.positions = {}
+        for position, h in enumerate(block.tx_hashes):
+            self.positions.setdefault(h, position)
+
+    def __repr__(self) -> str:
+        """Returns string representation of MerkleProofBuilder"""
+        return f"MerkleProofBuilder({self.total} txids, height {len(self.levels) - 1})"
+
+    def proof(self, txids) -> tuple:
+        """Returns (hashes, flag bits) of the partial merkle tree matching txids, hashes in the byte order of
+        MerkleBlock.hashes. Raises ValueError for txids that are not in the block"""
+        positions = []
+        for txid in txids:
+            position = self.positions.get(txid)
+            if position is None:
+                raise ValueError(f'txid {txid.hex()} is not in the block')
+            positions.append(position)
+        # (height, index) of every node above or at a matched transaction
+        matched_nodes = set()
+        for position in positions:
+            for height in range(len(self.levels)):
+                node = (height, position >> height)
+                if node in matched_nodes:
+                    break
+                matched_nodes.add(node)
+        hashes = []
+        flag_bits = []
+        # depth first, left before right, the order populate_tree consumes them in
+        stack = [(len(self.levels) - 1, 0)]
+        while stack:
+            node = stack.pop()
+            height, index = node
+            if node not in matched_nodes:
+                flag_bits.append(0)
+                hashes.append(self.levels[height][index][::-1])
+            elif height == 0:
+                flag_bits.append(1)
+                hashes.append(self.levels[0][index][::-1])
+            else:
+                flag_bits.append(1)
+                if index * 2 + 1 < len(self.levels[height - 1]):
+                    stack.append((height - 1, index * 2 + 1))
+                stack.append((height - 1, index * 2))
+        return hashes, flag_bits
+
+    def merkle_block(self, txids) -> MerkleBlock:
+        """Returns the MerkleBlock proving the inclusion of txids in the block"""
+        hashes, flag_bits = self.proof(txids)
+        flag_bits += [0] * (-len(flag_bits) % 8)
+        block = self.block
+        return MerkleBlock(block.version, block.prev_block, block.merkle_root, block.timestamp, block.bits,
+                           block.nonce, self.total, hashes, bit_field_to_bytes(flag_bits))
+
+    def merkle_blocks(self, txids) -> dict:
+        """Returns txid -> MerkleBlock proving the inclusion of that txid alone, for every txid, from the same tree"""
+        return {txid: self.merkle_block([txid]) for txid in txids}
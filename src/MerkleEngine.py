@@ -0,0 +1,34 @@
+from __future__ import annotations
+from operator import eq
+
+import hashlib
+
+def hash_pairs(left: list, right: list) -> list:
+    """Returns the double sha256 of every left[i] + right[i]"""
+    sha256 = hashlib.sha256
+    return [sha256(sha256(a + b).digest()).digest() for a, b in zip(left, right)]
+
+
+def compute_merkle_root(hashes) -> tuple:
+    """Returns (merkle root, mutated) of hashes in internal byte order, given as a list or as one contiguous
+    bytes-like buffer of 32 byte hashes. mutated reports two equal hashes paired at some level (CVE-2012-2459), which
+    lets a different list of transactions produce the same root. Raises ValueError when there are no hashes"""
+    if isinstance(hashes, (bytes, bytearray, memoryview)):
+        if len(hashes) % 32 != 0:
+            raise ValueError('hashes are not a whole number of 32 byte hashes')
+        buffer = bytes(hashes)
+        level = [buffer[i:i + 32] for i in range(0, len(buffer), 32)]
+    else:
+        level = list(hashes)
+    if len(level) == 0:
+        raise ValueError('no hashes to take the merkle root of')
+    mutated = False
+    while len(level) > 1:
+        count = len(level)
+        # the duplicated last hash of an odd level is not a mutation, so compare before appending it
+        if not mutated and any(map(eq, level[0:count - 1:2], level[1:count:2])):
+            mutated = True
+        if count % 2 == 1:
+            level.append(level[-1])
+        level = hash_pairs(level[0::2], level[1::2])
+    return level[0], mutated
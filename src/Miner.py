@@ -0,0 +1,90 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from src.Block import Block
+
+import hashlib
+import time
+
+# nonces in the 4 byte nonce field
+NONCE_SPACE = 1 << 32
+# nonces handed to a worker at a time
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+def scan_nonces(header: bytes, target: int, start: int, stop: int) -> tuple:
+    """Tries the nonces start to stop - 1 on an 80 byte header. The sha256 state after the first 64 bytes is
+    computed once and copied per nonce, so each attempt only hashes the last 16 bytes and the 32 byte digest.
+    Returns (nonce or None, nonces tried)"""
+    midstate = hashlib.sha256(header[:64])
+    tail = header[64:76]
+    sha256 = hashlib.sha256
+    for nonce in range(start, stop):
+        first = midstate.copy()
+        first.update(tail + nonce.to_bytes(4, 'little'))
+        if int.from_bytes(sha256(first.digest()).digest(), 'little') < target:
+            return nonce, nonce - start + 1
+    return None, stop - start
+
+
+class MiningResult:
+    """The mined block with the number of hashes tried and the time it took"""
+    def __init__(self, block: Block, hashes: int, seconds: float, rolls: int):
+        self.block = block
+        self.hashes = hashes
+        self.seconds = seconds
+        # times the timestamp or extranonce was rolled after exhausting the nonces
+        self.rolls = rolls
+
+    def __repr__(self) -> str:
+        """Returns string representation of MiningResult"""
+        return f"MiningResult({self.hashes} hashes in {self.seconds:.2f}s, {self.hashes_per_second():,.0f} H/s)"
+
+    def hashes_per_second(self) -> float:
+        if self.seconds == 0:
+            return 0.0
+        return self.hashes / self.seconds
+
+
+def mine(block: Block, workers: int = None, roll_merkle_root=None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> MiningResult:
+    """Searches for a nonce giving block enough proof of work, then sets it on block. The nonce space is split in
+    chunks scanned by workers processes when workers is above 1. Once it is exhausted the timestamp is incremented,
+    or, given roll_merkle_root, the merkle root is replaced by roll_merkle_root(extranonce) for extranonce 1, 2, ...
+    which should rebuild it from a coinbase carrying that extranonce"""
+    target = block.target()
+    hashes = 0
+    rolls = 0
+    start_time = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers is not None and workers > 1 else None
+    try:
+        while True:
+            header = block.serialize_block_header()
+            nonce = None
+            starts = range(0, NONCE_SPACE, chunk_size)
+            if executor is None:
+                for start in starts:
+                    nonce, tried = scan_nonces(header, target, start, min(start + chunk_size, NONCE_SPACE))
+                    hashes += tried
+                    if nonce is not None:
+                        break
+            else:
+                # a wave of one chunk per worker at a time, the lowest nonce found in a wave wins
+                for wave in range(0, len(starts), workers):
+                    futures = [executor.submit(scan_nonces, header, target, start, min(start + chunk_size, NONCE_SPACE))
+                               for start in starts[wave:wave + workers]]
+                    for future in futures:
+                        found, tried = future.result()
+                        hashes += tried
+                        if nonce is None:
+                            nonce = found
+                    if nonce is not None:
+                        break
+            if nonce is not None:
+                block.nonce = nonce.to_bytes(4, 'little')
+                return MiningResult(block, hashes, time.perf_counter() - start_time, rolls)
+            rolls += 1
+            if roll_merkle_root is None:
+                block.timestamp += 1
+            else:
+                block.merkle_root = roll_merkle_root(rolls)
+    finally:
+        if executor is not None:
+            executor.shutdown()
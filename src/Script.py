@@ -1,7 +1,11 @@
 from __future__ import annotations
 from io import BytesIO
+from time import perf_counter
 from src.elliptic_curve_cryptography.Secp256k1Curve import Secp256k1Point
 from src.elliptic_curve_cryptography.DigitalSignature import Signature
+from src.SignatureCache import SIGNATURE_CACHE
+from src.ScriptProfiler import SCRIPT_PROFILER
+from src.ScriptTemplateCache import SCRIPT_TEMPLATE_CACHE
 from src.utils import (
     encode_varint,
     int_to_little_endian,
@@ -31,17 +35,539 @@ def p2wsh_script(h256):
     """Takes a hash160 and returns the p2wsh ScriptPubKey"""
     return Script([0x00, h256])
 
+# calling conventions of the opcode handlers, carried by each OP_CODE_DISPATCH entry
+CALL_PUSH = 0       # data element, pushed onto the stack
+CALL_STACK = 1      # operation(stack)
+CALL_ALTSTACK = 2   # operation(stack, altstack)
+CALL_SIG_HASH = 3   # operation(stack, z)
+CALL_LOCKTIME = 4   # operation(stack, locktime, sequence)
+CALL_SEQUENCE = 5   # operation(stack, version, sequence)
+CALL_IF = 6         # OP_IF/OP_NOTIF, jumps past the branch when it is not taken
+CALL_ELSE = 7       # OP_ELSE, reached at the end of an executed branch, jumps past the next one
+CALL_ENDIF = 8      # OP_ENDIF, a no-op since the jumps are resolved ahead of time
+CALL_P2SH = 9       # push of a RedeemScript followed by OP_HASH160 <20 byte hash> OP_EQUAL
+CALL_INVALID = 10   # opcode without an implementation, fails when executed
+CALL_MULTISIG = 11  # OP_CHECKMULTISIG(VERIFY), operand is (operation, non-push opcodes of the script)
+
+# consensus resource limits of a single script execution
+MAX_SCRIPT_ELEMENT_SIZE = 520
+MAX_OPS_PER_SCRIPT = 201
+MAX_STACK_SIZE = 1000
+MAX_WITNESS_SCRIPT_SIZE = 10000
+# policy limit on the signature operations of a transaction, see Transaction.sig_op_count
+MAX_STANDARD_TX_SIGOPS = 4000
+
+def decode_script(raw, partial=False) -> list:
+    """Decodes a raw script (bytes or memoryview, without the length prefix) into a list of cmds.
+    Raises SyntaxError on a truncated push, unless partial is set to get the cmds before it"""
+    cmds = []
+    count = 0
+    length = len(raw)
+    while count < length:
+        current_byte = raw[count]
+        count += 1
+        if current_byte >= 1 and current_byte <= 75:
+            # push the next current_byte bytes
+            data_length = current_byte
+        elif current_byte == 76 and count + 1 <= length:
+            # op_pushdata1
+            data_length = raw[count]
+            count += 1
+        elif current_byte == 77 and count + 2 <= length:
+            # op_pushdata2
+            data_length = little_endian_to_int(raw[count:count + 2])
+            count += 2
+        elif current_byte == 76 or current_byte == 77:
+            data_length = length
+        else:
+            # an opcode
+            cmds.append(current_byte)
+            continue
+        if count + data_length > length:
+            if partial:
+                return cmds
+            raise SyntaxError("parsing script failed")
+        cmds.append(bytes(raw[count:count + data_length]))
+        count += data_length
+    return cmds
+
+
+def compile_script(cmds, p2sh=False) -> tuple:
+    """Pre-decodes cmds into an immutable array of (calling convention, operand, cmd) instructions.
+    The operand is the data of a push, the handler of an opcode or the jump target of OP_IF/OP_NOTIF/OP_ELSE.
+    Raises SyntaxError for oversized pushes and for more than MAX_OPS_PER_SCRIPT non-push opcodes, which
+    like in Bitcoin Core count whether or not their branch executes. Handlers are wrapped by SCRIPT_PROFILER while it is enabled.
+    With p2sh set, for a ScriptSig and p2sh ScriptPubKey evaluated together, a trailing push OP_HASH160 <20 byte hash>
+    OP_EQUAL runs the pushed RedeemScript once the hash matches"""
+    profiling = SCRIPT_PROFILER.enabled
+    instructions = []
+    # (index, cmd) of the OP_IF/OP_NOTIF/OP_ELSE instructions waiting for their jump target
+    open_branches = []
+    op_count = 0
+    for cmd in cmds:
+        if type(cmd) != int:
+            if len(cmd) > MAX_SCRIPT_ELEMENT_SIZE:
+                raise SyntaxError(f"push of {len(cmd)} bytes exceeds {MAX_SCRIPT_ELEMENT_SIZE}")
+            instructions.append((CALL_PUSH, cmd, None))
+            continue
+        if cmd > 96:
+            op_count += 1
+        operation, convention = OP_CODE_DISPATCH.get(cmd, (None, CALL_INVALID))
+        if profiling and operation is not None:
+            operation = SCRIPT_PROFILER.wrap(OP_CODE_NAMES[cmd], operation)
+        if convention == CALL_IF:
+            open_branches.append((len(instructions), cmd))
+            instructions.append(None)
+        elif convention == CALL_ELSE or convention == CALL_ENDIF:
+            if len(open_branches) == 0:
+                raise SyntaxError(f"{OP_CODE_NAMES[cmd]} without OP_IF")
+            # whoever jumps from the open OP_IF/OP_ELSE lands right after this instruction
+            index, branch_cmd = open_branches.pop()
+            branch_convention = CALL_IF if branch_cmd in (99, 100) else CALL_ELSE
+            instructions[index] = (branch_convention, len(instructions) + 1, branch_cmd)
+            if convention == CALL_ELSE:
+                open_branches.append((len(instructions), cmd))
+                instructions.append(None)
+            else:
+                instructions.append((CALL_ENDIF, None, cmd))
+        else:
+            instructions.append((convention, operation, cmd))
+    if len(open_branches) != 0:
+        raise SyntaxError("OP_IF without OP_ENDIF")
+    if op_count > MAX_OPS_PER_SCRIPT:
+        raise SyntaxError(f"{op_count} opcodes exceed {MAX_OPS_PER_SCRIPT}")
+    # the public keys of an executed OP_CHECKMULTISIG count towards the same limit
+    for index, (convention, operation, cmd) in enumerate(instructions):
+        if convention == CALL_MULTISIG:
+            instructions[index] = (CALL_MULTISIG, (operation, op_count), cmd)
+    # a push followed by exactly OP_HASH160 <20 byte hash> OP_EQUAL is a p2sh RedeemScript
+    if p2sh and len(instructions) >= 4 and instructions[-4][0] == CALL_PUSH \
+        and instructions[-3][2] == 0xa9 \
+        and instructions[-2][0] == CALL_PUSH and len(instructions[-2][1]) == 20 \
+        and instructions[-1][2] == 0x87:
+        instructions[-4] = (CALL_P2SH, instructions[-4][1], None)
+    return tuple(instructions)
+
+
+def decode_redeem_script(redeem_script) -> list:
+    """Decodes a p2sh RedeemScript, timed as P2SH_REDEEM_SCRIPT while SCRIPT_PROFILER is enabled"""
+    if not SCRIPT_PROFILER.enabled:
+        return decode_script(redeem_script)
+    start = perf_counter()
+    try:
+        return decode_script(redeem_script)
+    finally:
+        SCRIPT_PROFILER.record('P2SH_REDEEM_SCRIPT', perf_counter() - start)
+
+
+def execute_instructions(instructions, stack, altstack, z, locktime=None, sequence=None, version=None, batch=None) -> bool:
+    """Runs compiled instructions on the stacks with an instruction pointer, returns False on a failed operation.
+    With a SignatureBatch, signature checks whose failure fails the script are deferred into it.
+    Fails once the stack and altstack together hold more than MAX_STACK_SIZE elements"""
+    ip = 0
+    end = len(instructions)
+    # public keys of the OP_CHECKMULTISIGs executed so far
+    multisig_keys = 0
+    while ip < end:
+        convention, operand, cmd = instructions[ip]
+        ip += 1
+        if convention == CALL_PUSH:
+            stack.append(operand)
+            if len(stack) + len(altstack) > MAX_STACK_SIZE:
+                print("bad script: stack size limit")
+                return False
+        elif convention == CALL_STACK:
+            if not operand(stack):
+                print(f"bad op: {OP_CODE_NAMES[cmd]}")
+                return False
+            if len(stack) + len(altstack) > MAX_STACK_SIZE:
+                print("bad script: stack size limit")
+                return False
+        elif convention == CALL_SIG_HASH:
+            # only OP_CHECKSIGVERIFY and a final check decide the script outcome on their own
+            if batch is not None and (cmd == 173 or ip == end):
+                result = operand(stack, z, batch)
+            else:
+                result = operand(stack, z)
+            if not result:
+                print(f"bad op: {OP_CODE_NAMES[cmd]}")
+                return False
+        elif convention == CALL_MULTISIG:
+            operation, op_count = operand
+            if len(stack) > 0:
+                multisig_keys += max(decode_num(stack[-1]), 0)
+            if op_count + multisig_keys > MAX_OPS_PER_SCRIPT:
+                print(f"bad op: {OP_CODE_NAMES[cmd]} exceeds the opcode limit")
+                return False
+            if batch is not None and (cmd == 175 or ip == end):
+                result = operation(stack, z, batch)
+            else:
+                result = operation(stack, z)
+            if not result:
+                print(f"bad op: {OP_CODE_NAMES[cmd]}")
+                return False
+        elif convention == CALL_IF:
+            if len(stack) < 1:
+                print(f"bad op: {OP_CODE_NAMES[cmd]}")
+                return False
+            # OP_IF takes the branch on a true element, OP_NOTIF on a false one
+            if (decode_num(stack.pop()) == 0) == (cmd == 99):
+                ip = operand
+        elif convention == CALL_ELSE:
+            ip = operand
+        elif convention == CALL_ENDIF:
+            pass
+        elif convention == CALL_ALTSTACK:
+            if not operand(stack, altstack):
+                print(f"bad op: {OP_CODE_NAMES[cmd]}")
+                return False
+        elif convention == CALL_LOCKTIME:
+            if locktime is None or not operand(stack, locktime, sequence):
+                print(f"bad op: {OP_CODE_NAMES[cmd]}")
+                return False
+        elif convention == CALL_SEQUENCE:
+            if version is None or not operand(stack, version, sequence):
+                print(f"bad op: {OP_CODE_NAMES[cmd]}")
+                return False
+        elif convention == CALL_P2SH:
+            stack.append(operand)
+            if len(stack) + len(altstack) > MAX_STACK_SIZE:
+                print("bad script: stack size limit")
+                return False
+            h160 = instructions[ip + 1][1]
+            if not op_hash160(stack):
+                return False
+            stack.append(h160)
+            if not op_equal(stack):
+                return False
+            if not op_verify(stack):
+                print("bad p2sh hash160")
+                return False
+            # continue with the RedeemScript in place of the p2sh ScriptPubKey
+            try:
+                instructions = compile_script(decode_redeem_script(operand))
+            except SyntaxError as e:
+                print(f"bad redeem script: {e}")
+                return False
+            ip = 0
+            end = len(instructions)
+            multisig_keys = 0
+        else:
+            print(f"bad op: {OP_CODE_NAMES.get(cmd, f'OP_[{cmd}]')}")
+            return False
+    return True
+
+
+def script_template(cmds, p2sh=False) -> tuple:
+    """Splits cmds into (template, pushes): the cmds with every push replaced by None and the pushed data in order.
+    With p2sh set the template is None for scripts ending in a p2sh check, whose RedeemScript only the interpreter can run"""
+    template = []
+    pushes = []
+    for cmd in cmds:
+        if type(cmd) == int:
+            template.append(cmd)
+        else:
+            template.append(None)
+            pushes.append(cmd)
+    if p2sh and len(cmds) >= 4 and cmds[-1] == 0x87 and cmds[-3] == 0xa9 and type(cmds[-4]) != int \
+        and type(cmds[-2]) != int and len(cmds[-2]) == 20:
+        return None, pushes
+    return tuple(template), pushes
+
+
+def bad_compiled_op(cmd) -> bool:
+    """Reports a failed opcode of a compiled template the way execute_instructions does"""
+    print(f"bad op: {OP_CODE_NAMES.get(cmd, f'OP_[{cmd}]')}")
+    return False
+
+
+def bad_compiled_push(push) -> bool:
+    """Reports an oversized push of a compiled template the way Script.evaluate does"""
+    print(f"bad script: push of {len(push)} bytes exceeds {MAX_SCRIPT_ELEMENT_SIZE}")
+    return False
+
+
+# OP_IF nesting past which templates are left to the interpreter, Python limits nested blocks
+MAX_COMPILED_BRANCH_DEPTH = 16
+
+def compile_template(cmds):
+    """Generates a Python function running the template of cmds as straight-line code, OP_IF/OP_NOTIF/OP_ELSE
+    becoming nested if/else blocks. The function takes (stack, altstack, pushes, z, locktime, sequence, version, batch)
+    and returns like execute_instructions, or None when the stacks may outgrow MAX_STACK_SIZE so the interpreter
+    has to run instead. Returns None for templates it does not handle, which depends on the template alone: the pushes
+    are left out of the compilation and their sizes checked when the function runs"""
+    try:
+        instructions = compile_script([cmd if type(cmd) == int else b'' for cmd in cmds])
+    except SyntaxError:
+        return None
+    # every push adds one element and no opcode adds more than three (OP_3DUP)
+    growth = 0
+    for convention, operand, cmd in instructions:
+        growth += 1 if convention == CALL_PUSH else 3
+    if growth > MAX_STACK_SIZE:
+        return None
+    namespace = {
+        'decode_num': decode_num,
+        'bad_op': bad_compiled_op,
+        'bad_push': bad_compiled_push,
+    }
+    lines = [
+        "def compiled(stack, altstack, pushes, z, locktime, sequence, version, batch):",
+        f"    if len(stack) + len(altstack) > {MAX_STACK_SIZE - growth}:",
+        "        return None",
+        "    for push in pushes:",
+        f"        if len(push) > {MAX_SCRIPT_ELEMENT_SIZE}:",
+        "            return bad_push(push)",
+        "    multisig_keys = 0",
+    ]
+    indent = "    "
+    # whether each open OP_IF block already had its OP_ELSE
+    open_branches = []
+    push_index = 0
+    last = len(instructions) - 1
+    for index, (convention, operand, cmd) in enumerate(instructions):
+        if convention == CALL_PUSH:
+            lines.append(f"{indent}stack.append(pushes[{push_index}])")
+            push_index += 1
+            continue
+        name = f"op_{index}"
+        failed = f"return bad_op({cmd})"
+        if convention == CALL_STACK:
+            namespace[name] = operand
+            lines.append(f"{indent}if not {name}(stack): {failed}")
+        elif convention == CALL_ALTSTACK:
+            namespace[name] = operand
+            lines.append(f"{indent}if not {name}(stack, altstack): {failed}")
+        elif convention == CALL_SIG_HASH or convention == CALL_MULTISIG:
+            if convention == CALL_MULTISIG:
+                operand, op_count = operand
+                lines.append(f"{indent}if len(stack) > 0: multisig_keys += max(decode_num(stack[-1]), 0)")
+                lines.append(f"{indent}if {op_count} + multisig_keys > {MAX_OPS_PER_SCRIPT}: {failed}")
+            namespace[name] = operand
+            # only the *VERIFY variants and a final check decide the script outcome on their own
+            if cmd in (173, 175) or index == last:
+                lines.append(f"{indent}if not ({name}(stack, z) if batch is None else {name}(stack, z, batch)): {failed}")
+            else:
+                lines.append(f"{indent}if not {name}(stack, z): {failed}")
+        elif convention == CALL_LOCKTIME:
+            namespace[name] = operand
+            lines.append(f"{indent}if locktime is None or not {name}(stack, locktime, sequence): {failed}")
+        elif convention == CALL_SEQUENCE:
+            namespace[name] = operand
+            lines.append(f"{indent}if version is None or not {name}(stack, version, sequence): {failed}")
+        elif convention == CALL_IF:
+            if len(open_branches) == MAX_COMPILED_BRANCH_DEPTH:
+                return None
+            # OP_IF takes the branch on a true element, OP_NOTIF on a false one
+            comparison = "!=" if cmd == 99 else "=="
+            lines.append(f"{indent}if len(stack) < 1: {failed}")
+            lines.append(f"{indent}if decode_num(stack.pop()) {comparison} 0:")
+            indent += "    "
+            lines.append(f"{indent}pass")
+            open_branches.append(False)
+        elif convention == CALL_ELSE:
+            # a second OP_ELSE toggles back, which is left to the interpreter
+            if open_branches[-1]:
+                return None
+            open_branches[-1] = True
+            lines.append(f"{indent[:-4]}else:")
+            lines.append(f"{indent}pass")
+        elif convention == CALL_ENDIF:
+            open_branches.pop()
+            indent = indent[:-4]
+        else:
+            lines.append(f"{indent}{failed}")
+    lines.append("    return True")
+    exec("\n".join(lines), namespace)
+    return namespace['compiled']
+
+
+def compiled_template(cmds, p2sh=False) -> tuple:
+    """Returns (function, pushes) for cmds from SCRIPT_TEMPLATE_CACHE, compiling the template once it has been seen
+    often enough. The function is None when the interpreter has to run the script, always while SCRIPT_PROFILER is enabled"""
+    if SCRIPT_PROFILER.enabled:
+        return None, None
+    template, pushes = script_template(cmds, p2sh)
+    if template is None:
+        return None, None
+    function = SCRIPT_TEMPLATE_CACHE.lookup(template)
+    if function is None and SCRIPT_TEMPLATE_CACHE.should_compile(template):
+        function = compile_template(cmds)
+        SCRIPT_TEMPLATE_CACHE.add(template, function)
+    return function, pushes
+
+
+def execute_script(cmds, stack, altstack, z, locktime=None, sequence=None, version=None, batch=None, p2sh=False) -> bool:
+    """Runs decoded cmds on the stacks, through the compiled closure of their template when SCRIPT_TEMPLATE_CACHE
+    has one and through the interpreter otherwise. p2sh is only for a ScriptSig and ScriptPubKey joined together,
+    see compile_script. Raises SyntaxError for scripts that do not compile"""
+    function, pushes = compiled_template(cmds, p2sh)
+    if function is not None:
+        result = function(stack, altstack, pushes, z, locktime, sequence, version, batch)
+        if result is not None:
+            return result
+    return execute_instructions(compile_script(cmds, p2sh), stack, altstack, z, locktime, sequence, version, batch)
+
+
+# consensus limit on the number of public keys of OP_CHECKMULTISIG
+MAX_PUBKEYS_PER_MULTISIG = 20
+
+# value pushed by OP_0, OP_1NEGATE and OP_1 to OP_16
+SMALL_NUMBER_OP_CODES = {0: b'', 79: b'\x81'}
+SMALL_NUMBER_OP_CODES.update({op: bytes([op - 80]) for op in range(81, 97)})
+
+def verify_script(script_sig, script_pubkey, z, locktime=None, sequence=None, version=None, batch=None) -> bool:
+    """Verifies a ScriptSig against the ScriptPubKey it spends. p2pkh and p2sh templates are validated directly
+    (hash check, then one signature check or the RedeemScript). Anything else runs the ScriptSig, then the
+    ScriptPubKey on the stack it leaves, as two executions each held to the limits of a single script like in
+    Bitcoin Core. With a SignatureBatch the result only holds once the batch verifies. Fails when either script does not decode"""
+    if script_sig._decoded_or_none() is None or script_pubkey._decoded_or_none() is None:
+        print("bad script: parsing script failed")
+        return False
+    if script_pubkey.is_p2pkh_script_pubkey():
+        cmds = script_sig._decoded()
+        if len(cmds) == 2 and type(cmds[0]) == bytes and type(cmds[1]) == bytes:
+            # <signature> <pubkey> OP_DUP OP_HASH160 <hash> OP_EQUALVERIFY OP_CHECKSIG
+            if hash160(cmds[1]) != script_pubkey._decoded()[2]:
+                return False
+            if batch is not None:
+                batch.add(z, cmds[0][:-1], cmds[1])
+                return True
+            try:
+                return verify_signature(z, cmds[0][:-1], cmds[1])
+            except (ValueError, SyntaxError) as e:
+                return False
+    elif script_pubkey.is_p2sh_script_pubkey():
+        cmds = script_sig._decoded()
+        if len(cmds) > 0 and type(cmds[-1]) == bytes and script_sig.is_push_only():
+            # <pushes> <RedeemScript> OP_HASH160 <hash> OP_EQUAL
+            redeem_script = cmds[-1]
+            if hash160(redeem_script) != script_pubkey._decoded()[1]:
+                return False
+            if len(redeem_script) > MAX_SCRIPT_ELEMENT_SIZE or len(cmds) > MAX_STACK_SIZE:
+                return False
+            stack = [SMALL_NUMBER_OP_CODES[cmd] if type(cmd) == int else cmd for cmd in cmds[:-1]]
+            if any(len(element) > MAX_SCRIPT_ELEMENT_SIZE for element in stack):
+                return False
+            try:
+                if not execute_script(decode_redeem_script(redeem_script), stack, [], z, locktime, sequence, version, batch):
+                    return False
+            except SyntaxError as e:
+                print(f"bad redeem script: {e}")
+                return False
+            return len(stack) > 0 and stack.pop() != b''
+        # the RedeemScript has to be the last push of a push only ScriptSig
+        return False
+    stack = []
+    try:
+        # the ScriptSig does not decide the outcome on its own, so its signature checks are not deferred
+        if not execute_script(script_sig._decoded(), stack, [], z, locktime, sequence, version):
+            return False
+        if not execute_script(script_pubkey._decoded(), stack, [], z, locktime, sequence, version, batch):
+            return False
+    except SyntaxError as e:
+        print(f"bad script: {e}")
+        return False
+    return len(stack) > 0 and stack.pop() != b''
+
+
+
+def verify_p2wpkh(witness, h160, z, batch=None) -> bool:
+    """Verifies the <signature> <pubkey> witness of a P2WPKH program directly: a hash check, then one signature
+    check against the BIP143 sig_hash z. With a SignatureBatch the result only holds once the batch verifies"""
+    if len(witness) != 2:
+        return False
+    signature, sec = witness
+    if len(signature) == 0 or hash160(sec) != h160:
+        return False
+    if batch is not None:
+        batch.add(z, signature[:-1], sec)
+        return True
+    try:
+        return verify_signature(z, signature[:-1], sec)
+    except (ValueError, SyntaxError) as e:
+        return False
+
+
+def verify_p2wsh(witness, h256, z, locktime=None, sequence=None, version=None, batch=None) -> bool:
+    """Verifies the witness of a P2WSH program: the last item is the WitnessScript, run on the other items against
+    the BIP143 sig_hash z, and must leave exactly one true element. With a SignatureBatch the result only holds once the batch verifies"""
+    if len(witness) == 0:
+        return False
+    witness_script = witness[-1]
+    if len(witness_script) > MAX_WITNESS_SCRIPT_SIZE or hashlib.sha256(witness_script).digest() != h256:
+        return False
+    stack = list(witness[:-1])
+    if len(stack) > MAX_STACK_SIZE or any(len(element) > MAX_SCRIPT_ELEMENT_SIZE for element in stack):
+        return False
+    try:
+        if not execute_script(decode_script(witness_script), stack, [], z, locktime, sequence, version, batch):
+            return False
+    except SyntaxError as e:
+        print(f"bad witness script: {e}")
+        return False
+    return len(stack) == 1 and stack[0] != b''
+
 class Script:
-    def __init__(self, cmds=None):
+    # __weakref__ keeps Script usable as a value of the ScriptInternTable
+    __slots__ = ('_cmds', '_raw', '_immutable', '__weakref__')
+
+    def __init__(self, cmds=None, raw=None, immutable=False):
+        """Initialize a Script from a list of cmds, or lazily from its raw serialization (bytes or a memoryview, without the length prefix).
+        An immutable script exposes its cmds as a tuple so that it can be shared"""
+        if cmds is None and raw is None:
+            cmds = []
+        self._cmds = cmds
+        self._raw = raw
+        self._immutable = immutable
+
+    @property
+    def cmds(self) -> list:
+        """The list of opcodes and elements, decoded from the raw bytes on first access"""
+        cmds = self._decoded()
+        if self._immutable:
+            return tuple(cmds)
+        # the caller may modify the list, so the raw bytes can no longer be trusted
+        self._raw = None
+        return cmds
+
+    @cmds.setter
+    def cmds(self, cmds) -> None:
+        if self._immutable:
+            raise AttributeError("cmds of an immutable Script cannot be replaced")
+        self._cmds = cmds
+        self._raw = None
+
+    def _decoded(self) -> list:
+        """Returns the cmds without giving up the cached raw bytes, raises SyntaxError if they do not decode"""
+        if self._cmds is None:
+            self._cmds = decode_script(self._raw)
+        return self._cmds
+
+    def _decoded_or_none(self) -> list:
+        """Returns the cmds like _decoded, or None for raw bytes ending in a truncated push"""
+        try:
+            return self._decoded()
+        except SyntaxError:
+            return None
+
+    def _decoded_prefix(self) -> list:
+        """Returns the cmds, or those before the truncated push of raw bytes that do not decode"""
+        cmds = self._decoded_or_none()
         if cmds is None:
-            self.cmds = []
-        else:
-            self.cmds = cmds
+            return decode_script(self._raw, partial=True)
+        return cmds
 
     def __repr__(self) -> str:
-        """Returns the string representation of Script"""
+        """Returns the string representation of Script, ending in [error] where the raw bytes stop decoding"""
         result = []
-        for cmd in self.cmds:
+        cmds = self._decoded_or_none()
+        if cmds is None:
+            cmds = decode_script(self._raw, partial=True) + [None]
+        for cmd in cmds:
+            if cmd is None:
+                result.append('[error]')
+                continue
             if type(cmd) == int:
                 if OP_CODE_NAMES.get(cmd):
                     name = OP_CODE_NAMES.get(cmd)
@@ -52,78 +578,60 @@ class Script:
                 result.append(cmd.hex())
         return ' '.join(result)
 
+    def __add__(self, other: Script) -> Script:
+        """Returns a Script whose cmds are the cmds of this script followed by the other's. Scripts that do not
+        decode are joined as raw bytes instead, so the result fails to decode in turn"""
+        cmds, other_cmds = self._decoded_or_none(), other._decoded_or_none()
+        if cmds is None or other_cmds is None:
+            return Script(raw=self.raw_serialize() + other.raw_serialize())
+        return Script(cmds + other_cmds)
+
     @classmethod
-    def parse_script(cls, byte_stream: bytes) -> Script:
+    def parse_script(cls, byte_stream: bytes, intern_table=None) -> Script:
+        """Reads a length prefixed script from the byte stream, the cmds are only decoded when first needed.
+        With a ScriptInternTable, byte-identical scripts come back as one shared immutable Script"""
         # get the length of the entire field
         length = decode_varint(byte_stream)
-        # initialize the cmds array
-        cmds = []
-        # initialize the number of bytes we've read to 0
-        count = 0
-        # loop until we've read length bytes
-        while count < length:
-            # get the current byte
-            current = byte_stream.read(1)
-            # increment the bytes we've read
-            count += 1
-            # convert the current byte to an integer
-            current_byte = current[0]
-            # if the current byte is between 1 and 75 inclusive
-            if current_byte >= 1 and current_byte <= 75:
-                # we have an cmd set n to be the current byte
-                n = current_byte
-                # add the next n bytes as an cmd
-                cmds.append(byte_stream.read(n))
-                # increase the count by n
-                count += n
-            elif current_byte == 76:
-                # op_pushdata1
-                data_length = little_endian_to_int(byte_stream.read(1))
-                cmds.append(byte_stream.read(data_length))
-                count += data_length + 1
-            elif current_byte == 77:
-                # op_pushdata2
-                data_length = little_endian_to_int(byte_stream.read(2))
-                cmds.append(byte_stream.read(data_length))
-                count += data_length + 2
-            else:
-                # we have an opcode, set the current byte to op_code
-                op_code = current_byte
-                # add the op_code to the list of cmds
-                cmds.append(op_code)
-        if count != length:
+        # keep the script as one contiguous slice instead of an object per cmd
+        raw = byte_stream.read(length)
+        if len(raw) != length:
             raise SyntaxError("parsing script failed")
-        return Script(cmds)
+        if intern_table is not None:
+            return intern_table.intern(raw)
+        return Script(raw=raw)
 
     def raw_serialize(self):
-        # initialize what we'll send back
-        result = b''
+        # an unmodified parsed script already has its serialization
+        if self._raw is not None:
+            return bytes(self._raw)
+        # collect the pieces and join them once at the end
+        result = []
         # go through each cmd
-        for cmd in self.cmds:
+        for cmd in self._cmds:
             # if the cmd is an integer, it's an opcode
             if type(cmd) == int:
                 # turn the cmd into a single byte integer using int_to_little_endian
-                result += int_to_little_endian(cmd, 1)
+                result.append(int_to_little_endian(cmd, 1))
             else:
                 # otherwise, this is an element
                 # get the length in bytes
                 length = len(cmd)
                 # for large lengths, we have to use a pushdata opcode
-                if length < 75:
+                if length <= 75:
                     # turn the length into a single byte integer
-                    result += int_to_little_endian(length, 1)
-                elif length > 75 and length < 0x100:
+                    result.append(int_to_little_endian(length, 1))
+                elif length < 0x100:
                     # 76 is pushdata1
-                    result += int_to_little_endian(76, 1)
-                    result += int_to_little_endian(length, 1)
-                elif length >= 0x100 and length <= 520:
+                    result.append(int_to_little_endian(76, 1))
+                    result.append(int_to_little_endian(length, 1))
+                elif length <= 520:
                     # 77 is pushdata2
-                    result += int_to_little_endian(77, 1)
-                    result += int_to_little_endian(length, 2)
+                    result.append(int_to_little_endian(77, 1))
+                    result.append(int_to_little_endian(length, 2))
                 else:
                     raise ValueError("cmd too long")
-                result += cmd
-        return result
+                result.append(cmd)
+        return b''.join(result)
 
     def serialize_script(self):
         # get the raw serialization (no prepended length)
@@ -133,84 +641,93 @@ class Script:
         # encode_varint the total length of the result and prepend
         return encode_varint(total) + result
 
-    def evaluate(self, z):
-        # create a copy as we may need to add to this list if we have a RedeemScript
-        cmds = self.cmds[:]
+    def evaluate(self, z, locktime=None, sequence=None, version=None, batch=None):
+        """Evaluates the script against the sig_hash z, locktime/sequence/version are needed by OP_CHECKLOCKTIMEVERIFY and OP_CHECKSEQUENCEVERIFY.
+        Meant for a ScriptSig and ScriptPubKey joined with +, so a trailing p2sh check runs the pushed RedeemScript.
+        Frequent templates run as compiled closures from SCRIPT_TEMPLATE_CACHE, the rest through the interpreter.
+        With a SignatureBatch the result only holds once the batch verifies"""
+        try:
+            cmds = self._decoded()
+        except SyntaxError as e:
+            print(f"bad script: {e}")
+            return False
         stack = []
-        altstack = []
-        while len(cmds) > 0:
-            cmd = cmds.pop(0)
-            if type(cmd) == int:
-                # do what the opcode says
-                operation = OP_CODE_FUNCTIONS[cmd]
-                if cmd in (99, 100):
-                    # op_if/op_notif require the cmds array
-                    if not operation(stack, cmds):
-                        print(f"bad op: {OP_CODE_NAMES[cmd]}")
-                        return False
-                elif cmd in (107, 108):
-                    # op_toaltstack/op_fromaltstack require the altstack
-                    if not operation(stack, altstack):
-                        print(f"bad op: {OP_CODE_NAMES[cmd]}")
-                        return False
-                elif cmd in (172, 173, 174, 175):
-                    # these are signing operations, they need a sig_hash
-                    # to check against
-                    if not operation(stack, z):
-                        print(f"bad op: {OP_CODE_NAMES[cmd]}")
-                        return False
-                else:
-                    if not operation(stack):
-                        print(f"bad op: {OP_CODE_NAMES[cmd]}")
-                        return False
-            else:
-                stack.append(cmd)
-                if len(cmds) == 3 and cmds[0] == 0xa9 \
-                    and type(cmds[1]) == bytes and len(cmds[1]) == 20 \
-                    and cmds[2] == 0x87:
-                    cmds.pop()
-                    h160 = cmds.pop()
-                    cmds.pop()
-                    if not op_hash160(stack):
-                        return False
-                    stack.append(h160)
-                    if not op_equal(stack):
-                        return False
-                    if not op_verify(stack):
-                        print("bad p2sh hash160")
-                        return False
-                    redeem_script = encode_varint(len(cmd)) + cmd
-                    stream = BytesIO(redeem_script)
-                    cmds.extend(Script.parse_script(stream).cmds)
+        try:
+            if not execute_script(cmds, stack, [], z, locktime, sequence, version, batch, p2sh=True):
+                return False
+        except SyntaxError as e:
+            print(f"bad script: {e}")
+            return False
         if len(stack) == 0:
             return False
         if stack.pop() == b'':
             return False
         return True
 
+    def sig_op_count(self, accurate=False):
+        """Returns the number of signature operations without running the script. OP_CHECKMULTISIG counts
+        MAX_PUBKEYS_PER_MULTISIG unless accurate is set and it follows OP_1 to OP_16, as for p2sh RedeemScripts.
+        Like Bitcoin Core, counting stops at a truncated push"""
+        count = 0
+        last_cmd = None
+        for cmd in self._decoded_prefix():
+            if cmd == 172 or cmd == 173:
+                count += 1
+            elif cmd == 174 or cmd == 175:
+                if accurate and type(last_cmd) == int and 81 <= last_cmd <= 96:
+                    count += last_cmd - 80
+                else:
+                    count += MAX_PUBKEYS_PER_MULTISIG
+            last_cmd = cmd
+        return count
+
     def is_p2pkh_script_pubkey(self):
         """Returns whether this follows the OP_DUP OP_HASH160 <20 byte hash> OP_EQUALVERIFY OP_CHECKSIG pattern"""
-        return len(self.cmds) == 5 and self.cmds[0] == 0x76 \
-            and self.cmds[1] == 0xa9 \
-            and type(self.cmds[2]) == bytes and len(self.cmds[2]) == 20 \
-            and self.cmds[3] == 0x88 and self.cmds[4] == 0xac
+        cmds = self._decoded_or_none()
+        return cmds is not None and len(cmds) == 5 and cmds[0] == 0x76 \
+            and cmds[1] == 0xa9 \
+            and type(cmds[2]) == bytes and len(cmds[2]) == 20 \
+            and cmds[3] == 0x88 and cmds[4] == 0xac
 
     def is_p2sh_script_pubkey(self):
         """Returns whether this follows the OP_HASH160 <20 byte hash> OP_EQUAL pattern"""
-        return len(self.cmds) == 3 and self.cmds[0] == 0xa9 \
-            and type(self.cmds[1]) == bytes and len(self.cmds[1]) == 20 \
-            and self.cmds[2] == 0x87
-    
+        cmds = self._decoded_or_none()
+        return cmds is not None and len(cmds) == 3 and cmds[0] == 0xa9 \
+            and type(cmds[1]) == bytes and len(cmds[1]) == 20 \
+            and cmds[2] == 0x87
+
+    def is_p2wpkh_script_pubkey(self):
+        """Returns whether this follows the OP_0 <20 byte hash> pattern"""
+        cmds = self._decoded_or_none()
+        return cmds is not None and len(cmds) == 2 and cmds[0] == 0x00 \
+            and type(cmds[1]) == bytes and len(cmds[1]) == 20
+
+    def is_p2wsh_script_pubkey(self):
+        """Returns whether this follows the OP_0 <32 byte hash> pattern"""
+        cmds = self._decoded_or_none()
+        return cmds is not None and len(cmds) == 2 and cmds[0] == 0x00 \
+            and type(cmds[1]) == bytes and len(cmds[1]) == 32
+
+    def is_push_only(self):
+        """Returns whether every cmd is a data push or a small number push, False for scripts that do not decode"""
+        cmds = self._decoded_or_none()
+        if cmds is None:
+            return False
+        for cmd in cmds:
+            if type(cmd) == int and cmd not in SMALL_NUMBER_OP_CODES:
+                return False
+        return True
+
     def address(self, testnet=False):
         '''Returns the address corresponding to the script'''
         if self.is_p2pkh_script_pubkey():  # p2pkh
             # hash160 is the 3rd cmd
-            hash160 = self.cmds[2]
+            hash160 = self._decoded()[2]
             # convert to p2pkh address using h160_to_p2pkh_address (remember testnet)
             return hash160_to_p2pkh_address(hash160, testnet)
         elif self.is_p2sh_script_pubkey():  # p2sh
             # hash160 is the 2nd cmd
-            hash160 = self.cmds[1]
+            hash160 = self._decoded()[1]
             # convert to p2sh address using h160_to_p2sh_address (remember testnet)
             return hash160_to_p2sh_address(hash160, testnet)
         raise ValueError('Unknown ScriptPubKey')
@@ -353,78 +870,6 @@ def op_nop(stack):
     return True
 
 
-def op_if(stack, items):
-    if len(stack) < 1:
-        return False
-    # go through and re-make the items array based on the top stack element
-    true_items = []
-    false_items = []
-    current_array = true_items
-    found = False
-    num_endifs_needed = 1
-    while len(items) > 0:
-        item = items.pop(0)
-        if item in (99, 100):
-            # nested if, we have to go another endif
-            num_endifs_needed += 1
-            current_array.append(item)
-        elif num_endifs_needed == 1 and item == 103:
-            current_array = false_items
-        elif item == 104:
-            if num_endifs_needed == 1:
-                found = True
-                break
-            else:
-                num_endifs_needed -= 1
-                current_array.append(item)
-        else:
-            current_array.append(item)
-    if not found:
-        return False
-    element = stack.pop()
-    if decode_num(element) == 0:
-        items[:0] = false_items
-    else:
-        items[:0] = true_items
-    return True
-
-
-def op_notif(stack, items):
-    if len(stack) < 1:
-        return False
-    # go through and re-make the items array based on the top stack element
-    true_items = []
-    false_items = []
-    current_array = true_items
-    found = False
-    num_endifs_needed = 1
-    while len(items) > 0:
-        item = items.pop(0)
-        if item in (99, 100):
-            # nested if, we have to go another endif
-            num_endifs_needed += 1
-            current_array.append(item)
-        elif num_endifs_needed == 1 and item == 103:
-            current_array = false_items
-        elif item == 104:
-            if num_endifs_needed == 1:
-                found = True
-                break
-            else:
-                num_endifs_needed -= 1
-                current_array.append(item)
-        else:
-            current_array.append(item)
-    if not found:
-        return False
-    element = stack.pop()
-    if decode_num(element) == 0:
-        items[:0] = true_items
-    else:
-        items[:0] = false_items
-    return True
-
-
 def op_verify(stack):
     if len(stack) < 1:
         return False
@@ -864,33 +1309,103 @@ def op_hash256(stack):
     return True
 
 
-def op_checksig(stack, z):
+def verify_signature(z, der_signature, sec_pubkey, points=None) -> bool:
+    """Returns whether the DER signature (without sighash byte) is valid for z under the SEC public key, consulting SIGNATURE_CACHE first.
+    points optionally maps SEC bytes to already parsed public keys and is filled in as keys get parsed.
+    Raises ValueError or SyntaxError if the public key or signature cannot be parsed"""
+    # signatures already verified (e.g. on mempool acceptance) skip the curve math
+    if SIGNATURE_CACHE.contains(z, der_signature, sec_pubkey):
+        return True
+    if points is None:
+        point = Secp256k1Point.parse_secp256k1_point(sec_pubkey)
+    else:
+        point = points.get(sec_pubkey)
+        if point is None:
+            point = Secp256k1Point.parse_secp256k1_point(sec_pubkey)
+            points[sec_pubkey] = point
+    sig = Signature.parse_signature(der_signature)
+    if not point.verify(z, sig):
+        return False
+    SIGNATURE_CACHE.add(z, der_signature, sec_pubkey)
+    return True
+
+
+def op_checksig(stack, z, batch=None):
     if len(stack) < 2:
         return False
     sec_pubkey = stack.pop()
     der_signature = stack.pop()[:-1]
+    if batch is not None:
+        # the caller only passes a batch when a failed check fails the whole script
+        batch.add(z, der_signature, sec_pubkey)
+        stack.append(encode_num(1))
+        return True
     try:
-        point = Secp256k1Point.parse_secp256k1_point(sec_pubkey)
-        sig = Signature.parse_signature(der_signature)
-    except (ValueError, SyntaxError) as e:
+        valid = verify_signature(z, der_signature, sec_pubkey)
+    except (ValueError, SyntaxError, IndexError) as e:
         return False
-    if point.verify(z, sig):
+    if valid:
         stack.append(encode_num(1))
     else:
         stack.append(encode_num(0))
     return True
 
 
-def op_checksigverify(stack, z):
-    return op_checksig(stack, z) and op_verify(stack)
+def op_checksigverify(stack, z, batch=None):
+    return op_checksig(stack, z, batch) and op_verify(stack)
 
 
-def op_checkmultisig(stack, z):
-    raise NotImplementedError
+def op_checkmultisig(stack, z, batch=None):
+    if len(stack) < 1:
+        return False
+    n = decode_num(stack.pop())
+    if n < 0 or n > MAX_PUBKEYS_PER_MULTISIG or len(stack) < n + 1:
+        return False
+    # keys and signatures in the order they were pushed
+    sec_pubkeys = stack[len(stack) - n:]
+    del stack[len(stack) - n:]
+    m = decode_num(stack.pop())
+    if m < 0 or m > n or len(stack) < m + 1:
+        return False
+    der_signatures = [signature[:-1] for signature in stack[len(stack) - m:]]
+    del stack[len(stack) - m:]
+    # OP_CHECKMULTISIG consumes one extra element, the off-by-one bug kept by consensus
+    stack.pop()
+    if batch is not None and m == n:
+        # with as many signatures as keys the pairing is fixed, so the checks can be deferred
+        for der_signature, sec_pubkey in zip(der_signatures, sec_pubkeys):
+            batch.add(z, der_signature, sec_pubkey)
+        stack.append(encode_num(1))
+        return True
+    # signatures must appear in the same order as their keys, so walking both lists once
+    # tries each key at most once instead of every signature against every key
+    points = {}
+    key_index = 0
+    valid = True
+    for sig_index, der_signature in enumerate(der_signatures):
+        matched = False
+        while not matched:
+            # give up as soon as the remaining keys cannot cover the remaining signatures
+            if n - key_index < m - sig_index:
+                break
+            sec_pubkey = sec_pubkeys[key_index]
+            key_index += 1
+            try:
+                matched = verify_signature(z, der_signature, sec_pubkey, points)
+            except (ValueError, SyntaxError, IndexError) as e:
+                matched = False
+        if not matched:
+            valid = False
+            break
+    if valid:
+        stack.append(encode_num(1))
+    else:
+        stack.append(encode_num(0))
+    return True
 
 
-def op_checkmultisigverify(stack, z):
-    return op_checkmultisig(stack, z) and op_verify(stack)
+def op_checkmultisigverify(stack, z, batch=None):
+    return op_checkmultisig(stack, z, batch) and op_verify(stack)
 
 
 def op_checklocktimeverify(stack, locktime, sequence):
@@ -948,8 +1463,6 @@ OP_CODE_FUNCTIONS = {
     95: op_15,
     96: op_16,
     97: op_nop,
-    99: op_if,
-    100: op_notif,
     105: op_verify,
     106: op_return,
     107: op_toaltstack,
@@ -1109,3 +1622,24 @@ OP_CODE_NAMES = {
     184: 'OP_NOP9',
     185: 'OP_NOP10',
 }
+
+OP_CODE_CALLING_CONVENTIONS = {
+    99: CALL_IF,
+    100: CALL_IF,
+    103: CALL_ELSE,
+    104: CALL_ENDIF,
+    107: CALL_ALTSTACK,
+    108: CALL_ALTSTACK,
+    172: CALL_SIG_HASH,
+    173: CALL_SIG_HASH,
+    174: CALL_MULTISIG,
+    175: CALL_MULTISIG,
+    177: CALL_LOCKTIME,
+    178: CALL_SEQUENCE,
+}
+
+# opcode -> (handler, calling convention) used by compile_script
+OP_CODE_DISPATCH = {
+    cmd: (OP_CODE_FUNCTIONS.get(cmd), OP_CODE_CALLING_CONVENTIONS.get(cmd, CALL_STACK))
+    for cmd in list(OP_CODE_FUNCTIONS) + list(OP_CODE_CALLING_CONVENTIONS)
+}
@@ -0,0 +1,168 @@
+from __future__ import annotations
+from src.utils import hash160_to_p2pkh_address, hash160_to_p2sh_address, witness_program_to_segwit_address
+
+# ScriptPubKey type codes
+NONSTANDARD = 0
+P2PKH = 1
+P2SH = 2
+P2WPKH = 3
+P2WSH = 4
+P2TR = 5
+NULL_DATA = 6
+MULTISIG = 7
+
+SCRIPT_TYPE_NAMES = {
+    NONSTANDARD: 'nonstandard',
+    P2PKH: 'p2pkh',
+    P2SH: 'p2sh',
+    P2WPKH: 'p2wpkh',
+    P2WSH: 'p2wsh',
+    P2TR: 'p2tr',
+    NULL_DATA: 'nulldata',
+    MULTISIG: 'multisig',
+}
+
+def classify_script_pubkey(raw) -> tuple:
+    """Matches the raw bytes of a ScriptPubKey (without the length prefix) against the standard templates.
+    Returns (type code, data): the hash or witness program of address types, the concatenated pushes of
+    OP_RETURN outputs, (m, public keys) of bare multisig and None for nonstandard scripts"""
+    length = len(raw)
+    if length == 0:
+        return NONSTANDARD, None
+    first = raw[0]
+    if length == 25:
+        # OP_DUP OP_HASH160 <20 bytes> OP_EQUALVERIFY OP_CHECKSIG
+        if first == 0x76 and raw[1] == 0xa9 and raw[2] == 20 and raw[23] == 0x88 and raw[24] == 0xac:
+            return P2PKH, bytes(raw[3:23])
+    elif length == 23:
+        # OP_HASH160 <20 bytes> OP_EQUAL
+        if first == 0xa9 and raw[1] == 20 and raw[22] == 0x87:
+            return P2SH, bytes(raw[2:22])
+    elif length == 22:
+        # OP_0 <20 bytes>
+        if first == 0x00 and raw[1] == 20:
+            return P2WPKH, bytes(raw[2:])
+    elif length == 34:
+        # OP_0 <32 bytes> or OP_1 <32 bytes>
+        if raw[1] == 32:
+            if first == 0x00:
+                return P2WSH, bytes(raw[2:])
+            if first == 0x51:
+                return P2TR, bytes(raw[2:])
+    if first == 0x6a:
+        return classify_null_data(raw)
+    if raw[-1] == 0xae:
+        return classify_multisig(raw)
+    return NONSTANDARD, None
+
+def witness_program(raw) -> tuple:
+    """Returns (witness version, program) when raw is a BIP141 witness program, a version opcode (OP_0 or OP_1
+    to OP_16) followed by a single push of 2 to 40 bytes, None otherwise"""
+    length = len(raw)
+    if length < 4 or length > 42 or raw[1] != length - 2:
+        return None
+    if raw[0] == 0x00:
+        return 0, bytes(raw[2:])
+    if 0x51 <= raw[0] <= 0x60:
+        return raw[0] - 0x50, bytes(raw[2:])
+    return None
+
+def classify_null_data(raw) -> tuple:
+    """Classifies OP_RETURN followed only by data pushes as NULL_DATA with the concatenated pushes"""
+    pushes = []
+    count = 1
+    length = len(raw)
+    while count < length:
+        op = raw[count]
+        count += 1
+        if op <= 75:
+            data_length = op
+        elif op == 76 and count < length:
+            data_length = raw[count]
+            count += 1
+        elif op == 77 and count + 1 < length:
+            data_length = raw[count] | raw[count + 1] << 8
+            count += 2
+        elif op == 79 or 81 <= op <= 96:
+            # small numbers are pushes too
+            continue
+        else:
+            return NONSTANDARD, None
+        if count + data_length > length:
+            return NONSTANDARD, None
+        pushes.append(bytes(raw[count:count + data_length]))
+        count += data_length
+    return NULL_DATA, b''.join(pushes)
+
+def classify_multisig(raw) -> tuple:
+    """Classifies OP_m <33 or 65 byte keys> OP_n OP_CHECKMULTISIG as MULTISIG with (m, public keys)"""
+    length = len(raw)
+    if length < 3 or not 0x51 <= raw[0] <= 0x60 or not 0x51 <= raw[-2] <= 0x60:
+        return NONSTANDARD, None
+    m = raw[0] - 0x50
+    n = raw[-2] - 0x50
+    keys = []
+    count = 1
+    while count < length - 2:
+        key_length = raw[count]
+        if key_length != 33 and key_length != 65:
+            return NONSTANDARD, None
+        keys.append(bytes(raw[count + 1:count + 1 + key_length]))
+        count += 1 + key_length
+    if count != length - 2 or len(keys) != n or m > n:
+        return NONSTANDARD, None
+    return MULTISIG, (m, tuple(keys))
+
+def data_to_address(script_type: int, data, testnet=False) -> str:
+    """Encodes the address of a classified ScriptPubKey, None for types without an address"""
+    if script_type == P2PKH:
+        return hash160_to_p2pkh_address(data, testnet)
+    elif script_type == P2SH:
+        return hash160_to_p2sh_address(data, testnet)
+    elif script_type == P2WPKH or script_type == P2WSH:
+        return witness_program_to_segwit_address(data, 0, testnet)
+    elif script_type == P2TR:
+        return witness_program_to_segwit_address(data, 1, testnet)
+    return None
+
+
+class ScriptPubKeyClassification:
+    """Type codes and extracted data of an array of ScriptPubKeys, with addresses encoded only on request"""
+    def __init__(self, types: bytearray, data: list):
+        self.types = types
+        self.data = data
+
+    def __repr__(self) -> str:
+        """Returns string representation of ScriptPubKeyClassification"""
+        return f"ScriptPubKeyClassification({len(self.types)} scripts)"
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @classmethod
+    def classify(cls, raw_scripts) -> ScriptPubKeyClassification:
+        """Classifies an iterable of raw ScriptPubKeys (bytes or memoryview, without the length prefix)"""
+        types = bytearray()
+        data = []
+        for raw in raw_scripts:
+            script_type, script_data = classify_script_pubkey(raw)
+            types.append(script_type)
+            data.append(script_data)
+        return cls(types, data)
+
+    def address(self, index: int, testnet=False) -> str:
+        """Returns the address of the script at index, None if its type has no address"""
+        return data_to_address(self.types[index], self.data[index], testnet)
+
+    def addresses(self, testnet=False):
+        """Yields the address (or None) of every script in order"""
+        for script_type, data in zip(self.types, self.data):
+            yield data_to_address(script_type, data, testnet)
+
+    def counts(self) -> dict:
+        """Returns the number of scripts per type name"""
+        counts = {}
+        for script_type in self.types:
+            name = SCRIPT_TYPE_NAMES[script_type]
+            counts[name] = counts.get(name, 0) + 1
+        return counts
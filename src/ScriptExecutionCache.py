@@ -0,0 +1,57 @@
+from __future__ import annotations
+from src.LRUCache import LRUCache
+
+import hashlib
+
+# default number of validated inputs remembered
+DEFAULT_MAX_SCRIPT_EXECUTION_CACHE_ENTRIES = 100000
+
+class ScriptExecutionCache(LRUCache):
+    """LRUCache of transaction inputs whose scripts already evaluated successfully, keyed by (txid, input index, prevout ScriptPubKey and witness hash, verification flags)"""
+    def __init__(self, max_entries: int = DEFAULT_MAX_SCRIPT_EXECUTION_CACHE_ENTRIES):
+        super().__init__(max_entries)
+        # txid -> keys of that transaction, for explicit invalidation
+        self.keys_by_txid = {}
+
+    @staticmethod
+    def make_key(txid: bytes, input_index: int, script_pubkey_bytes: bytes, flags: int = 0, witness_bytes: bytes = b'') -> tuple:
+        """Returns the cache key for an input given the serialized ScriptPubKey it spends. The txid does not commit
+        to witnesses, so the serialized witness of the input is hashed in as well"""
+        return (txid, input_index, hashlib.sha256(script_pubkey_bytes + witness_bytes).digest(), flags)
+
+    def contains(self, key: tuple) -> bool:
+        """Returns whether the input identified by key is already known to be valid, updating the hit counters"""
+        return self.touch(key)
+
+    def add(self, key: tuple) -> None:
+        """Records an input that validated, evicting the least recently used entries past max_entries"""
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.put(key)
+            self.keys_by_txid.setdefault(key[0], set()).add(key)
+
+    def invalidate(self, txid: bytes) -> int:
+        """Removes every cached input of a transaction and returns how many entries were dropped"""
+        with self.lock:
+            keys = self.keys_by_txid.pop(txid, set())
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """Removes all entries and resets the counters"""
+        with self.lock:
+            super().clear()
+            self.keys_by_txid.clear()
+
+    def _evicted(self, key: tuple) -> None:
+        keys = self.keys_by_txid.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del self.keys_by_txid[key[0]]
+
+
+# process wide cache consulted by Transaction.verify_input
+SCRIPT_EXECUTION_CACHE = ScriptExecutionCache()
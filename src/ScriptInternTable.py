@@ -0,0 +1,59 @@
+from __future__ import annotations
+from src.Script import Script
+
+import sys
+import weakref
+
+class ScriptInternTable:
+    """Opt-in table that hands out one shared immutable Script per distinct raw serialization.
+    Entries are held weakly, so a script leaves the table once nothing else references it"""
+    def __init__(self):
+        self.scripts = weakref.WeakValueDictionary()
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_saved = 0
+
+    def __repr__(self) -> str:
+        """Returns string representation of ScriptInternTable"""
+        return f"ScriptInternTable({len(self.scripts)} scripts, {self.hits}/{self.lookups} shared, ~{self.bytes_saved} bytes saved)"
+
+    def __len__(self) -> int:
+        return len(self.scripts)
+
+    def intern(self, raw) -> Script:
+        """Returns the shared Script for the raw serialization (without length prefix), creating it on first sight"""
+        raw = bytes(raw)
+        self.lookups += 1
+        script = self.scripts.get(raw)
+        if script is not None:
+            self.hits += 1
+            # the Script object and the raw bytes a private copy would have allocated
+            self.bytes_saved += script_memory_size(script) + sys.getsizeof(raw)
+            return script
+        script = Script(raw=raw, immutable=True)
+        self.scripts[raw] = script
+        return script
+
+    def clear(self) -> None:
+        """Forgets every interned script and resets the counters"""
+        self.scripts.clear()
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_saved = 0
+
+    def report(self) -> dict:
+        """Returns how many scripts are interned and an estimate of the memory saved by sharing them"""
+        return {
+            'unique_scripts': len(self.scripts),
+            'lookups': self.lookups,
+            'shared': self.hits,
+            'bytes_saved': self.bytes_saved,
+        }
+
+
+def script_memory_size(script: Script) -> int:
+    """Returns the approximate number of bytes taken by a Script object itself"""
+    size = sys.getsizeof(script)
+    if hasattr(script, '__dict__'):
+        size += sys.getsizeof(script.__dict__)
+    return size
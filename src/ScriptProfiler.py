@@ -0,0 +1,62 @@
+from __future__ import annotations
+from time import perf_counter
+
+class ScriptProfiler:
+    """Aggregates call counts and cumulative time per opcode handler of the script interpreter.
+    Disabled by default, compile_script only wraps handlers while it is enabled"""
+    def __init__(self):
+        self.enabled = False
+        # name -> [calls, seconds]
+        self.table = {}
+
+    def __repr__(self) -> str:
+        """Returns string representation of ScriptProfiler"""
+        state = "enabled" if self.enabled else "disabled"
+        return f"ScriptProfiler({state}, {len(self.table)} entries)"
+
+    def enable(self) -> None:
+        """Starts profiling scripts compiled from now on"""
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stops profiling scripts compiled from now on, the recorded table is kept"""
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Drops everything recorded so far"""
+        self.table.clear()
+
+    def record(self, name: str, elapsed: float) -> None:
+        """Adds one call of elapsed seconds to the entry of name"""
+        entry = self.table.get(name)
+        if entry is None:
+            entry = self.table[name] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def wrap(self, name: str, operation):
+        """Returns operation wrapped to record its calls under name"""
+        def profiled(*args):
+            start = perf_counter()
+            try:
+                return operation(*args)
+            finally:
+                self.record(name, perf_counter() - start)
+        return profiled
+
+    def dump(self) -> list:
+        """Returns (name, calls, total seconds, seconds per call) rows, most expensive first"""
+        rows = [(name, calls, total, total / calls) for name, (calls, total) in self.table.items()]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows
+
+    def report(self) -> str:
+        """Returns the dumped table formatted one row per line"""
+        lines = [f"{'name':<24} {'calls':>10} {'total ms':>12} {'us/call':>10}"]
+        for name, calls, total, per_call in self.dump():
+            lines.append(f"{name:<24} {calls:>10} {total * 1000:>12.3f} {per_call * 1e6:>10.2f}")
+        return "\n".join(lines)
+
+
+# process wide profiler consulted by compile_script
+SCRIPT_PROFILER = ScriptProfiler()
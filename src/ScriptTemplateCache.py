@@ -0,0 +1,49 @@
+from __future__ import annotations
+from src.LRUCache import LRUCache
+
+# default number of compiled script templates kept
+DEFAULT_MAX_SCRIPT_TEMPLATE_CACHE_ENTRIES = 1000
+# sightings of a template before it is compiled, so one-off scripts never pay for code generation
+DEFAULT_COMPILE_AFTER = 2
+
+class ScriptTemplateCache(LRUCache):
+    """LRUCache of compiled closures keyed by script template, the cmds with every push replaced by None.
+    Templates that cannot be compiled are cached as None so they are not retried. Only the template may decide
+    that, a failure caused by the pushed data of one script (an oversized push) must not be cached"""
+    def __init__(self, max_entries: int = DEFAULT_MAX_SCRIPT_TEMPLATE_CACHE_ENTRIES, compile_after: int = DEFAULT_COMPILE_AFTER):
+        super().__init__(max_entries)
+        self.compile_after = compile_after
+        # template -> sightings of templates not compiled yet
+        self.sightings = {}
+
+    def lookup(self, key: tuple):
+        """Returns the compiled closure of a template, None when it is not compiled (yet) or not compilable"""
+        return self.get(key)
+
+    def should_compile(self, key: tuple) -> bool:
+        """Records a sighting of a template missing from the cache, returns True once it is worth compiling"""
+        if self.max_entries <= 0 or key in self.entries:
+            return False
+        with self.lock:
+            if len(self.sightings) >= self.max_entries:
+                self.sightings.clear()
+            sightings = self.sightings.get(key, 0) + 1
+            if sightings < self.compile_after:
+                self.sightings[key] = sightings
+                return False
+            self.sightings.pop(key, None)
+            return True
+
+    def add(self, key: tuple, function) -> None:
+        """Records the compiled closure (or None) of a template, evicting the least recently used entries past max_entries"""
+        self.put(key, function)
+
+    def clear(self) -> None:
+        """Removes all entries and sightings and resets the counters"""
+        with self.lock:
+            super().clear()
+            self.sightings.clear()
+
+
+# process wide cache consulted by Script.evaluate and verify_script
+SCRIPT_TEMPLATE_CACHE = ScriptTemplateCache()
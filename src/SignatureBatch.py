@@ -0,0 +1,46 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from src.elliptic_curve_cryptography.Secp256k1Curve import Secp256k1Point
+from src.elliptic_curve_cryptography.DigitalSignature import Signature
+from src.SignatureCache import SIGNATURE_CACHE
+
+class SignatureBatch:
+    """Collects signature checks whose failure would fail the whole script, so they can be verified together at the end"""
+    def __init__(self):
+        self.checks = []
+
+    def __repr__(self) -> str:
+        """Returns string representation of SignatureBatch"""
+        return f"SignatureBatch({len(self.checks)} checks)"
+
+    def __len__(self) -> int:
+        return len(self.checks)
+
+    def add(self, z: int, der_signature: bytes, sec_pubkey: bytes) -> None:
+        """Defers the check of a DER signature (without sighash byte) against a SEC public key"""
+        self.checks.append((z, der_signature, sec_pubkey))
+
+    def verify(self, processes: int = None) -> bool:
+        """Returns whether every deferred check is valid, skipping the ones in SIGNATURE_CACHE and optionally spreading the rest over worker processes"""
+        pending = [check for check in self.checks if not SIGNATURE_CACHE.contains(*check)]
+        if processes is not None and processes > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(verify_check, pending))
+        else:
+            results = [verify_check(check) for check in pending]
+        for check, valid in zip(pending, results):
+            if valid:
+                SIGNATURE_CACHE.add(*check)
+        self.checks = []
+        return all(results)
+
+
+def verify_check(check) -> bool:
+    """Verifies one (z, DER signature, SEC public key) check, unparsable keys or signatures are invalid"""
+    z, der_signature, sec_pubkey = check
+    try:
+        point = Secp256k1Point.parse_secp256k1_point(sec_pubkey)
+        sig = Signature.parse_signature(der_signature)
+    except (ValueError, SyntaxError, IndexError) as e:
+        return False
+    return point.verify(z, sig)
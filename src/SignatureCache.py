@@ -0,0 +1,63 @@
+from __future__ import annotations
+from collections import OrderedDict
+from src.LRUCache import LRUCache
+
+import hashlib
+import os
+import sys
+
+# default memory budget of the cache, matching bitcoin core's -maxsigcachesize default
+DEFAULT_MAX_SIGNATURE_CACHE_BYTES = 32 * 1024 * 1024
+
+def measure_entry_bytes(samples: int = 1024) -> int:
+    """Returns the bytes taken by one entry as sys.getsizeof reports them: a 32 byte key object plus the growth of
+    an OrderedDict per key, averaged over samples keys. An approximation, allocator overhead is not counted"""
+    keys = [os.urandom(32) for _ in range(samples)]
+    entries = OrderedDict()
+    empty_size = sys.getsizeof(entries)
+    for key in keys:
+        entries[key] = None
+    return sys.getsizeof(keys[0]) + -(-(sys.getsizeof(entries) - empty_size) // samples)
+
+# approximate memory used by one entry, max_bytes of a SignatureCache is converted to entries with it
+SIGNATURE_CACHE_ENTRY_BYTES = measure_entry_bytes()
+
+class SignatureCache(LRUCache):
+    """LRUCache of signature checks that are known to be valid, keyed by a salted hash of (z, DER signature, SEC public key).
+    max_bytes is an approximate budget, turned into a number of entries of SIGNATURE_CACHE_ENTRY_BYTES each"""
+    def __init__(self, max_bytes: int = DEFAULT_MAX_SIGNATURE_CACHE_BYTES):
+        super().__init__(max_bytes // SIGNATURE_CACHE_ENTRY_BYTES)
+        self.max_bytes = max_bytes
+        # a per-instance salt so that entries cannot be targeted by crafted collisions
+        self.salt = os.urandom(32)
+
+    def make_key(self, z: int, der_signature: bytes, sec_pubkey: bytes) -> bytes:
+        """Returns the salted sha256 of the sig hash, DER signature and SEC public key"""
+        h = hashlib.sha256(self.salt)
+        h.update(z.to_bytes(32, 'big'))
+        h.update(der_signature)
+        h.update(sec_pubkey)
+        return h.digest()
+
+    def contains(self, z: int, der_signature: bytes, sec_pubkey: bytes) -> bool:
+        """Returns whether this signature check is already known to be valid, updating the hit counters"""
+        return self.touch(self.make_key(z, der_signature, sec_pubkey))
+
+    def add(self, z: int, der_signature: bytes, sec_pubkey: bytes) -> None:
+        """Records a signature check that passed, evicting the least recently used entries past the memory limit"""
+        self.put(self.make_key(z, der_signature, sec_pubkey))
+
+    def memory_usage(self) -> int:
+        """Returns the approximate number of bytes held by the cache entries, see SIGNATURE_CACHE_ENTRY_BYTES"""
+        return len(self.entries) * SIGNATURE_CACHE_ENTRY_BYTES
+
+    def stats(self) -> dict:
+        """Returns the counters of the cache and its memory usage as a dictionary"""
+        stats = super().stats()
+        stats['memory_usage'] = self.memory_usage()
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+# process wide cache consulted by op_checksig
+SIGNATURE_CACHE = SignatureCache()
@@ -1,13 +1,38 @@
 from __future__ import annotations
 from io import BytesIO
-from src.utils import hash256, little_endian_to_int, decode_varint, int_to_little_endian, encode_varint, SIGHASH_ALL
-from src.Script import Script
+from src.utils import hash160, hash256, little_endian_to_int, decode_varint, decode_varint_after, int_to_little_endian, encode_varint, SIGHASH_ALL
+from src.Script import Script, verify_script, verify_p2wpkh, verify_p2wsh, p2pkh_script, MAX_STANDARD_TX_SIGOPS
+from src.ScriptClassifier import witness_program
+from src.ScriptExecutionCache import SCRIPT_EXECUTION_CACHE
 
+import hashlib
 import json
 import requests
 
+class HashingReader:
+    """Wraps a byte stream, feeding the bytes read through it to a sha256 while hashing is set"""
+    __slots__ = ('stream', 'sha', 'hashing')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha = hashlib.sha256()
+        self.hashing = True
+
+    def read(self, n: int) -> bytes:
+        data = self.stream.read(n)
+        if self.hashing:
+            self.sha.update(data)
+        return data
+
+    def double_sha256(self) -> bytes:
+        """Returns the hash256 of the bytes hashed so far"""
+        return hashlib.sha256(self.sha.digest()).digest()
+
+
 class Transaction:
     """Transaction class contains the contents of a transaction, which typically consists of the version, input, output, and locktime."""
+    __slots__ = ('version', 'tx_ins', 'tx_outs', 'locktime', 'testnet')
+
     def __init__(self, version, tx_ins, tx_outs, locktime, testnet=False):
         self.version = version
         self.tx_ins = tx_ins
@@ -30,14 +55,42 @@ class Transaction:
         return self.hash().hex()
 
     def hash(self) -> bytes:
-        """Returns a binary hash of the byte serialization of the transaction"""
+        """Returns a binary hash of the byte serialization of the transaction without witnesses"""
+        return hash256(self.serialize_legacy())[::-1]
+
+    def witness_hash(self) -> bytes:
+        """Returns a binary hash of the full byte serialization of the transaction, witnesses included"""
         return hash256(self.serialize_transaction())[::-1]
-    
+
+    def is_segwit(self) -> bool:
+        """Returns whether any input carries a witness"""
+        for tx_in in self.tx_ins:
+            if len(tx_in.witness) > 0:
+                return True
+        return False
+
     @classmethod
-    def parse_transaction(cls, byte_string: bytes, testnet: bool = False) -> Transaction:
-        """Returns a Transaction instance from an input byte stream"""
+    def parse_transaction(cls, byte_string: bytes, testnet: bool = False, reader: HashingReader = None) -> Transaction:
+        """Returns a Transaction instance from an input byte stream, in the legacy or the BIP144 segwit format.
+        When the stream is a HashingReader passed as reader too, the marker, flag and witnesses are left out of its hash"""
         version = little_endian_to_int(byte_string.read(4))
-        num_inputs = decode_varint(byte_string)
+        # a zero input count is the segwit marker, followed by the flag. Otherwise the byte starts the input
+        # count, so the stream is only read forward
+        if reader is not None:
+            reader.hashing = False
+        marker = byte_string.read(1)[0]
+        segwit = marker == 0
+        if segwit:
+            if byte_string.read(1) != b'\x01':
+                raise SyntaxError("bad segwit flag")
+            if reader is not None:
+                reader.hashing = True
+            num_inputs = decode_varint(byte_string)
+        else:
+            if reader is not None:
+                reader.hashing = True
+                reader.sha.update(bytes([marker]))
+            num_inputs = decode_varint_after(marker, byte_string)
         inputs = []
         for _ in range(num_inputs):
             inputs.append(TransactionInput.parse_transaction_input(byte_string))
@@ -45,11 +98,43 @@ class Transaction:
         outputs = []
         for _ in range(num_outputs):
             outputs.append(TransactionOutput.parse_transaction_output(byte_string))
+        if segwit:
+            if reader is not None:
+                reader.hashing = False
+            for tx_in in inputs:
+                tx_in.witness = TransactionInput.parse_witness(byte_string)
+            if reader is not None:
+                reader.hashing = True
         locktime = little_endian_to_int(byte_string.read(4))
         return Transaction(version, inputs, outputs, locktime, testnet=testnet)
-    
+
+    @classmethod
+    def parse_transaction_with_hash(cls, byte_string: bytes, testnet: bool = False) -> tuple:
+        """Returns (Transaction, txid) from a byte stream, hashing the bytes as they are parsed instead of
+        serializing the transaction again. The stream is only read forward"""
+        reader = HashingReader(byte_string)
+        tx = cls.parse_transaction(reader, testnet=testnet, reader=reader)
+        return tx, reader.double_sha256()[::-1]
+
     def serialize_transaction(self) -> bytes:
-        """Returns the byte serialization of the transaction"""
+        """Returns the byte serialization of the transaction, in the segwit format when any input has a witness"""
+        if not self.is_segwit():
+            return self.serialize_legacy()
+        result = int_to_little_endian(self.version, 4)
+        result += b'\x00\x01'
+        result += encode_varint(len(self.tx_ins))
+        for tx_in in self.tx_ins:
+            result += tx_in.serialize_transaction_input()
+        result += encode_varint(len(self.tx_outs))
+        for tx_out in self.tx_outs:
+            result += tx_out.serialize_transaction_output()
+        for tx_in in self.tx_ins:
+            result += tx_in.serialize_witness()
+        result += int_to_little_endian(self.locktime, 4)
+        return result
+
+    def serialize_legacy(self) -> bytes:
+        """Returns the byte serialization of the transaction without witnesses, the one its txid commits to"""
         result = int_to_little_endian(self.version, 4)
         result += encode_varint(len(self.tx_ins))
         for tx_in in self.tx_ins:
@@ -69,7 +154,9 @@ class Transaction:
             output_sum += tx_out.amount
         return input_sum - output_sum
     
-    def sig_hash(self, input_index):
+    def sig_hash(self, input_index, redeem_script=None):
+        """Returns the legacy SIGHASH_ALL sig_hash of an input. Its script code is the ScriptPubKey spent, or for
+        p2sh (BIP16) the RedeemScript, which has to be given"""
         s = int_to_little_endian(self.version, 4)
         s += encode_varint(len(self.tx_ins))
         for i, tx_in in enumerate(self.tx_ins):
@@ -77,7 +164,7 @@ class Transaction:
                 s += TransactionInput(
                     prev_tx=tx_in.prev_tx,
                     prev_index=tx_in.prev_index,
-                    script_sig=tx_in.script_pubkey(self.testnet),
+                    script_sig=redeem_script if redeem_script is not None else tx_in.script_pubkey(self.testnet),
                     sequence=tx_in.sequence,
                 ).serialize_transaction_input()
             else:
@@ -94,20 +181,134 @@ class Transaction:
         h256 = hash256(s)
         return int.from_bytes(h256, 'big')
     
-    def verify_input(self, input_index):
+    def hash_prevouts(self) -> bytes:
+        """Returns the BIP143 hash of every outpoint spent"""
+        return hash256(b''.join(tx_in.prev_tx[::-1] + int_to_little_endian(tx_in.prev_index, 4) for tx_in in self.tx_ins))
+
+    def hash_sequence(self) -> bytes:
+        """Returns the BIP143 hash of every input sequence"""
+        return hash256(b''.join(int_to_little_endian(tx_in.sequence, 4) for tx_in in self.tx_ins))
+
+    def hash_outputs(self) -> bytes:
+        """Returns the BIP143 hash of every serialized output"""
+        return hash256(b''.join(tx_out.serialize_transaction_output() for tx_out in self.tx_outs))
+
+    def bip143_hashes(self) -> tuple:
+        """Returns (hashPrevouts, hashSequence, hashOutputs), shared by the sig_hash of every witness input. Callers
+        computing several sig_hashes take them once and pass them on, they are stale as soon as the transaction changes"""
+        return self.hash_prevouts(), self.hash_sequence(), self.hash_outputs()
+
+    def sig_hash_bip143(self, input_index, script_code, bip143_hashes=None):
+        """Returns the BIP143 SIGHASH_ALL sig_hash of a witness input given its script code, computing the
+        bip143_hashes of the transaction as it is now unless given"""
+        if bip143_hashes is None:
+            bip143_hashes = self.bip143_hashes()
+        hash_prevouts, hash_sequence, hash_outputs = bip143_hashes
+        tx_in = self.tx_ins[input_index]
+        s = int_to_little_endian(self.version, 4)
+        s += hash_prevouts + hash_sequence
+        s += tx_in.prev_tx[::-1] + int_to_little_endian(tx_in.prev_index, 4)
+        s += script_code.serialize_script()
+        s += int_to_little_endian(tx_in.value(testnet=self.testnet), 8)
+        s += int_to_little_endian(tx_in.sequence, 4)
+        s += hash_outputs
+        s += int_to_little_endian(self.locktime, 4)
+        s += int_to_little_endian(SIGHASH_ALL, 4)
+        return int.from_bytes(hash256(s), 'big')
+
+    def verify_input(self, input_index, flags=0, batch=None, bip143_hashes=None):
+        """Verifies an input, skipping the script evaluation if it already validated under the same flags and witness.
+        With a SignatureBatch the result only holds once the batch verifies, so it is not cached. bip143_hashes
+        are the ones of the transaction as it is now, computed if needed when not given"""
         tx_in = self.tx_ins[input_index]
         script_pubkey = tx_in.script_pubkey(testnet=self.testnet)
-        z = self.sig_hash(input_index)
-        combined = [tx_in.script_sig] + [script_pubkey]
-        combined = Script(cmds = combined)
-        return combined.evaluate(z)
-    
+        key = SCRIPT_EXECUTION_CACHE.make_key(self.hash(), input_index, script_pubkey.serialize_script(), flags, tx_in.serialize_witness())
+        if SCRIPT_EXECUTION_CACHE.contains(key):
+            return True
+        if not self.verify_input_scripts(input_index, script_pubkey, batch, bip143_hashes):
+            return False
+        if batch is None:
+            SCRIPT_EXECUTION_CACHE.add(key)
+        return True
+
+    def verify_input_scripts(self, input_index, script_pubkey, batch=None, bip143_hashes=None):
+        """Runs the scripts of an input. Witness programs (BIP141), native or nested in p2sh, are verified against
+        their witness: version 0 with BIP143 sig_hashes. Native version 1 programs of 32 bytes are Taproot (BIP341),
+        which is not implemented, so they fail rather than pass unchecked. Versions no soft fork defines yet,
+        nested Taproot included, succeed as anyone can spend. Everything else is verified by verify_script against the legacy sig_hash"""
+        tx_in = self.tx_ins[input_index]
+        program = witness_program(script_pubkey.raw_serialize())
+        native = program is not None
+        if program is not None:
+            # a native witness program is spent with an empty ScriptSig
+            if len(tx_in.script_sig.raw_serialize()) != 0:
+                return False
+        elif script_pubkey.is_p2sh_script_pubkey():
+            cmds = tx_in.script_sig._decoded_or_none()
+            if cmds is not None and len(cmds) > 0 and type(cmds[-1]) == bytes:
+                program = witness_program(cmds[-1])
+            if program is not None:
+                # a nested witness program must be the only push of the ScriptSig
+                if len(cmds) != 1 or hash160(cmds[0]) != script_pubkey._decoded()[1]:
+                    return False
+        if program is None:
+            # witnesses are only allowed on witness programs
+            if len(tx_in.witness) > 0:
+                return False
+            # a p2sh input signs its RedeemScript, the last push of the ScriptSig
+            redeem_script = None
+            if script_pubkey.is_p2sh_script_pubkey() and tx_in.script_sig.is_push_only():
+                cmds = tx_in.script_sig._decoded()
+                if len(cmds) > 0 and type(cmds[-1]) == bytes:
+                    redeem_script = Script(raw=cmds[-1])
+            z = self.sig_hash(input_index, redeem_script)
+            return verify_script(tx_in.script_sig, script_pubkey, z, locktime=self.locktime, sequence=tx_in.sequence, version=self.version, batch=batch)
+        version, program = program
+        if native and version == 1 and len(program) == 32:
+            print("unsupported witness version: Taproot spends are not verified")
+            return False
+        if version != 0:
+            # left for future soft forks to define
+            return True
+        if len(program) == 20:
+            z = self.sig_hash_bip143(input_index, p2pkh_script(program), bip143_hashes)
+            return verify_p2wpkh(tx_in.witness, program, z, batch)
+        if len(program) != 32 or len(tx_in.witness) == 0:
+            return False
+        z = self.sig_hash_bip143(input_index, Script(raw=tx_in.witness[-1]), bip143_hashes)
+        return verify_p2wsh(tx_in.witness, program, z, locktime=self.locktime, sequence=tx_in.sequence, version=self.version, batch=batch)
+
+    def sig_op_count(self) -> int:
+        """Returns the signature operations of the ScriptSigs and ScriptPubKeys, plus the accurately counted
+        ones of the RedeemScripts of p2sh inputs"""
+        count = 0
+        for tx_in in self.tx_ins:
+            count += tx_in.script_sig.sig_op_count()
+        for tx_out in self.tx_outs:
+            count += tx_out.script_pubkey.sig_op_count()
+        if self.is_coinbase():
+            return count
+        for tx_in in self.tx_ins:
+            if not tx_in.script_pubkey(self.testnet).is_p2sh_script_pubkey():
+                continue
+            if not tx_in.script_sig.is_push_only():
+                continue
+            cmds = tx_in.script_sig._decoded()
+            if len(cmds) == 0 or type(cmds[-1]) != bytes:
+                continue
+            count += Script(raw=cmds[-1]).sig_op_count(accurate=True)
+        return count
+
     def verify(self):
-        """Verifies a transaction"""
+        """Verifies a transaction, rejecting it before any signature check when it has more than MAX_STANDARD_TX_SIGOPS"""
         if self.fee() < 0:
             return False
+        if self.sig_op_count() > MAX_STANDARD_TX_SIGOPS:
+            return False
+        # computed once for every witness input of this call
+        bip143_hashes = self.bip143_hashes() if self.is_segwit() else None
         for i in range(len(self.tx_ins)):
-            if not self.verify_input(i):
+            if not self.verify_input(i, bip143_hashes=bip143_hashes):
                 return False
         return True
     
@@ -134,12 +335,17 @@ class Transaction:
         """Returns the height of the transaction by reading it from a coinbase transaction as defined in BIP0034"""
         if not self.is_coinbase():
             return None
-        element = self.tx_ins[0].script_sig.cmds[0]
-        return little_endian_to_int(element)
+        # the height push comes first, whatever arbitrary bytes follow it
+        cmds = self.tx_ins[0].script_sig._decoded_prefix()
+        if len(cmds) == 0 or type(cmds[0]) != bytes:
+            return None
+        return little_endian_to_int(cmds[0])
 
 
 class TransactionInput:
-    def __init__(self, prev_tx, prev_index, script_sig=None, sequence=0xffffffff):
+    __slots__ = ('prev_tx', 'prev_index', 'script_sig', 'sequence', 'witness')
+
+    def __init__(self, prev_tx, prev_index, script_sig=None, sequence=0xffffffff, witness=None):
         self.prev_tx = prev_tx
         self.prev_index = prev_index
         if script_sig is None:
@@ -147,6 +353,11 @@ class TransactionInput:
         else:
             self.script_sig = script_sig
         self.sequence = sequence
+        # witness stack items as bytes, empty for inputs without a witness
+        if witness is None:
+            self.witness = []
+        else:
+            self.witness = witness
 
     def __repr__(self):
         return f"{self.prev_tx.hex()}:{self.prev_index}"
@@ -168,6 +379,21 @@ class TransactionInput:
         result += int_to_little_endian(self.sequence, 4)
         return result
     
+    @classmethod
+    def parse_witness(cls, byte_stream: bytes) -> list:
+        """Returns the witness items of an input given a byte stream"""
+        items = []
+        for _ in range(decode_varint(byte_stream)):
+            items.append(byte_stream.read(decode_varint(byte_stream)))
+        return items
+
+    def serialize_witness(self) -> bytes:
+        """Returns the byte serialization of the witness of the input"""
+        result = encode_varint(len(self.witness))
+        for item in self.witness:
+            result += encode_varint(len(item)) + item
+        return result
+
     def fetch_transaction(self, testnet=False) -> TransactionFetcher:
         """Fetches the transaction from the testnet"""
         return TransactionFetcher.fetch(self.prev_tx.hex(), testnet=testnet)
@@ -184,6 +410,11 @@ class TransactionInput:
 
 
 class TransactionOutput:
+    __slots__ = ('amount', 'script_pubkey')
+
+    # set to a ScriptInternTable to share one Script object between outputs paying to the same ScriptPubKey
+    script_intern_table = None
+
     def __init__(self, amount, script_pubkey):
         self.amount = amount
         self.script_pubkey = script_pubkey
@@ -195,7 +426,7 @@ class TransactionOutput:
     def parse_transaction_output(cls, byte_stream: bytes) -> TransactionOutput:
         """Returns a TransactionOutput instance given a byte stream"""
         amount = little_endian_to_int(byte_stream.read(8))
-        script_pubkey = Script.parse_script(byte_stream)
+        script_pubkey = Script.parse_script(byte_stream, cls.script_intern_table)
         return cls(amount, script_pubkey)
     
     def serialize_transaction_output(self) -> bytes:
@@ -224,12 +455,7 @@ class TransactionFetcher:
                 raw = bytes.fromhex(response.text.strip())
             except ValueError:
                 raise ValueError('unexpected response: {}'.format(response.text))
-            if raw[4] == 0:
-                raw = raw[:4] + raw[6:]
-                tx = Transaction.parse_transaction(BytesIO(raw), testnet=testnet)
-                tx.locktime = little_endian_to_int(raw[-4:])
-            else:
-                tx = Transaction.parse_transaction(BytesIO(raw), testnet=testnet)
+            tx = Transaction.parse_transaction(BytesIO(raw), testnet=testnet)
             if tx.id() != tx_id:
                 raise ValueError(f"not the same id: {tx.id()} vs {tx_id}")
             cls.cache[tx_id] = tx
@@ -241,13 +467,7 @@ class TransactionFetcher:
         disk_cache = json.loads(open(filename, 'r').read())
         for k, raw_hex in disk_cache.items():
             raw = bytes.fromhex(raw_hex)
-            if raw[4] == 0:
-                raw = raw[:4] + raw[6:]
-                tx = Transaction.parse_transaction(BytesIO(raw))
-                tx.locktime = little_endian_to_int(raw[-4:])
-            else:
-                tx = Transaction.parse_transaction(BytesIO(raw))
-            cls.cache[k] = tx
+            cls.cache[k] = Transaction.parse_transaction(BytesIO(raw))
 
     @classmethod
     def dump_cache(cls, filename):
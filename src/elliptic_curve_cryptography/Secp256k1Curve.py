@@ -87,7 +87,7 @@ class Secp256k1Point(EllipticCurvePoint):
         else: # compressed sec format
             x = Secp256k1Element(int.from_bytes(byte_stream[1:], 'big'))
             # solving for y in the equation y^2 = x^3 + 7
-            right_side = x**3 + Secp256k1Element(CONSTANT_B)
+            right_side = Secp256k1Element((x**3 + Secp256k1Element(CONSTANT_B)).num)
             left_side = right_side.sqrt()
             if left_side.num % 2 == 0:
                 even_beta = left_side
@@ -1,3 +1,5 @@
+from src.MerkleEngine import compute_merkle_root
+
 import hashlib
 
 CONSTANT_A = 0
@@ -11,6 +13,10 @@ SIGHASH_ALL = 1
 SIGHASH_NONE = 2
 SIGHASH_SINGLE = 3
 BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BECH32_ALPHABET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+# checksum constants of bech32 (BIP173, witness version 0) and bech32m (BIP350, version 1 and up)
+BECH32_CONSTANT = 1
+BECH32M_CONSTANT = 0x2bc830a3
 
 def hash160(input) -> bytes:
     """Runs a sha256 hash followed by a ripemd160 hash on the input"""
@@ -60,7 +66,10 @@ def int_to_little_endian(n: int, length: int) -> bytes:
 
 def decode_varint(byte_string: bytes) -> int:
     """Decodes a byte stream into a variable integer"""
-    i = byte_string.read(1)[0]
+    return decode_varint_after(byte_string.read(1)[0], byte_string)
+
+def decode_varint_after(i: int, byte_string: bytes) -> int:
+    """Decodes a variable integer whose first byte i was already read from the byte stream"""
     if i < 0xfd:
         return i
     if i == 0xfd:
@@ -130,28 +139,60 @@ def hash160_to_p2sh_address(hash160, testnet=False):
         prefix = b'\x05'
     return encode_base58_checksum(prefix + hash160)
 
+def bech32_polymod(values) -> int:
+    """Computes the BCH checksum polynomial of bech32 over a sequence of 5 bit values"""
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            if (top >> i) & 1:
+                checksum ^= generator[i]
+    return checksum
+
+def encode_bech32(hrp: str, data: list, constant: int = BECH32_CONSTANT) -> str:
+    """Encodes 5 bit values with a human readable part into a bech32 (or bech32m) string"""
+    expanded_hrp = [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+    polymod = bech32_polymod(expanded_hrp + data + [0] * 6) ^ constant
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(BECH32_ALPHABET[value] for value in data + checksum)
+
+def witness_program_to_segwit_address(program: bytes, witness_version: int = 0, testnet=False) -> str:
+    """Takes a witness program and returns the bech32 (version 0) or bech32m (version 1 and up) address string"""
+    # regroup the 8 bit program into 5 bit values, padding the last one with zeros
+    data = [witness_version]
+    accumulator, bits = 0, 0
+    for byte in program:
+        accumulator = (accumulator << 8) | byte
+        bits += 8
+        while bits >= 5:
+            bits -= 5
+            data.append((accumulator >> bits) & 31)
+    if bits:
+        data.append((accumulator << (5 - bits)) & 31)
+    hrp = 'tb' if testnet else 'bc'
+    constant = BECH32_CONSTANT if witness_version == 0 else BECH32M_CONSTANT
+    return encode_bech32(hrp, data, constant)
+
 def merkle_parent(hash1, hash2) -> bytes:
     """Takes the binary hashes and calculates the hash256"""
     return hash256(hash1 + hash2)
 
 def merkle_parent_level(hashes):
-    """Takes a list of binary hashes and returns a list that's half the length"""
+    """Takes a list of binary hashes and returns a list that's half the length, pairing an odd last hash with itself"""
     if len(hashes) == 1:
         raise RuntimeError('Cannot take a parent level with only 1 item')
-    if len(hashes) % 2 == 1:
-        hashes.append(hashes[-1])
     parent_level = []
-    for i in range(0, len(hashes), 2):
-        parent = merkle_parent(hashes[i], hashes[i + 1])
-        parent_level.append(parent)
+    for i in range(0, len(hashes) - 1, 2):
+        parent_level.append(merkle_parent(hashes[i], hashes[i + 1]))
+    if len(hashes) % 2 == 1:
+        parent_level.append(merkle_parent(hashes[-1], hashes[-1]))
     return parent_level
 
 def merkle_root(hashes):
-    """Takes a list of binary hashes and returns the merkle root"""
-    current_level = hashes
-    while len(current_level) > 1:
-        current_level = merkle_parent_level(current_level)
-    return current_level[0]
+    """Takes a list of binary hashes and returns the merkle root, raises ValueError for an empty list"""
+    return compute_merkle_root(hashes)[0]
 
 def bit_field_to_bytes(bit_field):
     if len(bit_field) % 8 != 0:
@@ -1,5 +1,9 @@
 from src.Block import Block
+from src.Transaction import Transaction, TransactionInput, TransactionOutput
+from src.Script import Script
+from src.utils import encode_varint, hash256, merkle_root
 from io import BytesIO
+from tests.TestTransaction import ForwardReader
 
 import unittest
 
@@ -30,6 +34,25 @@ class BlockTest(unittest.TestCase):
         block = Block.parse_block(stream)
         self.assertEqual(block.hash_block(), bytes.fromhex('0000000000000000007e9e4c586439b0cdbe13b1370bdd9435d76a644d047523'))
 
+    def test_cached_header(self):
+        raw = bytes.fromhex('020000208ec39428b17323fa0ddec8e887b4a7c53b8c0a0a220cfd0000000000000000005b0750fce0a889502d40508d39576821155e9c9e3f5c3157f961db38fd8b25be1e77a759e93c0118a4ffd71d')
+        block = Block.parse_block(BytesIO(raw))
+        self.assertIs(block.serialize_block_header(), block.serialize_block_header())
+        want = hash256(raw)[::-1]
+        self.assertEqual(block.hash_block(), want)
+        self.assertIs(block.hash_block(), block.hash_block())
+        # assigning a header field drops the cached bytes and hash
+        block.nonce = b'\x00' * 4
+        changed = raw[:76] + b'\x00' * 4
+        self.assertEqual(block.serialize_block_header(), changed)
+        self.assertEqual(block.hash_block(), hash256(changed)[::-1])
+        block.nonce = raw[76:]
+        self.assertEqual(block.hash_block(), want)
+        self.assertTrue(block.check_pow())
+        # other attributes leave the cache alone
+        block.tx_hashes = []
+        self.assertIs(block.hash_block(), block.hash_block())
+
     def test_bip9(self):
         block_raw = bytes.fromhex('020000208ec39428b17323fa0ddec8e887b4a7c53b8c0a0a220cfd0000000000000000005b0750fce0a889502d40508d39576821155e9c9e3f5c3157f961db38fd8b25be1e77a759e93c0118a4ffd71d')
         stream = BytesIO(block_raw)
@@ -104,5 +127,45 @@ class BlockTest(unittest.TestCase):
         block.tx_hashes = hashes
         self.assertTrue(block.validate_merkle_root())
 
+    def test_parse_full_block(self):
+        genesis_raw = bytes.fromhex('0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c0101000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000')
+        block = Block.parse_full_block(BytesIO(genesis_raw))
+        self.assertEqual(block.hash_block(), bytes.fromhex('000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f'))
+        self.assertEqual(len(block.transactions), 1)
+        self.assertTrue(block.transactions[0].is_coinbase())
+        self.assertEqual(block.tx_hashes, [bytes.fromhex('4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b')])
+        self.assertIs(block.transaction_hashes, block.tx_hashes)
+        block.transaction_hashes = list(block.tx_hashes)
+        self.assertTrue(block.validate_merkle_root())
+        self.assertEqual(Block(1, bytes(32), bytes(32), 0, bytes(4), bytes(4), [bytes(32)]).transaction_hashes, [bytes(32)])
+        self.assertTrue(block.validate_merkle_root())
+
+    def test_iter_transactions(self):
+        segwit_raw = bytes.fromhex('01000000000102fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f00000000494830450221008b9d1dc26ba6a9cb62127b02742fa9d754cd3bebf337f7a55d114c8e5cdd30be022040529b194ba3f9281a99f2b1c0a19c0489bc22ede944ccf4ecbab4cc618ef3ed01eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac000247304402203609e17b84f6a7d30c80bfa610b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c4518331561406f90300e8f3358f51928d43c212a8caed02de67eebee0121025476c2e83188368da1ff3e292e7acafcdb3566bb0ad253f62fc70f07aeee635711000000')
+        txs = [Transaction(1, [TransactionInput(bytes([i]) * 32, i, Script([b'input'] * i))], [TransactionOutput(i, Script([0x51]))], i) for i in range(4)]
+        txs.insert(2, Transaction.parse_transaction(BytesIO(segwit_raw)))
+        root = merkle_root([tx.hash()[::-1] for tx in txs])[::-1]
+        header = Block(0x20000000, b'\x00' * 32, root, 0x59a7771e, bytes.fromhex('e93c0118'), b'\x00' * 4)
+        raw = header.serialize_block_header() + encode_varint(len(txs)) + b''.join(tx.serialize_transaction() for tx in txs)
+        stream = BytesIO(raw)
+        block = Block.parse_block(stream)
+        seen = []
+        for tx in block.iter_transactions(stream):
+            # each txid is known as soon as its transaction is yielded
+            self.assertEqual(block.tx_hashes[-1], tx.hash())
+            seen.append(tx.serialize_transaction())
+        self.assertEqual(seen, [tx.serialize_transaction() for tx in txs])
+        self.assertEqual(stream.read(), b'')
+        self.assertTrue(block.validate_merkle_root())
+        # a stream that cannot seek, such as a socket, works as well
+        block = Block.parse_full_block(ForwardReader(raw))
+        self.assertTrue(block.validate_merkle_root())
+        # the txids are also kept in the byte order they were hashed in, for the merkle root
+        self.assertEqual(block._leaves, [h[::-1] for h in block.tx_hashes])
+        tx_hashes = list(block.tx_hashes)
+        tx_hashes[1], tx_hashes[2] = tx_hashes[2], tx_hashes[1]
+        block.tx_hashes = tx_hashes
+        self.assertFalse(block.validate_merkle_root())
+
 if __name__ == "__main__":
     unittest.main()
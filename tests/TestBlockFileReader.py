@@ -0,0 +1,78 @@
+from src.BlockFileReader import *
+
+import tempfile
+import unittest
+
+GENESIS = bytes.fromhex('0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c0101000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000')
+
+def next_block(raw, nonce):
+    """Returns a block on top of raw carrying the genesis coinbase again"""
+    header = Block(1, hash256(raw[:80])[::-1], GENESIS[36:68][::-1], 1231006505 + nonce, bytes.fromhex('ffff001d'), nonce.to_bytes(4, 'little'))
+    return header.serialize_block_header() + GENESIS[80:]
+
+def framed(raw):
+    return NETWORK_MAGIC + len(raw).to_bytes(4, 'little') + raw
+
+class BlockFileReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.blocks = [GENESIS]
+        for nonce in range(1, 4):
+            self.blocks.append(next_block(self.blocks[-1], nonce))
+        self.hashes = [hash256(raw[:80])[::-1] for raw in self.blocks]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data, key=None):
+        if key is not None:
+            data = bytes(b ^ key[i % len(key)] for i, b in enumerate(data))
+        with open(os.path.join(self.directory.name, name), 'wb') as f:
+            f.write(data)
+
+    def check(self, reader):
+        self.assertEqual(len(reader), 4)
+        self.assertEqual(reader.raw_block(self.hashes[2]), self.blocks[2])
+        self.assertEqual(reader.header(self.hashes[3]).hash_block(), self.hashes[3])
+        block = reader.block(self.hashes[0])
+        self.assertEqual(block.hash_block(), bytes.fromhex('000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f'))
+        self.assertTrue(block.validate_merkle_root())
+        self.assertEqual(len(list(reader.iter_transactions(self.hashes[1]))), 1)
+        self.assertEqual([b.hash_block() for b in reader.blocks()], self.hashes)
+
+    def test_read(self):
+        # Bitcoin Core preallocates block files with zeros
+        self.write('blk00000.dat', framed(self.blocks[0]) + framed(self.blocks[1]) + bytes(1000))
+        self.write('blk00001.dat', framed(self.blocks[2]) + framed(self.blocks[3]))
+        with BlockFileReader(self.directory.name) as reader:
+            self.check(reader)
+            self.assertEqual(reader.index[self.hashes[2]], ('blk00001.dat', 8, len(self.blocks[2])))
+            with self.assertRaises(KeyError):
+                reader.raw_block(bytes(32))
+
+    def test_persistent_index(self):
+        index_path = os.path.join(self.directory.name, 'index.json')
+        self.write('blk00000.dat', framed(self.blocks[0]) + framed(self.blocks[1]))
+        with BlockFileReader(self.directory.name, index_path=index_path) as reader:
+            self.assertEqual(len(reader), 2)
+        # a block being written is not indexed until it is complete
+        self.write('blk00000.dat', framed(self.blocks[0]) + framed(self.blocks[1]) + framed(self.blocks[2])[:100])
+        with BlockFileReader(self.directory.name, index_path=index_path) as reader:
+            self.assertEqual(len(reader), 2)
+            self.write('blk00000.dat', framed(self.blocks[0]) + framed(self.blocks[1]) + framed(self.blocks[2]) + framed(self.blocks[3]))
+            self.assertEqual(reader.update(), 2)
+            self.check(reader)
+        with BlockFileReader(self.directory.name, index_path=index_path) as reader:
+            self.assertEqual(reader.update(), 0)
+            self.check(reader)
+
+    def test_xor(self):
+        key = bytes.fromhex('0123456789abcdef')
+        self.write('xor.dat', key)
+        self.write('blk00000.dat', framed(self.blocks[0]) + framed(self.blocks[1]) + framed(self.blocks[2]) + framed(self.blocks[3]), key)
+        with BlockFileReader(self.directory.name) as reader:
+            self.check(reader)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from src.BlockIndex import *
+from io import BytesIO
+
+import unittest
+
+GENESIS = bytes.fromhex('0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c')
+EASY_BITS = bytes.fromhex('ffff001d')
+HARD_BITS = bytes.fromhex('ffff001c')
+
+def child(parent, branch=0, bits=EASY_BITS):
+    """Returns a header on top of parent, branch tells apart siblings"""
+    return Block(1, parent.hash_block(), bytes(32), parent.timestamp + 600, bits, branch.to_bytes(4, 'little'))
+
+def branch_of(parent, count, branch=0, bits=EASY_BITS):
+    headers = []
+    for _ in range(count):
+        parent = child(parent, branch, bits)
+        headers.append(parent)
+    return headers
+
+class BlockIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.genesis = Block.parse_block(BytesIO(GENESIS))
+        self.index = BlockIndex(self.genesis)
+
+    def test_work(self):
+        self.assertEqual(block_work(EASY_BITS), 0x100010001)
+        self.assertEqual(self.index.genesis.chainwork, 0x100010001)
+        entry = self.index.add(child(self.genesis))
+        self.assertEqual(entry.height, 1)
+        self.assertEqual(entry.chainwork, 2 * 0x100010001)
+
+    def test_skip_height(self):
+        self.assertEqual([skip_height(h) for h in range(10)], [0, 0, 0, 1, 0, 1, 4, 1, 0, 1])
+
+    def test_ancestor(self):
+        entries = [self.index.genesis] + [self.index.add(h) for h in branch_of(self.genesis, 1000)]
+        tip = entries[-1]
+        for height in (0, 1, 2, 511, 512, 513, 999, 1000):
+            self.assertIs(tip.ancestor(height), entries[height])
+        self.assertIsNone(tip.ancestor(1001))
+        self.assertIsNone(tip.ancestor(-1))
+
+    def test_tip_selection(self):
+        main = [self.index.add(h) for h in branch_of(self.genesis, 5)]
+        self.assertIs(self.index.tip, main[-1])
+        # a branch of the same length and work does not win the tie
+        stale = [self.index.add(h) for h in branch_of(main[1].header, 3, branch=1)]
+        self.assertIs(self.index.tip, main[-1])
+        # one block of 256 times the work outweighs the rest of the main branch
+        heavy = self.index.add(child(stale[0].header, branch=2, bits=HARD_BITS))
+        self.assertIs(self.index.tip, heavy)
+        self.assertEqual(len(self.index), 10)
+
+    def test_unknown_parent(self):
+        orphan = child(child(self.genesis))
+        with self.assertRaises(ValueError):
+            self.index.add(orphan)
+
+    def test_reorg(self):
+        main = [self.index.add(h) for h in branch_of(self.genesis, 300)]
+        fork = main[250]
+        side = [self.index.add(h) for h in branch_of(fork.header, 60, branch=1)]
+        self.assertIs(self.index.tip, side[-1])
+        self.assertIs(self.index.fork_point(main[-1], side[-1]), fork)
+        point, disconnect, connect = self.index.reorg(main[-1], side[-1])
+        self.assertIs(point, fork)
+        self.assertEqual(disconnect, main[:250:-1])
+        self.assertEqual(connect, side)
+        # a tip on the same branch only connects
+        self.assertEqual(self.index.reorg(main[10], main[12]), (main[10], [], main[11:13]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+from src.HeaderChainValidator import *
+from src.Block import Block
+from src.utils import hash256, target_to_bits
+from io import BytesIO
+
+import os
+import tempfile
+import unittest
+
+REGTEST_BITS = bytes.fromhex('ffff7f20')
+
+def mine(prev_hash, timestamp, bits=REGTEST_BITS, start_nonce=0):
+    """Returns the first serialized header from start_nonce on with a hash below the target of bits"""
+    target = bits_to_target(bits)
+    nonce = start_nonce
+    while True:
+        raw = (b'\x01\x00\x00\x00' + prev_hash[::-1] + bytes(32) + timestamp.to_bytes(4, 'little') + bits
+               + nonce.to_bytes(4, 'little'))
+        if int.from_bytes(hash256(raw), 'little') < target:
+            return raw
+        nonce += 1
+
+def extend(prev_hash, count, timestamp, bits=REGTEST_BITS):
+    """Returns count mined headers following prev_hash, 600 seconds apart"""
+    raws = []
+    for i in range(count):
+        raws.append(mine(prev_hash, timestamp + i * 600, bits))
+        prev_hash = hash256(raws[-1])[::-1]
+    return raws
+
+class HeaderChainValidatorTest(unittest.TestCase):
+
+    def validator(self, height=0):
+        genesis = mine(bytes(32), 1296688602)
+        return HeaderChainValidator(height, hash256(genesis)[::-1], REGTEST_BITS, [1296688602], 1296688602, REGTEST_BITS)
+
+    def test_valid(self):
+        validator = self.validator()
+        raws = extend(validator.tip_hash, 30, 1296689202)
+        self.assertIsNone(validator.validate(b''.join(raws[:20])))
+        self.assertIsNone(validator.validate([Block.parse_block(BytesIO(raw)) for raw in raws[20:]]))
+        self.assertIsNone(validator.reason)
+        self.assertEqual(validator.height, 30)
+        self.assertEqual(validator.tip_hash, hash256(raws[-1])[::-1])
+
+    def test_workers(self):
+        validator = self.validator()
+        raws = extend(validator.tip_hash, 10, 1296689202)
+        self.assertIsNone(validator.validate(b''.join(raws), workers=2))
+        self.assertEqual(validator.height, 10)
+
+    def test_linkage(self):
+        validator = self.validator()
+        raws = extend(validator.tip_hash, 5, 1296689202)
+        self.assertEqual(validator.validate(b''.join(raws[:2] + raws[3:])), 2)
+        self.assertIn('prev_block', validator.reason)
+        # the valid prefix was accepted
+        self.assertEqual(validator.height, 2)
+        self.assertIsNone(validator.validate(b''.join(raws[2:])))
+
+    def test_proof_of_work(self):
+        validator = self.validator()
+        raw = mine(validator.tip_hash, 1296689202)
+        nonce = int.from_bytes(raw[76:], 'little')
+        # the next nonces without enough work
+        while True:
+            nonce += 1
+            bad = raw[:76] + nonce.to_bytes(4, 'little')
+            if int.from_bytes(hash256(bad), 'little') >= bits_to_target(REGTEST_BITS):
+                break
+        self.assertEqual(validator.validate(bad), 0)
+        self.assertEqual(validator.reason, 'hash above the target')
+
+    def test_bits(self):
+        validator = self.validator()
+        raw = mine(validator.tip_hash, 1296689202, bytes.fromhex('ffff3f20'))
+        self.assertEqual(validator.validate(raw), 0)
+        self.assertIn('bits', validator.reason)
+
+    def test_retarget(self):
+        # the tip is the last block of a period mined in a week, half the expected time
+        validator = self.validator(RETARGET_INTERVAL - 1)
+        validator.period_start_time = validator.timestamps[-1] - 7 * 24 * 60 * 60
+        new_bits = target_to_bits(bits_to_target(REGTEST_BITS) // 2)
+        self.assertEqual(validator.validate(mine(validator.tip_hash, 1296689202)), 0)
+        self.assertIn('bits', validator.reason)
+        self.assertIsNone(validator.validate(b''.join(extend(validator.tip_hash, 2, 1296689202, new_bits))))
+        self.assertEqual(validator.period_start_time, 1296689202)
+        self.assertEqual(validator.bits, new_bits)
+
+    def test_retarget_pow_limit(self):
+        # a period mined in four weeks at the minimum difficulty keeps it rather than going easier
+        validator = self.validator(RETARGET_INTERVAL - 1)
+        validator.period_start_time = validator.timestamps[-1] - 28 * 24 * 60 * 60
+        self.assertEqual(validator.expected_bits(RETARGET_INTERVAL), REGTEST_BITS)
+        self.assertIsNone(validator.validate(mine(validator.tip_hash, 1296689202)))
+        self.assertEqual(validator.bits, REGTEST_BITS)
+        # mainnet header 2016 keeps the genesis difficulty, the first period took longer than two weeks
+        validator = HeaderChainValidator(RETARGET_INTERVAL - 1, bytes(32), MAINNET_POW_LIMIT_BITS, [1233061996], 1231006505)
+        self.assertEqual(validator.expected_bits(RETARGET_INTERVAL), MAINNET_POW_LIMIT_BITS)
+        self.assertNotEqual(calculate_new_bits(MAINNET_POW_LIMIT_BITS, 1233061996 - 1231006505), MAINNET_POW_LIMIT_BITS)
+
+    def test_headers_message(self):
+        validator = self.validator()
+        raws = extend(validator.tip_hash, 5, 1296689202)
+        message = HeadersMessage([Block.parse_block(BytesIO(raw)) for raw in raws])
+        self.assertIsNone(validator.validate(message))
+        self.assertEqual(validator.tip_hash, hash256(raws[-1])[::-1])
+
+    def test_median_time_past(self):
+        validator = self.validator()
+        raws = extend(validator.tip_hash, 11, 1296689202)
+        self.assertIsNone(validator.validate(b''.join(raws)))
+        self.assertEqual(validator.median_time_past(), 1296689202 + 5 * 600)
+        raw = mine(validator.tip_hash, 1296689202 + 5 * 600)
+        self.assertEqual(validator.validate(raw), 0)
+        self.assertIn('median', validator.reason)
+        self.assertIsNone(validator.validate(mine(validator.tip_hash, 1296689202 + 5 * 600 + 1)))
+
+    def test_from_store(self):
+        raws = extend(bytes(32), 15, 1296688602)
+        with tempfile.TemporaryDirectory() as directory:
+            with HeaderStore(os.path.join(directory, 'headers.dat')) as store:
+                store.extend(raws[:12])
+                validator = HeaderChainValidator.from_store(store)
+                self.assertEqual(validator.height, 11)
+                self.assertEqual(len(validator.timestamps), MEDIAN_TIME_SPAN)
+                self.assertEqual(validator.period_start_time, 1296688602)
+                self.assertIsNone(validator.validate(b''.join(raws[12:])))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from src.HeaderStore import *
+
+import os
+import tempfile
+import unittest
+
+GENESIS = bytes.fromhex('0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c')
+
+def chain(count):
+    """Returns count linked headers starting with the genesis header"""
+    headers = [Block.parse_block(BytesIO(GENESIS))]
+    for i in range(1, count):
+        headers.append(Block(1, headers[-1].hash_block(), hash256(i.to_bytes(4, 'little')), 1231006505 + i * 600,
+                             bytes.fromhex('ffff001d'), i.to_bytes(4, 'little')))
+    return headers
+
+class HeaderStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'headers.dat')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_append(self):
+        headers = chain(10)
+        with HeaderStore(self.path) as store:
+            self.assertIsNone(store.tip())
+            self.assertEqual(store.append(headers[0]), 0)
+            self.assertEqual(store.extend(headers[1:]), 9)
+            self.assertEqual(len(store), 10)
+            self.assertEqual(store.raw_header(0), GENESIS)
+            self.assertEqual(store.hash_at(0).hex(), '000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f')
+            self.assertEqual(store[5].serialize_block_header(), headers[5].serialize_block_header())
+            self.assertEqual(store.tip().hash_block(), headers[9].hash_block())
+            with self.assertRaises(IndexError):
+                store[10]
+        self.assertEqual(os.path.getsize(self.path), 800)
+
+    def test_reopen(self):
+        headers = chain(20)
+        with HeaderStore(self.path) as store:
+            store.extend(headers[:15])
+        with HeaderStore(self.path) as store:
+            self.assertEqual(len(store), 15)
+            self.assertEqual(store.height_of(headers[7].hash_block()), 7)
+            # appends after the index is built are indexed too
+            store.extend(headers[15:])
+            self.assertEqual(store.height_of(headers[19].hash_block()), 19)
+            self.assertEqual(store[-1].hash_block(), headers[19].hash_block())
+            self.assertIn(headers[0].hash_block(), store)
+            self.assertNotIn(b'\x00' * 32, store)
+
+    def test_saved_index(self):
+        headers = chain(30)
+        with HeaderStore(self.path) as store:
+            store.extend(headers[:10])
+            self.assertEqual(store.height_of(headers[3].hash_block()), 3)
+            store.extend(headers[10:20])
+        self.assertTrue(os.path.exists(self.path + INDEX_SUFFIX))
+        with HeaderStore(self.path) as store:
+            store.extend(headers[20:25])
+            # the saved index covers 20 headers, only the 5 appended since are hashed
+            index, last_hash = HeaderIndex.load(store.index_path)
+            self.assertEqual(len(index), 20)
+            self.assertEqual(last_hash, headers[19].hash_block())
+            for height in (0, 19, 24):
+                self.assertEqual(store.height_of(headers[height].hash_block()), height)
+            self.assertEqual(len(store.index), 25)
+        # an index that does not match the headers on disk is rebuilt
+        with open(self.path, 'r+b') as f:
+            f.truncate(5 * HEADER_SIZE)
+        with HeaderStore(self.path) as store:
+            self.assertEqual(store.height_of(headers[4].hash_block()), 4)
+            self.assertIsNone(store.height_of(headers[20].hash_block()))
+            store.extend(headers[5:8])
+        with open(self.path + INDEX_SUFFIX, 'r+b') as f:
+            f.truncate(40)
+        with HeaderStore(self.path) as store:
+            self.assertEqual(store.height_of(headers[7].hash_block()), 7)
+
+    def test_bad_headers(self):
+        headers = chain(3)
+        with HeaderStore(self.path) as store:
+            store.append(headers[0])
+            with self.assertRaises(ValueError):
+                store.extend([headers[1], headers[0]])
+            with self.assertRaises(ValueError):
+                store.append(b'\x00' * 79)
+            self.assertEqual(len(store), 1)
+        # a torn header at the end of the file is dropped
+        with open(self.path, 'ab') as f:
+            f.write(headers[1].serialize_block_header()[:40])
+        with HeaderStore(self.path) as store:
+            self.assertEqual(len(store), 1)
+            self.assertEqual(store.append(headers[1]), 1)
+
+class HeaderIndexTest(unittest.TestCase):
+
+    def test_grow(self):
+        index = HeaderIndex()
+        hashes = [hash256(i.to_bytes(4, 'little')) for i in range(5000)]
+        for height, h in enumerate(hashes):
+            index.insert(h, height)
+        self.assertEqual(len(index), 5000)
+        self.assertGreaterEqual(len(index.keys), 10000)
+        self.assertEqual(index.values.typecode, 'q')
+        for height in (0, 1234, 4999):
+            self.assertIn(height, list(index.candidates(hashes[height])))
+
+if __name__ == '__main__':
+    unittest.main()
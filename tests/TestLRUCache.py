@@ -0,0 +1,69 @@
+from src.LRUCache import *
+
+import threading
+import unittest
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_put(self):
+        cache = LRUCache(4)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b', 2), 2)
+        self.assertTrue(cache.touch('a'))
+        self.assertFalse(cache.touch('b'))
+        self.assertIn('a', cache)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(cache.hit_rate(), 0.4)
+        self.assertEqual(repr(cache), 'LRUCache(1/4 entries, hit rate 40.00%)')
+
+    def test_eviction(self):
+        evicted = []
+
+        class RecordingCache(LRUCache):
+            def _evicted(self, key):
+                evicted.append(key)
+
+        cache = RecordingCache(2)
+        cache.put('a')
+        cache.put('b')
+        # touching the first entry makes the second the least recently used
+        self.assertTrue(cache.touch('a'))
+        cache.put('c')
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(evicted, ['b'])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.put('a')
+        self.assertEqual(len(cache), 0)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.put('a')
+        cache.touch('a')
+        cache.clear()
+        self.assertEqual(cache.stats(), {'entries': 0, 'max_entries': 2, 'hits': 0, 'misses': 0, 'evictions': 0, 'hit_rate': 0.0})
+
+    def test_threads(self):
+        cache = LRUCache(100)
+
+        def work(offset):
+            for i in range(offset, offset + 2000):
+                cache.put(i)
+                cache.touch(i - 50)
+
+        threads = [threading.Thread(target=work, args=(i * 2000,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cache), 100)
+        self.assertEqual(cache.evictions, 8000 - 100)
+        self.assertEqual(cache.hits + cache.misses, 8000)
+
+if __name__ == '__main__':
+    unittest.main()
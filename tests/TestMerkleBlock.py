@@ -1,8 +1,16 @@
 from src.MerkleBlock import *
+from src.Block import Block
+from src.utils import hash256, merkle_root
 from io import BytesIO
 
 import unittest
 
+def block_of(total):
+    """Returns a block header with total made up txids"""
+    txids = [hash256(i.to_bytes(4, 'little')) for i in range(total)]
+    root = merkle_root([h[::-1] for h in txids])[::-1]
+    return Block(0x20000000, b'\x00' * 32, root, 1231006505, bytes.fromhex('ffff001d'), b'\x00' * 4, txids)
+
 class MerkleTreeTest(unittest.TestCase):
 
     def test_init(self):
@@ -52,6 +60,41 @@ class MerkleTreeTest(unittest.TestCase):
         root = 'a8e8bd023169b81bc56854137a135b97ef47a6a7237f4c6e037baed16285a5ab'
         self.assertEqual(tree.root().hex(), root)
 
+    def test_populate_tree_flag_bytes(self):
+        hashes = [hash256(i.to_bytes(4, 'little')) for i in range(5)]
+        want = merkle_root(hashes)
+        # 11 set bits, read least significant bit first
+        tree = MerkleTree(5)
+        tree.populate_tree(bytes([0xff, 0x07]), hashes)
+        self.assertEqual(tree.root(), want)
+        self.assertEqual(len(hashes), 5)
+        with self.assertRaises(RuntimeError):
+            MerkleTree(5).populate_tree(bytes([0xff, 0x0f]), hashes)
+        with self.assertRaises(RuntimeError):
+            MerkleTree(5).populate_tree(bytes([0xff, 0x07]), hashes + hashes[:1])
+        with self.assertRaises(RuntimeError):
+            MerkleTree(5).populate_tree(bytes([0xff]), hashes)
+
+class SparseMerkleTreeTest(unittest.TestCase):
+
+    def test_init(self):
+        tree = SparseMerkleTree(9)
+        self.assertEqual([len(level) for level in tree.nodes], [1, 2, 3, 5, 9])
+        self.assertEqual(tree.node_count(), 0)
+
+    def test_populate_tree(self):
+        total = 4000
+        block = block_of(total)
+        txids = block.tx_hashes
+        root = block.merkle_root
+        mb = MerkleProofBuilder(block).merkle_block([txids[5], txids[3000]])
+        tree = SparseMerkleTree(total)
+        tree.populate_tree(mb.flags, [h[::-1] for h in mb.hashes])
+        self.assertEqual(tree.root()[::-1], root)
+        # the visited nodes only: the proof hashes plus the parents computed along the two paths
+        self.assertLess(tree.node_count(), 3 * len(mb.hashes))
+        self.assertTrue(mb.is_valid())
+
 class MerkleBlockTest(unittest.TestCase):
 
     def test_parse(self):
@@ -95,5 +138,60 @@ class MerkleBlockTest(unittest.TestCase):
         mb = MerkleBlock.parse_merkle_block(BytesIO(bytes.fromhex(hex_merkle_block)))
         self.assertTrue(mb.is_valid())
 
+    def test_verify_matches(self):
+        block = block_of(37)
+        mb = MerkleProofBuilder(block).merkle_block([block.tx_hashes[30], block.tx_hashes[2], block.tx_hashes[36]])
+        want = [(block.tx_hashes[i], i) for i in (2, 30, 36)]
+        self.assertEqual(mb.verify_matches(), want)
+        mb.merkle_root = b'\x00' * 32
+        self.assertIsNone(mb.verify_matches())
+        self.assertFalse(mb.is_valid())
+
+    def test_serialize(self):
+        hex_merkle_block = '00000020df3b053dc46f162a9b00c7f0d5124e2676d47bbe7c5d0793a500000000000000ef445fef2ed495c275892206ca533e7411907971013ab83e3b47bd0d692d14d4dc7c835b67d8001ac157e670bf0d00000aba412a0d1480e370173072c9562becffe87aa661c1e4a6dbc305d38ec5dc088a7cf92e6458aca7b32edae818f9c2c98c37e06bf72ae0ce80649a38655ee1e27d34d9421d940b16732f24b94023e9d572a7f9ab8023434a4feb532d2adfc8c2c2158785d1bd04eb99df2e86c54bc13e139862897217400def5d72c280222c4cbaee7261831e1550dbb8fa82853e9fe506fc5fda3f7b919d8fe74b6282f92763cef8e625f977af7c8619c32a369b832bc2d051ecd9c73c51e76370ceabd4f25097c256597fa898d404ed53425de608ac6bfe426f6e2bb457f1c554866eb69dcb8d6bf6f880e9a59b3cd053e6c7060eeacaacf4dac6697dac20e4bd3f38a2ea2543d1ab7953e3430790a9f81e1c67f5b58c825acf46bd02848384eebe9af917274cdfbb1a28a5d58a23a17977def0de10d644258d9c54f886d47d293a411cb6226103b55635'
+        mb = MerkleBlock.parse_merkle_block(BytesIO(bytes.fromhex(hex_merkle_block)))
+        self.assertEqual(mb.serialize_merkle_block().hex(), hex_merkle_block)
+
+class MerkleProofBuilderTest(unittest.TestCase):
+
+    def test_proof(self):
+        for total in (1, 2, 3, 7, 16, 33):
+            block = block_of(total)
+            builder = MerkleProofBuilder(block)
+            for matched in ([0], [total - 1], [total // 2, total - 1], list(range(total))):
+                txids = [block.tx_hashes[i] for i in matched]
+                mb = builder.merkle_block(txids)
+                self.assertTrue(mb.is_valid())
+                parsed = MerkleBlock.parse_merkle_block(BytesIO(mb.serialize_merkle_block()))
+                self.assertTrue(parsed.is_valid())
+                for txid in txids:
+                    self.assertIn(txid, mb.hashes)
+
+    def test_all_matched(self):
+        block = block_of(5)
+        hashes, flag_bits = MerkleProofBuilder(block).proof(block.tx_hashes)
+        self.assertEqual(hashes, block.tx_hashes)
+        self.assertEqual(flag_bits, [1] * 11)
+
+    def test_none_matched(self):
+        block = block_of(5)
+        self.assertEqual(MerkleProofBuilder(block).proof([]), ([block.merkle_root], [0]))
+
+    def test_merkle_blocks(self):
+        block = block_of(10)
+        proofs = MerkleProofBuilder(block).merkle_blocks(block.tx_hashes[3:6])
+        self.assertEqual(list(proofs), block.tx_hashes[3:6])
+        for txid, mb in proofs.items():
+            self.assertTrue(mb.is_valid())
+            self.assertEqual(len(mb.hashes), 5)
+
+    def test_errors(self):
+        block = block_of(4)
+        with self.assertRaises(ValueError):
+            MerkleProofBuilder(block).proof([b'\x00' * 32])
+        block.merkle_root = b'\x00' * 32
+        with self.assertRaises(ValueError):
+            MerkleProofBuilder(block)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+from src.MerkleEngine import *
+from src.utils import hash256, merkle_parent_level
+
+import unittest
+
+class MerkleEngineTest(unittest.TestCase):
+
+    def leaves(self, count):
+        return [hash256(i.to_bytes(4, 'little')) for i in range(count)]
+
+    def reference_root(self, hashes):
+        level = list(hashes)
+        while len(level) > 1:
+            level = merkle_parent_level(level)
+        return level[0]
+
+    def test_matches_reference(self):
+        for count in range(1, 40):
+            hashes = self.leaves(count)
+            self.assertEqual(compute_merkle_root(hashes), (self.reference_root(hashes), False))
+
+    def test_inputs(self):
+        hashes = self.leaves(7)
+        want = self.reference_root(hashes)
+        self.assertEqual(compute_merkle_root(b''.join(hashes))[0], want)
+        self.assertEqual(compute_merkle_root(memoryview(b''.join(hashes)))[0], want)
+        self.assertEqual(compute_merkle_root(bytearray(b''.join(hashes)))[0], want)
+        # a list is left untouched, merkle_parent_level no longer pads it either
+        compute_merkle_root(hashes)
+        merkle_parent_level(hashes)
+        self.assertEqual(len(hashes), 7)
+
+    def test_mutated(self):
+        hashes = self.leaves(3)
+        root, mutated = compute_merkle_root(hashes)
+        self.assertFalse(mutated)
+        # duplicating the last transaction gives the same root, but pairs equal hashes
+        self.assertEqual(compute_merkle_root(hashes + hashes[-1:]), (root, True))
+        # equal hashes paired at a higher level are caught as well
+        hashes = self.leaves(6)
+        self.assertEqual(compute_merkle_root(hashes + hashes[4:]), (compute_merkle_root(hashes)[0], True))
+
+    def test_bad_input(self):
+        with self.assertRaises(ValueError):
+            compute_merkle_root([])
+        with self.assertRaises(ValueError):
+            compute_merkle_root(b'\x00' * 33)
+        # a list may hold hashes of any length, like merkle_root always allowed
+        self.assertEqual(compute_merkle_root([b'\x01' * 31]), (b'\x01' * 31, False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+from src.Miner import *
+from src.utils import hash256
+
+import src.Miner
+import unittest
+
+REGTEST_BITS = bytes.fromhex('ffff7f20')
+
+def header(timestamp=1296688602, bits=REGTEST_BITS):
+    return Block(0x20000000, bytes(32), bytes(32), timestamp, bits, bytes(4))
+
+class MinerTest(unittest.TestCase):
+
+    def test_scan_nonces(self):
+        block = header(bits=bytes.fromhex('ffff0f20'))
+        raw = block.serialize_block_header()
+        target = block.target()
+        nonce, tried = scan_nonces(raw, target, 0, 1000)
+        want = next(n for n in range(1000) if int.from_bytes(hash256(raw[:76] + n.to_bytes(4, 'little')), 'little') < target)
+        self.assertEqual((nonce, tried), (want, want + 1))
+        self.assertEqual(scan_nonces(raw, 0, 0, 10), (None, 10))
+
+    def test_mine(self):
+        block = header(bits=bytes.fromhex('ffff0f20'))
+        result = mine(block)
+        self.assertIs(result.block, block)
+        self.assertTrue(block.check_pow())
+        self.assertEqual(result.hashes, int.from_bytes(block.nonce, 'little') + 1)
+        self.assertEqual(result.rolls, 0)
+        self.assertGreater(result.hashes_per_second(), 0)
+
+    def test_workers(self):
+        block = header(bits=bytes.fromhex('ffff0f20'))
+        want = scan_nonces(block.serialize_block_header(), block.target(), 0, 10000)[0]
+        result = mine(block, workers=2, chunk_size=4)
+        self.assertEqual(int.from_bytes(block.nonce, 'little'), want)
+        self.assertTrue(block.check_pow())
+        self.assertGreaterEqual(result.hashes, want + 1)
+
+    def test_rolls(self):
+        space = src.Miner.NONCE_SPACE
+        src.Miner.NONCE_SPACE = 1
+        try:
+            # a timestamp where nonce 0 fails but succeeds one second later
+            timestamp = 1296688602
+            while header(timestamp).check_pow() or not header(timestamp + 1).check_pow():
+                timestamp += 1
+            block = header(timestamp)
+            result = mine(block)
+            self.assertEqual((result.rolls, result.hashes), (1, 2))
+            self.assertEqual(block.timestamp, timestamp + 1)
+            self.assertTrue(block.check_pow())
+            # rolling the extranonce replaces the merkle root instead
+            block = header(timestamp)
+            roots = [hash256(bytes([i])) for i in range(256)]
+            extranonce = next(i for i in range(1, 256)
+                              if Block(0x20000000, bytes(32), roots[i], timestamp, REGTEST_BITS, bytes(4)).check_pow())
+            result = mine(block, roll_merkle_root=lambda n: roots[n])
+            self.assertEqual(result.rolls, extranonce)
+            self.assertEqual(block.merkle_root, roots[extranonce])
+            self.assertEqual(block.timestamp, timestamp)
+            self.assertTrue(block.check_pow())
+        finally:
+            src.Miner.NONCE_SPACE = space
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 from src.Script import *
 from src.utils import decode_base58
+from src.SignatureCache import SIGNATURE_CACHE
+from src.SignatureBatch import SignatureBatch
+from src.ScriptTemplateCache import SCRIPT_TEMPLATE_CACHE
 
 import unittest
 
@@ -19,6 +22,59 @@ class ScriptTest(unittest.TestCase):
         script = Script.parse_script(script_pubkey)
         self.assertEqual(script.serialize_script().hex(), want)
     
+    def test_lazy_parse(self):
+        # OP_PUSHDATA1 used for a 3 byte push is not how raw_serialize would encode it
+        raw = bytes.fromhex('074c03abcdef5187')
+        script = Script.parse_script(BytesIO(raw))
+        self.assertIsNone(script._cmds)
+        self.assertEqual(script.serialize_script(), raw)
+        self.assertEqual(repr(script), 'abcdef OP_1 OP_EQUAL')
+        self.assertEqual(script.serialize_script(), raw)
+        # handing out the list drops the raw bytes since it may be modified
+        script.cmds.append(0x51)
+        self.assertEqual(script.serialize_script().hex(), '0703abcdef518751')
+
+    def test_memoryview_raw(self):
+        buffer = memoryview(bytes.fromhex('ffff76a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88acffff'))
+        script = Script(raw=buffer[2:-2])
+        self.assertTrue(script.is_p2pkh_script_pubkey())
+        self.assertEqual(script.serialize_script().hex(), '1976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac')
+
+    def test_bad_script(self):
+        script = Script.parse_script(BytesIO(bytes.fromhex('024c05')))
+        with self.assertRaises(SyntaxError):
+            script.cmds
+        self.assertFalse(script.evaluate(0))
+        with self.assertRaises(SyntaxError):
+            Script.parse_script(BytesIO(bytes.fromhex('0551')))
+
+    def test_truncated_pushdata(self):
+        # OP_PUSHDATA1 without its length byte, after a checksig
+        script = Script(raw=b'\xac\x4c')
+        self.assertEqual(decode_script(script.raw_serialize(), partial=True), [0xac])
+        self.assertEqual(repr(script), 'OP_CHECKSIG [error]')
+        self.assertEqual(script.sig_op_count(), 1)
+        self.assertFalse(script.is_push_only())
+        self.assertEqual(script.serialize_script(), b'\x02\xac\x4c')
+        # OP_PUSHDATA2 promising more bytes than follow
+        script = Script(raw=b'\x4d\x03\x00\x01')
+        self.assertEqual(repr(script), '[error]')
+        self.assertFalse(script.is_p2pkh_script_pubkey())
+        self.assertFalse(script.is_p2sh_script_pubkey())
+        self.assertFalse(script.is_p2wpkh_script_pubkey())
+        self.assertFalse(script.is_p2wsh_script_pubkey())
+        with self.assertRaises(ValueError):
+            script.address()
+        # joined as raw bytes, which still do not decode
+        joined = Script([0x51]) + script
+        self.assertEqual(joined.raw_serialize(), b'\x51\x4d\x03\x00\x01')
+        self.assertFalse(joined.evaluate(0))
+
+    def test_serialize_75_byte_push(self):
+        script = Script([b'\x01' * 75])
+        self.assertEqual(script.raw_serialize(), b'\x4b' + b'\x01' * 75)
+        self.assertEqual(Script.parse_script(BytesIO(script.serialize_script())).cmds, [b'\x01' * 75])
+
     def test_address(self):
         address_1 = '1BenRpVUFK65JFWcQSuHnJKzc4M8ZP8Eqa'
         h160 = decode_base58(address_1)
@@ -33,6 +89,303 @@ class ScriptTest(unittest.TestCase):
         address_4 = '2N3u1R6uwQfuobCqbCgBkpsgBxvr1tZpe7B'
         self.assertEqual(p2sh_script_pubkey.address(testnet=True), address_4)
 
+class EvaluateTest(unittest.TestCase):
+
+    def test_compile_jump_targets(self):
+        # OP_1 OP_IF OP_2 OP_ELSE OP_3 OP_ENDIF
+        instructions = compile_script([0x51, 0x63, 0x52, 0x67, 0x53, 0x68])
+        self.assertEqual(instructions[1], (CALL_IF, 4, 0x63))
+        self.assertEqual(instructions[3], (CALL_ELSE, 6, 0x67))
+        self.assertEqual(instructions[5], (CALL_ENDIF, None, 0x68))
+
+    def test_if_else(self):
+        # <condition> OP_IF OP_2 OP_ELSE OP_3 OP_ENDIF OP_3 OP_EQUAL
+        self.assertTrue(Script([0x00, 0x63, 0x52, 0x67, 0x53, 0x68, 0x53, 0x87]).evaluate(0))
+        self.assertFalse(Script([0x51, 0x63, 0x52, 0x67, 0x53, 0x68, 0x53, 0x87]).evaluate(0))
+        self.assertTrue(Script([0x51, 0x64, 0x52, 0x67, 0x53, 0x68, 0x53, 0x87]).evaluate(0))
+
+    def test_nested_if(self):
+        # OP_1 OP_IF OP_0 OP_IF OP_2 OP_ELSE OP_3 OP_ENDIF OP_ELSE OP_4 OP_ENDIF OP_3 OP_EQUAL
+        cmds = [0x51, 0x63, 0x00, 0x63, 0x52, 0x67, 0x53, 0x68, 0x67, 0x54, 0x68, 0x53, 0x87]
+        self.assertTrue(Script(cmds).evaluate(0))
+
+    def test_multiple_else(self):
+        # each OP_ELSE toggles execution: OP_1 OP_IF OP_2 OP_ELSE OP_3 OP_ELSE OP_4 OP_ENDIF leaves 2 and 4
+        cmds = [0x51, 0x63, 0x52, 0x67, 0x53, 0x67, 0x54, 0x68, 0x54, 0x88, 0x52, 0x87]
+        self.assertTrue(Script(cmds).evaluate(0))
+
+    def test_unbalanced_if(self):
+        self.assertFalse(Script([0x51, 0x63, 0x51]).evaluate(0))
+        self.assertFalse(Script([0x51, 0x68]).evaluate(0))
+        self.assertFalse(Script([0x51, 0x67, 0x51, 0x68]).evaluate(0))
+
+    def test_p2sh(self):
+        redeem_script = Script([0x52, 0x87]).raw_serialize()
+        script_sig = Script([0x52, redeem_script])
+        self.assertTrue((script_sig + p2sh_script(hash160(redeem_script))).evaluate(0))
+        script_sig = Script([0x53, redeem_script])
+        self.assertFalse((script_sig + p2sh_script(hash160(redeem_script))).evaluate(0))
+        self.assertFalse((script_sig + p2sh_script(b'\x00' * 20)).evaluate(0))
+
+    def test_locktime(self):
+        # <100> OP_CHECKLOCKTIMEVERIFY
+        script = Script([encode_num(100), 0xb1])
+        self.assertFalse(script.evaluate(0))
+        self.assertTrue(script.evaluate(0, locktime=100, sequence=0))
+        self.assertFalse(script.evaluate(0, locktime=99, sequence=0))
+
+class VerifyScriptTest(unittest.TestCase):
+    z = 0x7c076ff316692a3d7eb3c3bb0f8b1488cf72e1afcd929e29307032997a838a3d
+    sec = bytes.fromhex('04887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34')
+    sig = bytes.fromhex('3045022000eff69ef2b1bd93a66ed5219add4fb51e11a840f404876325a1e8ffe0529a2c022100c7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab601')
+
+    def setUp(self):
+        # a known valid signature, so the template logic is tested without the curve math
+        SIGNATURE_CACHE.add(self.z, self.sig[:-1], self.sec)
+
+    def tearDown(self):
+        SIGNATURE_CACHE.clear()
+
+    def test_script_pubkey_templates(self):
+        self.assertTrue(p2wpkh_script(b'\x00' * 20).is_p2wpkh_script_pubkey())
+        self.assertFalse(p2wpkh_script(b'\x00' * 20).is_p2wsh_script_pubkey())
+        self.assertTrue(p2wsh_script(b'\x00' * 32).is_p2wsh_script_pubkey())
+        self.assertTrue(Script([0x00, 0x51, b'\x01']).is_push_only())
+        self.assertFalse(Script([0x51, 0x76]).is_push_only())
+
+    def test_p2pkh(self):
+        script_pubkey = p2pkh_script(hash160(self.sec))
+        self.assertTrue(verify_script(Script([self.sig, self.sec]), script_pubkey, self.z))
+        self.assertFalse(verify_script(Script([self.sig, self.sec]), p2pkh_script(b'\x00' * 20), self.z))
+
+    def test_p2sh(self):
+        # RedeemScript <pubkey> OP_CHECKSIG
+        redeem_script = Script([self.sec, 0xac]).raw_serialize()
+        script_pubkey = p2sh_script(hash160(redeem_script))
+        self.assertTrue(verify_script(Script([self.sig, redeem_script]), script_pubkey, self.z))
+        # RedeemScript OP_2 OP_EQUAL spent with a small number push
+        redeem_script = Script([0x52, 0x87]).raw_serialize()
+        script_pubkey = p2sh_script(hash160(redeem_script))
+        self.assertTrue(verify_script(Script([0x52, redeem_script]), script_pubkey, self.z))
+        self.assertFalse(verify_script(Script([0x53, redeem_script]), script_pubkey, self.z))
+        self.assertFalse(verify_script(Script([0x52, redeem_script]), p2sh_script(b'\x00' * 20), self.z))
+
+    def test_fallback(self):
+        self.assertTrue(verify_script(Script([0x52]), Script([0x52, 0x87]), self.z))
+        self.assertFalse(verify_script(Script([0x53]), Script([0x52, 0x87]), self.z))
+
+    def test_hash_check_is_not_p2sh(self):
+        # <00> OP_HASH160 <hash160(00)> OP_EQUAL only compares hashes outside a p2sh spend
+        script = Script([b'\x00', 0xa9, hash160(b'\x00'), 0x87])
+        witness_script = script.raw_serialize()
+        self.assertTrue(verify_p2wsh([witness_script], hashlib.sha256(witness_script).digest(), self.z))
+        self.assertTrue(verify_script(Script(), script, self.z))
+        stack = []
+        self.assertTrue(execute_script(script.cmds, stack, [], self.z))
+        self.assertEqual(stack, [b'\x01'])
+        # joined with a ScriptSig for evaluate, the push is run as a RedeemScript
+        self.assertFalse(script.evaluate(self.z))
+
+    def test_op_count_per_script(self):
+        # 150 OP_NOPs on each side stay under MAX_OPS_PER_SCRIPT since the scripts run separately
+        script_sig = Script([0x51] + [0x61] * 150)
+        script_pubkey = Script([0x61] * 150 + [0x51, 0x87])
+        self.assertTrue(verify_script(script_sig, script_pubkey, self.z))
+        self.assertFalse(verify_script(Script([0x51] + [0x61] * 202), script_pubkey, self.z))
+        self.assertFalse(verify_script(script_sig, Script([0x61] * 202 + [0x51, 0x87]), self.z))
+        # the ScriptPubKey runs on the stack the ScriptSig leaves, but an OP_IF cannot span both
+        self.assertTrue(verify_script(Script([0x52, 0x53]), Script([0x93, 0x55, 0x87]), self.z))
+        self.assertFalse(verify_script(Script([0x51, 0x63]), Script([0x51, 0x68]), self.z))
+        # a p2sh ScriptPubKey needs a push only ScriptSig
+        redeem_script = Script([0x51]).raw_serialize()
+        self.assertFalse(verify_script(Script([0x61, redeem_script]), p2sh_script(hash160(redeem_script)), self.z))
+
+    def test_truncated_pushdata(self):
+        script_pubkey = p2pkh_script(hash160(self.sec))
+        self.assertFalse(verify_script(Script(raw=b'\x4c'), script_pubkey, self.z))
+        self.assertFalse(verify_script(Script([0x51]), Script(raw=b'\x4d\x01'), self.z))
+        self.assertFalse(verify_script(Script(raw=b'\x4c'), p2sh_script(b'\x00' * 20), self.z))
+
+class CheckMultisigTest(unittest.TestCase):
+    z = 0x1234
+    keys = [b'key one', b'key two', b'key three']
+    # a signature per key, recorded as valid in the signature cache
+    sigs = [b'sig one\x01', b'sig two\x01', b'sig three\x01']
+
+    def setUp(self):
+        SIGNATURE_CACHE.clear()
+        for sig, key in zip(self.sigs, self.keys):
+            SIGNATURE_CACHE.add(self.z, sig[:-1], key)
+
+    def tearDown(self):
+        SIGNATURE_CACHE.clear()
+
+    def test_two_of_three(self):
+        stack = [b'', self.sigs[0], self.sigs[2], encode_num(2)] + self.keys + [encode_num(3)]
+        self.assertTrue(op_checkmultisig(stack, self.z))
+        self.assertEqual(stack, [encode_num(1)])
+        # sig one matches key one, sig three skips key two once and matches key three
+        self.assertEqual(SIGNATURE_CACHE.hits, 2)
+        self.assertEqual(SIGNATURE_CACHE.misses, 1)
+
+    def test_wrong_order(self):
+        stack = [b'', self.sigs[2], self.sigs[0], encode_num(2)] + self.keys + [encode_num(3)]
+        self.assertTrue(op_checkmultisig(stack, self.z))
+        self.assertEqual(decode_num(stack[-1]), 0)
+
+    def test_dummy_element(self):
+        stack = [self.sigs[0], encode_num(1), self.keys[0], encode_num(1)]
+        self.assertFalse(op_checkmultisig(stack, self.z))
+
+    def test_bad_counts(self):
+        self.assertFalse(op_checkmultisig([b'', encode_num(21)], self.z))
+        stack = [b'', self.sigs[0], self.sigs[1], encode_num(2), self.keys[0], encode_num(1)]
+        self.assertFalse(op_checkmultisig(stack, self.z))
+
+    def test_batch(self):
+        batch = SignatureBatch()
+        stack = [b'', self.sigs[0], self.sigs[1], encode_num(2), self.keys[0], self.keys[1], encode_num(2)]
+        self.assertTrue(op_checkmultisig(stack, self.z, batch))
+        self.assertEqual(stack, [encode_num(1)])
+        self.assertEqual(len(batch), 2)
+        self.assertTrue(batch.verify())
+        batch.add(self.z, b'not a signature', self.keys[0])
+        self.assertFalse(batch.verify())
+
+    def test_p2sh_multisig(self):
+        redeem_script = Script([0x52] + self.keys + [0x53, 0xae]).raw_serialize()
+        script_pubkey = p2sh_script(hash160(redeem_script))
+        script_sig = Script([0x00, self.sigs[1], self.sigs[2], redeem_script])
+        self.assertTrue(verify_script(script_sig, script_pubkey, self.z))
+        self.assertTrue((script_sig + script_pubkey).evaluate(self.z))
+        script_sig = Script([0x00, self.sigs[1], b'bad signature\x01', redeem_script])
+        self.assertFalse(verify_script(script_sig, script_pubkey, self.z))
+        # with fewer signatures than keys the matching cannot be deferred
+        batch = SignatureBatch()
+        self.assertFalse(verify_script(script_sig, script_pubkey, self.z, batch=batch))
+        self.assertEqual(len(batch), 0)
+        # an m-of-m final OP_CHECKMULTISIG defers its checks to the batch
+        script_sig = Script([0x00, self.sigs[0], self.sigs[1], self.sigs[2], Script([0x53] + self.keys + [0x53, 0xae]).raw_serialize()])
+        redeem_hash = hash160(script_sig.cmds[-1])
+        self.assertTrue(verify_script(script_sig, p2sh_script(redeem_hash), self.z, batch=batch))
+        self.assertEqual(len(batch), 3)
+        self.assertTrue(batch.verify())
+
+class ResourceLimitsTest(unittest.TestCase):
+
+    def test_op_count(self):
+        self.assertTrue(Script([0x61] * 201 + [0x51]).evaluate(0))
+        self.assertFalse(Script([0x61] * 202 + [0x51]).evaluate(0))
+        # opcodes in a branch that is not taken count as well
+        self.assertFalse(Script([0x00, 0x63] + [0x61] * 200 + [0x68, 0x51]).evaluate(0))
+        # pushes do not count
+        self.assertTrue(Script([0x51] * 300 + [0x6d] * 149).evaluate(0))
+
+    def test_stack_size(self):
+        self.assertTrue(Script([0x51] * 1000).evaluate(0))
+        self.assertFalse(Script([0x51] * 1001).evaluate(0))
+        # the altstack shares the limit
+        self.assertFalse(Script([0x51] * 999 + [0x6b, 0x76, 0x76]).evaluate(0))
+
+    def test_element_size(self):
+        self.assertTrue(Script([b'\x01' * 520]).evaluate(0))
+        self.assertFalse(Script([b'\x01' * 521]).evaluate(0))
+        redeem_script = Script([0x51] * 521).raw_serialize()
+        script_sig = Script([redeem_script])
+        self.assertFalse(verify_script(script_sig, p2sh_script(hash160(redeem_script)), 0))
+
+    def test_multisig_keys_count_as_ops(self):
+        cmds = [0x00, b'sig\x01', 0x51] + [b'key'] * 20 + [encode_num(20), 0xae]
+        # 180 opcodes + OP_CHECKMULTISIG + its 20 keys fit, the unknown signature then pushes false
+        stack = []
+        self.assertTrue(execute_instructions(compile_script([0x61] * 180 + cmds), stack, [], 0))
+        self.assertEqual(stack, [b''])
+        # one more opcode fails before OP_CHECKMULTISIG touches the stack
+        stack = []
+        self.assertFalse(execute_instructions(compile_script([0x61] * 181 + cmds), stack, [], 0))
+        self.assertEqual(len(stack), 3 + 20 + 1)
+
+    def test_sig_op_count(self):
+        self.assertEqual(p2pkh_script(b'\x00' * 20).sig_op_count(), 1)
+        multisig = Script([0x52, b'key one', b'key two', b'key three', 0x53, 0xae])
+        self.assertEqual(multisig.sig_op_count(), 20)
+        self.assertEqual(multisig.sig_op_count(accurate=True), 3)
+        self.assertEqual(Script([0xac, 0xad, 0x00, 0xaf]).sig_op_count(accurate=True), 22)
+        # counting stops at a truncated push
+        self.assertEqual(Script(raw=b'\xac\xad\x4c\x05\xac').sig_op_count(), 2)
+
+class TemplateCompilerTest(unittest.TestCase):
+
+    def setUp(self):
+        SCRIPT_TEMPLATE_CACHE.clear()
+
+    def tearDown(self):
+        SCRIPT_TEMPLATE_CACHE.clear()
+
+    def test_matches_interpreter(self):
+        scripts = [
+            [0x51, 0x76, 0x87],
+            [0x76],
+            [0x00, 0x63, 0x51, 0x67, 0x52, 0x68],
+            [0x51, 0x64, 0x51, 0x67, 0x52, 0x68],
+            [0x51, 0x63, 0x00, 0x63, 0x53, 0x67, 0x54, 0x68, 0x68],
+            [0x63, 0x51, 0x68],
+            [0x51, 0x6b, 0x52, 0x6c],
+            [b'seed', 0xa8, 0x82],
+            [0x51, 0x69, 0x51],
+            [0x51, 0xba],
+            [0x51, 0xb1],
+            [0x00, b'sig\x01', 0x51, b'key', 0x51, 0xae],
+        ]
+        for cmds in scripts:
+            function = compile_template(cmds)
+            self.assertIsNotNone(function)
+            compiled_stack, interpreted_stack = [], []
+            pushes = [cmd for cmd in cmds if type(cmd) == bytes]
+            compiled = function(compiled_stack, [], pushes, 0, None, None, None, None)
+            interpreted = execute_instructions(compile_script(cmds), interpreted_stack, [], 0)
+            self.assertEqual(compiled, interpreted)
+            if compiled:
+                self.assertEqual(compiled_stack, interpreted_stack)
+
+    def test_not_compiled(self):
+        # unbalanced, a second OP_ELSE and too many opcodes
+        self.assertIsNone(compile_template([0x63]))
+        self.assertIsNone(compile_template([0x51, 0x63, 0x51, 0x67, 0x52, 0x67, 0x53, 0x68]))
+        self.assertIsNone(compile_template([0x61] * 202))
+        # scripts ending in a p2sh check have no template
+        self.assertEqual(script_template([b'redeem', 0xa9, b'\x00' * 20, 0x87], p2sh=True)[0], None)
+        self.assertEqual(script_template([b'redeem', 0xa9, b'\x00' * 20, 0x87])[0], (None, 0xa9, None, 0x87))
+
+    def test_evaluate_uses_cache(self):
+        script = Script([b'data', 0xa8, 0x82, encode_num(32), 0x87])
+        for _ in range(3):
+            self.assertTrue(script.evaluate(0))
+        self.assertEqual(len(SCRIPT_TEMPLATE_CACHE), 1)
+        self.assertEqual(SCRIPT_TEMPLATE_CACHE.hits, 1)
+        # same template with different pushes
+        self.assertFalse(Script([b'data', 0xa8, 0x82, encode_num(31), 0x87]).evaluate(0))
+        self.assertFalse(Script([b'\x01' * 521, 0xa8, 0x82, encode_num(32), 0x87]).evaluate(0))
+        self.assertEqual(SCRIPT_TEMPLATE_CACHE.hits, 3)
+
+    def test_oversized_push_compiles(self):
+        # a template first seen with an oversized push is still compiled for the scripts that follow
+        oversized = Script([b'\x01' * 521, 0xa8, 0x82, encode_num(32), 0x87])
+        for _ in range(3):
+            self.assertFalse(oversized.evaluate(0))
+        template = script_template(oversized.cmds)[0]
+        self.assertIsNotNone(SCRIPT_TEMPLATE_CACHE.lookup(template))
+        self.assertIsNotNone(compile_template([b'\x01' * 521, 0x82]))
+        self.assertTrue(Script([b'data', 0xa8, 0x82, encode_num(32), 0x87]).evaluate(0))
+
+    def test_p2sh_redeem_script(self):
+        redeem_script = Script([0x52, 0x93, 0x54, 0x87]).raw_serialize()
+        script_pubkey = p2sh_script(hash160(redeem_script))
+        for _ in range(3):
+            self.assertTrue(verify_script(Script([0x52, redeem_script]), script_pubkey, 0))
+            self.assertFalse(verify_script(Script([0x51, redeem_script]), script_pubkey, 0))
+        self.assertEqual(len(SCRIPT_TEMPLATE_CACHE), 1)
+
 class OpCodesTest(unittest.TestCase):
 
     def test_op_hash160(self):
@@ -0,0 +1,67 @@
+from src.ScriptClassifier import *
+from src.Script import Script, p2pkh_script, p2sh_script, p2wpkh_script, p2wsh_script
+
+import unittest
+
+class ScriptClassifierTest(unittest.TestCase):
+    key = bytes.fromhex('0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')
+
+    def test_templates(self):
+        h160 = bytes.fromhex('751e76e8199196d454941c45d1b3a323f1433bd6')
+        h256 = bytes(range(32))
+        tests = [
+            (p2pkh_script(h160), P2PKH, h160),
+            (p2sh_script(h160), P2SH, h160),
+            (p2wpkh_script(h160), P2WPKH, h160),
+            (p2wsh_script(h256), P2WSH, h256),
+            (Script([0x51, h256]), P2TR, h256),
+            (Script([0x6a, b'hello', b'world']), NULL_DATA, b'helloworld'),
+            (Script([0x6a]), NULL_DATA, b''),
+            (Script([0x51, self.key, self.key, 0x52, 0xae]), MULTISIG, (1, (self.key, self.key))),
+            (Script([0x51, 0x87]), NONSTANDARD, None),
+        ]
+        for script, script_type, data in tests:
+            self.assertEqual(classify_script_pubkey(script.raw_serialize()), (script_type, data))
+
+    def test_nonstandard(self):
+        tests = [
+            b'',
+            # OP_RETURN followed by an opcode
+            bytes([0x6a, 0x76]),
+            # OP_RETURN with a truncated push
+            bytes([0x6a, 0x05, 0x01]),
+            # multisig with m > n
+            Script([0x52, self.key, 0x51, 0xae]).raw_serialize(),
+            # multisig with a key of the wrong size
+            Script([0x51, b'short key', 0x51, 0xae]).raw_serialize(),
+            # p2pkh with the wrong final opcode
+            bytes([0x76, 0xa9, 0x14]) + b'\x00' * 20 + bytes([0x88, 0xad]),
+        ]
+        for raw in tests:
+            self.assertEqual(classify_script_pubkey(raw), (NONSTANDARD, None))
+
+    def test_witness_program(self):
+        self.assertEqual(witness_program(bytes([0x00, 20]) + b'\x01' * 20), (0, b'\x01' * 20))
+        self.assertEqual(witness_program(bytes([0x51, 32]) + b'\x01' * 32), (1, b'\x01' * 32))
+        self.assertEqual(witness_program(bytes([0x60, 2]) + b'\x01' * 2), (16, b'\x01' * 2))
+        self.assertIsNone(witness_program(bytes([0x51, 41]) + b'\x01' * 41))
+        self.assertIsNone(witness_program(bytes([0x4f, 2]) + b'\x01' * 2))
+        self.assertIsNone(witness_program(bytes([0x00, 21]) + b'\x01' * 20))
+
+    def test_bulk(self):
+        h160 = bytes.fromhex('74d691da1574e6b3c192ecfb52cc8984ee7b6c56')
+        scripts = [p2pkh_script(h160), p2sh_script(h160), p2wpkh_script(bytes.fromhex('751e76e8199196d454941c45d1b3a323f1433bd6')), Script([0x6a, b'data'])]
+        result = ScriptPubKeyClassification.classify(memoryview(script.raw_serialize()) for script in scripts)
+        self.assertEqual(len(result), 4)
+        self.assertEqual(list(result.types), [P2PKH, P2SH, P2WPKH, NULL_DATA])
+        self.assertEqual(result.address(0, testnet=True), 'mrAjisaT4LXL5MzE81sfcDYKU3wqWSvf9q')
+        self.assertEqual(list(result.addresses()), [
+            '1BenRpVUFK65JFWcQSuHnJKzc4M8ZP8Eqa',
+            '3CLoMMyuoDQTPRD3XYZtCvgvkadrAdvdXh',
+            'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4',
+            None,
+        ])
+        self.assertEqual(result.counts(), {'p2pkh': 1, 'p2sh': 1, 'p2wpkh': 1, 'nulldata': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from src.ScriptExecutionCache import *
+from src.Script import Script
+from src.Transaction import Transaction, TransactionInput, TransactionOutput, TransactionFetcher
+
+import unittest
+
+class ScriptExecutionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        SCRIPT_EXECUTION_CACHE.clear()
+
+    def test_add_contains(self):
+        cache = ScriptExecutionCache()
+        key = cache.make_key(b'\x01' * 32, 0, b'\x01\x51')
+        self.assertFalse(cache.contains(key))
+        cache.add(key)
+        self.assertTrue(cache.contains(key))
+        self.assertFalse(cache.contains(cache.make_key(b'\x01' * 32, 1, b'\x01\x51')))
+        self.assertFalse(cache.contains(cache.make_key(b'\x01' * 32, 0, b'\x01\x51', flags=1)))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 3)
+
+    def test_eviction(self):
+        cache = ScriptExecutionCache(max_entries=2)
+        keys = [cache.make_key(bytes([i]) * 32, 0, b'\x01\x51') for i in range(3)]
+        for key in keys:
+            cache.add(key)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertFalse(cache.contains(keys[0]))
+        self.assertNotIn(keys[0][0], cache.keys_by_txid)
+
+    def test_invalidate(self):
+        cache = ScriptExecutionCache()
+        txid = b'\x02' * 32
+        cache.add(cache.make_key(txid, 0, b'\x01\x51'))
+        cache.add(cache.make_key(txid, 1, b'\x01\x51'))
+        other = cache.make_key(b'\x03' * 32, 0, b'\x01\x51')
+        cache.add(other)
+        self.assertEqual(cache.invalidate(txid), 2)
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(cache.contains(other))
+
+    def test_verify_input_uses_cache(self):
+        # a previous transaction paying to OP_1 so the spend needs no signature
+        prev_tx = Transaction(1, [TransactionInput(b'\x00' * 32, 0)], [TransactionOutput(1000, Script([0x51])), TransactionOutput(1000, Script([0x00]))], 0)
+        TransactionFetcher.cache[prev_tx.id()] = prev_tx
+        tx_ins = [TransactionInput(prev_tx.hash(), 0), TransactionInput(prev_tx.hash(), 1)]
+        tx = Transaction(1, tx_ins, [TransactionOutput(500, Script([0x51]))], 0)
+        self.assertTrue(tx.verify_input(0))
+        self.assertEqual(len(SCRIPT_EXECUTION_CACHE), 1)
+        self.assertTrue(tx.verify_input(0))
+        self.assertEqual(SCRIPT_EXECUTION_CACHE.hits, 1)
+        # failures are never cached
+        self.assertFalse(tx.verify_input(1))
+        self.assertFalse(tx.verify_input(1))
+        self.assertEqual(len(SCRIPT_EXECUTION_CACHE), 1)
+
+if __name__ == '__main__':
+    unittest.main()
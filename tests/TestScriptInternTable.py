@@ -0,0 +1,55 @@
+from src.ScriptInternTable import *
+from src.Transaction import TransactionOutput
+from io import BytesIO
+
+import gc
+import unittest
+
+class ScriptInternTableTest(unittest.TestCase):
+
+    def tearDown(self):
+        TransactionOutput.script_intern_table = None
+
+    def test_intern(self):
+        table = ScriptInternTable()
+        script_1 = table.intern(bytes.fromhex('a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada87'))
+        script_2 = table.intern(memoryview(bytes.fromhex('a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada87')))
+        script_3 = table.intern(bytes.fromhex('a9141c4bc762dd5423e332166702cb75f40df79fea1287'))
+        self.assertIs(script_1, script_2)
+        self.assertIsNot(script_1, script_3)
+        self.assertTrue(script_1.is_p2sh_script_pubkey())
+        report = table.report()
+        self.assertEqual(report['unique_scripts'], 2)
+        self.assertEqual(report['lookups'], 3)
+        self.assertEqual(report['shared'], 1)
+        self.assertGreater(report['bytes_saved'], 0)
+
+    def test_immutable(self):
+        table = ScriptInternTable()
+        script = table.intern(bytes.fromhex('5187'))
+        self.assertEqual(script.cmds, (0x51, 0x87))
+        with self.assertRaises(AttributeError):
+            script.cmds = [0x51]
+        self.assertEqual(script.serialize_script(), bytes.fromhex('025187'))
+
+    def test_weak_entries(self):
+        table = ScriptInternTable()
+        script = table.intern(bytes.fromhex('5187'))
+        self.assertEqual(len(table), 1)
+        del script
+        gc.collect()
+        self.assertEqual(len(table), 0)
+
+    def test_parse_transaction_output(self):
+        raw = bytes.fromhex('a135ef01000000001976a914bc3b654dca7e56b04dca18f2566cdaf02e8d9ada88ac')
+        tx_out_1 = TransactionOutput.parse_transaction_output(BytesIO(raw))
+        tx_out_2 = TransactionOutput.parse_transaction_output(BytesIO(raw))
+        self.assertIsNot(tx_out_1.script_pubkey, tx_out_2.script_pubkey)
+        TransactionOutput.script_intern_table = ScriptInternTable()
+        tx_out_1 = TransactionOutput.parse_transaction_output(BytesIO(raw))
+        tx_out_2 = TransactionOutput.parse_transaction_output(BytesIO(raw))
+        self.assertIs(tx_out_1.script_pubkey, tx_out_2.script_pubkey)
+        self.assertEqual(tx_out_2.serialize_transaction_output(), raw)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+from src.ScriptProfiler import *
+from src.Script import Script, p2sh_script
+from src.utils import hash160
+
+import unittest
+
+class ScriptProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        SCRIPT_PROFILER.reset()
+        SCRIPT_PROFILER.enable()
+
+    def tearDown(self):
+        SCRIPT_PROFILER.disable()
+        SCRIPT_PROFILER.reset()
+
+    def test_counts(self):
+        self.assertTrue(Script([b'seed', 0xa8, 0xa8, 0xa8, 0x76, 0x87]).evaluate(0))
+        rows = {name: calls for name, calls, total, per_call in SCRIPT_PROFILER.dump()}
+        self.assertEqual(rows, {'OP_SHA256': 3, 'OP_DUP': 1, 'OP_EQUAL': 1})
+        self.assertIn('OP_SHA256', SCRIPT_PROFILER.report())
+
+    def test_failed_op(self):
+        self.assertFalse(Script([0x76]).evaluate(0))
+        self.assertEqual(SCRIPT_PROFILER.table['OP_DUP'][0], 1)
+
+    def test_disabled(self):
+        SCRIPT_PROFILER.disable()
+        self.assertTrue(Script([0x51, 0x76, 0x87]).evaluate(0))
+        self.assertEqual(SCRIPT_PROFILER.dump(), [])
+
+    def test_reset(self):
+        Script([0x51, 0x76, 0x87]).evaluate(0)
+        SCRIPT_PROFILER.reset()
+        self.assertEqual(SCRIPT_PROFILER.dump(), [])
+
+    def test_p2sh(self):
+        redeem_script = Script([0x52, 0x87]).raw_serialize()
+        script = Script([0x52, redeem_script]) + p2sh_script(hash160(redeem_script))
+        self.assertTrue(script.evaluate(0))
+        rows = {name: calls for name, calls, total, per_call in SCRIPT_PROFILER.dump()}
+        self.assertEqual(rows['P2SH_REDEEM_SCRIPT'], 1)
+        self.assertEqual(rows['OP_EQUAL'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+from src.ScriptTemplateCache import *
+
+import unittest
+
+class ScriptTemplateCacheTest(unittest.TestCase):
+
+    def test_compile_after(self):
+        cache = ScriptTemplateCache(compile_after=2)
+        key = (None, 0x76, 0x87)
+        self.assertFalse(cache.should_compile(key))
+        self.assertTrue(cache.should_compile(key))
+        cache.add(key, len)
+        self.assertFalse(cache.should_compile(key))
+        self.assertIs(cache.lookup(key), len)
+        self.assertEqual(cache.hits, 1)
+
+    def test_not_compilable(self):
+        cache = ScriptTemplateCache(compile_after=1)
+        key = (0x63,)
+        self.assertTrue(cache.should_compile(key))
+        cache.add(key, None)
+        self.assertIsNone(cache.lookup(key))
+        # a template that failed to compile is not retried
+        self.assertFalse(cache.should_compile(key))
+
+    def test_eviction(self):
+        cache = ScriptTemplateCache(max_entries=2)
+        for i in range(3):
+            cache.add((i,), len)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.lookup((0,)))
+
+    def test_disabled(self):
+        cache = ScriptTemplateCache(max_entries=0, compile_after=1)
+        self.assertFalse(cache.should_compile((0x51,)))
+        cache.add((0x51,), len)
+        self.assertEqual(len(cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
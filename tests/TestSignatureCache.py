@@ -0,0 +1,81 @@
+from src.SignatureCache import *
+from src.Script import op_checksig, decode_num
+
+import sys
+import threading
+import unittest
+
+class SignatureCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        SIGNATURE_CACHE.clear()
+
+    def test_add_contains(self):
+        cache = SignatureCache()
+        self.assertFalse(cache.contains(1, b'sig', b'sec'))
+        cache.add(1, b'sig', b'sec')
+        self.assertTrue(cache.contains(1, b'sig', b'sec'))
+        self.assertFalse(cache.contains(2, b'sig', b'sec'))
+        self.assertFalse(cache.contains(1, b'sig', b'other sec'))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(cache.hit_rate(), 0.25)
+
+    def test_salted_keys(self):
+        cache_1 = SignatureCache()
+        cache_2 = SignatureCache()
+        self.assertNotEqual(cache_1.make_key(1, b'sig', b'sec'), cache_2.make_key(1, b'sig', b'sec'))
+
+    def test_eviction(self):
+        cache = SignatureCache(max_bytes=2 * SIGNATURE_CACHE_ENTRY_BYTES)
+        cache.add(1, b'sig', b'sec')
+        cache.add(2, b'sig', b'sec')
+        # touching the first entry makes the second the least recently used
+        self.assertTrue(cache.contains(1, b'sig', b'sec'))
+        cache.add(3, b'sig', b'sec')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertTrue(cache.contains(1, b'sig', b'sec'))
+        self.assertFalse(cache.contains(2, b'sig', b'sec'))
+        self.assertTrue(cache.contains(3, b'sig', b'sec'))
+        self.assertLessEqual(cache.memory_usage(), cache.max_bytes)
+
+    def test_disabled(self):
+        cache = SignatureCache(max_bytes=0)
+        cache.add(1, b'sig', b'sec')
+        self.assertFalse(cache.contains(1, b'sig', b'sec'))
+
+    def test_entry_bytes(self):
+        # at least the 32 byte key object and a pointer for its slot
+        self.assertGreater(SIGNATURE_CACHE_ENTRY_BYTES, sys.getsizeof(bytes(32)) + 8)
+        self.assertEqual(SignatureCache(max_bytes=10 * SIGNATURE_CACHE_ENTRY_BYTES).max_entries, 10)
+
+    def test_threads(self):
+        cache = SignatureCache(max_bytes=100 * SIGNATURE_CACHE_ENTRY_BYTES)
+
+        def work(offset):
+            for z in range(offset, offset + 2000):
+                cache.add(z, b'sig', b'sec')
+                cache.contains(z - 50, b'sig', b'sec')
+
+        threads = [threading.Thread(target=work, args=(50 + i * 2000,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cache), 100)
+        self.assertEqual(cache.evictions, 8000 - 100)
+        self.assertEqual(cache.hits + cache.misses, 8000)
+
+    def test_op_checksig_hit(self):
+        z = 0x7c076ff316692a3d7eb3c3bb0f8b1488cf72e1afcd929e29307032997a838a3d
+        sec = bytes.fromhex('04887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34')
+        sig = bytes.fromhex('3045022000eff69ef2b1bd93a66ed5219add4fb51e11a840f404876325a1e8ffe0529a2c022100c7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab601')
+        SIGNATURE_CACHE.add(z, sig[:-1], sec)
+        stack = [sig, sec]
+        self.assertTrue(op_checksig(stack, z))
+        self.assertEqual(decode_num(stack[0]), 1)
+        self.assertEqual(SIGNATURE_CACHE.hits, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,24 @@
 from src.elliptic_curve_cryptography.DigitalSignature import PrivateKey
 from src.Transaction import *
+from src.Script import p2pkh_script, p2sh_script, p2wpkh_script, p2wsh_script
+from src.ScriptExecutionCache import SCRIPT_EXECUTION_CACHE
+from src.SignatureBatch import SignatureBatch
+from src.SignatureCache import SIGNATURE_CACHE
+from src.utils import hash160, hash256
+
+import hashlib
 
 import unittest
 
+class ForwardReader:
+    """A stream that can only be read forward, like a socket or a pipe"""
+    def __init__(self, raw: bytes):
+        self.stream = BytesIO(raw)
+
+    def read(self, n: int) -> bytes:
+        return self.stream.read(n)
+
+
 class TransactionTest(unittest.TestCase):
     """
     cache_file = "tx_cache.json"
@@ -96,6 +112,27 @@ class TransactionTest(unittest.TestCase):
         tx = TransactionFetcher.fetch('46df1a9484d0a81d03ce0ee543ab6e1a23ed06175c104a178268fad381216c2b')
         self.assertTrue(tx.verify())
 
+    def test_verify_p2sh_offline(self):
+        # the 2-of-2 p2sh multisig spend of test_verify_p2sh, with the output it spends injected into the cache
+        raw_tx = bytes.fromhex('0100000001868278ed6ddfb6c1ed3ad5f8181eb0c7a385aa0836f01d5e4789e6bd304d87221a000000db00483045022100dc92655fe37036f47756db8102e0d7d5e28b3beb83a8fef4f5dc0559bddfb94e02205a36d4e4e6c7fcd16658c50783e00c341609977aed3ad00937bf4ee942a8993701483045022100da6bee3c93766232079a01639d07fa869598749729ae323eab8eef53577d611b02207bef15429dcadce2121ea07f233115c6f09034c0be68db99980b9a6c5e75402201475221022626e955ea6ea6d98850c994f9107b036b1334f18ca8830bfff1295d21cfdb702103b287eaf122eea69030a0e9feed096bed8045c8b98bec453e1ffac7fbdbd4bb7152aeffffffff04d3b11400000000001976a914904a49878c0adfc3aa05de7afad2cc15f483a56a88ac7f400900000000001976a914418327e3f3dda4cf5b9089325a4b95abdfa0334088ac722c0c00000000001976a914ba35042cfe9fc66fd35ac2224eebdafd1028ad2788acdc4ace020000000017a91474d691da1574e6b3c192ecfb52cc8984ee7b6c568700000000')
+        tx = Transaction.parse_transaction(BytesIO(raw_tx))
+        self.assertEqual(tx.id(), '46df1a9484d0a81d03ce0ee543ab6e1a23ed06175c104a178268fad381216c2b')
+        redeem_script = Script(raw=tx.tx_ins[0].script_sig.cmds[-1])
+        prev_outputs = [TransactionOutput(0, Script())] * 26 + [TransactionOutput(0, p2sh_script(hash160(redeem_script.raw_serialize())))]
+        TransactionFetcher.cache[tx.tx_ins[0].prev_tx.hex()] = Transaction(1, [], prev_outputs, 0)
+        SCRIPT_EXECUTION_CACHE.clear()
+        # BIP16 signs the RedeemScript, not the p2sh ScriptPubKey
+        z = 0xe71bfa115715d6fd33796948126f40a8cdd39f187e4afb03896795189fe1423c
+        self.assertEqual(tx.sig_hash(0, redeem_script), z)
+        # known valid under that z only, so the test does not wait for the curve math
+        signatures = tx.tx_ins[0].script_sig.cmds[1:3]
+        for signature, sec in zip(signatures, redeem_script.cmds[1:3]):
+            SIGNATURE_CACHE.add(z, signature[:-1], sec)
+        try:
+            self.assertTrue(tx.verify_input(0))
+        finally:
+            SIGNATURE_CACHE.clear()
+
     def test_sign_input(self):
         private_key = PrivateKey(secret=8675309)
         stream = BytesIO(bytes.fromhex('010000000199a24308080ab26e6fb65c4eccfadf76749bb5bfa8cb08f291320b3c21e56f0d0d00000000ffffffff02408af701000000001976a914d52ad7ca9b3d096a38e752c2018e6fbc40cdf26f88ac80969800000000001976a914507b27411ccf7f16f10297de6cef3f291623eddf88ac00000000'))
@@ -104,6 +141,37 @@ class TransactionTest(unittest.TestCase):
         want = '010000000199a24308080ab26e6fb65c4eccfadf76749bb5bfa8cb08f291320b3c21e56f0d0d0000006b4830450221008ed46aa2cf12d6d81065bfabe903670165b538f65ee9a3385e6327d80c66d3b502203124f804410527497329ec4715e18558082d489b218677bd029e7fa306a72236012103935581e52c354cd2f484fe8ed83af7a3097005b2f9c60bff71d35bd795f54b67ffffffff02408af701000000001976a914d52ad7ca9b3d096a38e752c2018e6fbc40cdf26f88ac80969800000000001976a914507b27411ccf7f16f10297de6cef3f291623eddf88ac00000000'
         self.assertEqual(tx_obj.serialize_transaction().hex(), want)
 
+    def test_slots(self):
+        tx_in = TransactionInput(b'\x00' * 32, 0)
+        tx_out = TransactionOutput(1, Script([0x51]))
+        tx = Transaction(1, [tx_in], [tx_out], 0)
+        for obj in (tx, tx_in, tx_out, tx_out.script_pubkey):
+            self.assertFalse(hasattr(obj, '__dict__'))
+        with self.assertRaises(AttributeError):
+            tx.fee_rate = 1
+
+    def test_sig_op_count(self):
+        redeem_script = Script([0x52, b'key one', b'key two', b'key three', 0x53, 0xae]).raw_serialize()
+        prev_tx = Transaction(1, [TransactionInput(b'\x00' * 32, 0)], [TransactionOutput(5000, p2sh_script(hash160(redeem_script)))], 0)
+        TransactionFetcher.cache[prev_tx.id()] = prev_tx
+        tx_in = TransactionInput(prev_tx.hash(), 0, Script([0x00, b'sig\x01', b'sig\x01', redeem_script]))
+        tx = Transaction(1, [tx_in], [TransactionOutput(1000, p2pkh_script(b'\x00' * 20))], 0)
+        self.assertEqual(tx.sig_op_count(), 1 + 3)
+        # too many signature operations are rejected before any signature is checked
+        tx.tx_outs.append(TransactionOutput(1000, Script([0xac] * 4000)))
+        self.assertEqual(tx.sig_op_count(), 4004)
+        self.assertFalse(tx.verify())
+
+    def test_truncated_pushdata(self):
+        prev_tx = Transaction(1, [TransactionInput(b'\x00' * 32, 0)], [TransactionOutput(5000, p2sh_script(b'\x00' * 20))], 0)
+        TransactionFetcher.cache[prev_tx.id()] = prev_tx
+        # a ScriptSig ending in OP_PUSHDATA1 without its length byte
+        tx_in = TransactionInput(prev_tx.hash(), 0, Script(raw=b'\xac\x4c'))
+        tx = Transaction(1, [tx_in], [TransactionOutput(1000, Script(raw=b'\x4d\xff'))], 0)
+        self.assertEqual(tx.sig_op_count(), 1)
+        self.assertFalse(tx.verify())
+        self.assertFalse(tx.verify_input(0))
+
     def test_is_coinbase(self):
         raw_tx = bytes.fromhex('01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff5e03d71b07254d696e656420627920416e74506f6f6c20626a31312f4542312f4144362f43205914293101fabe6d6d678e2c8c34afc36896e7d9402824ed38e856676ee94bfdb0c6c4bcd8b2e5666a0400000000000000c7270000a5e00e00ffffffff01faf20b58000000001976a914338c84849423992471bffb1a54a8d9b1d69dc28a88ac00000000')
         stream = BytesIO(raw_tx)
@@ -120,5 +188,139 @@ class TransactionTest(unittest.TestCase):
         tx = Transaction.parse_transaction(stream)
         self.assertIsNone(tx.coinbase_height())
 
+class SegwitTest(unittest.TestCase):
+    # native P2WPKH example of BIP143, spending a p2pk output and a P2WPKH output
+    unsigned_tx = '0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000'
+    signed_tx = '01000000000102fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f00000000494830450221008b9d1dc26ba6a9cb62127b02742fa9d754cd3bebf337f7a55d114c8e5cdd30be022040529b194ba3f9281a99f2b1c0a19c0489bc22ede944ccf4ecbab4cc618ef3ed01eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac000247304402203609e17b84f6a7d30c80bfa610b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c4518331561406f90300e8f3358f51928d43c212a8caed02de67eebee0121025476c2e83188368da1ff3e292e7acafcdb3566bb0ad253f62fc70f07aeee635711000000'
+    h160 = bytes.fromhex('1d0f172a0ecb48aee1be1f2687d2963ae33f71a1')
+    z = 0xc37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670
+
+    def setUp(self):
+        SCRIPT_EXECUTION_CACHE.clear()
+        SIGNATURE_CACHE.clear()
+        # the P2WPKH output of 6 BTC spent by the second input
+        prev_tx = Transaction(1, [], [TransactionOutput(0, Script()), TransactionOutput(600000000, p2wpkh_script(self.h160))], 0)
+        TransactionFetcher.cache['8ac60eb9575db5b2d987e29f301b5b819ea83a5c6579d282d189cc04b8e151ef'] = prev_tx
+
+    def tearDown(self):
+        SIGNATURE_CACHE.clear()
+
+    def test_parse_segwit(self):
+        raw = bytes.fromhex(self.signed_tx)
+        tx = Transaction.parse_transaction(BytesIO(raw))
+        self.assertTrue(tx.is_segwit())
+        self.assertEqual(tx.tx_ins[0].witness, [])
+        self.assertEqual(len(tx.tx_ins[1].witness), 2)
+        self.assertEqual(tx.locktime, 17)
+        self.assertEqual(tx.serialize_transaction(), raw)
+        # the txid leaves the witnesses out, the wtxid does not
+        self.assertEqual(tx.hash(), hash256(tx.serialize_legacy())[::-1])
+        self.assertNotEqual(tx.hash(), tx.witness_hash())
+        self.assertEqual(Transaction.parse_transaction(BytesIO(tx.serialize_legacy())).hash(), tx.hash())
+        # both formats parse from a stream that cannot seek
+        self.assertEqual(Transaction.parse_transaction(ForwardReader(raw)).serialize_transaction(), raw)
+        legacy = tx.serialize_legacy()
+        self.assertEqual(Transaction.parse_transaction(ForwardReader(legacy)).serialize_transaction(), legacy)
+
+    def test_parse_with_hash(self):
+        raw = bytes.fromhex(self.signed_tx)
+        tx = Transaction.parse_transaction(BytesIO(raw))
+        for stream in (ForwardReader(raw), ForwardReader(tx.serialize_legacy())):
+            parsed, txid = Transaction.parse_transaction_with_hash(stream)
+            self.assertEqual(txid, tx.hash())
+            self.assertEqual(stream.read(1), b'')
+        # the txid comes from the bytes consumed, a witness count in a non-canonical varint does not shift it
+        padded = raw.replace(bytes.fromhex('88ac000247'), bytes.fromhex('88ac00fd020047'))
+        self.assertNotEqual(padded, raw)
+        parsed, txid = Transaction.parse_transaction_with_hash(ForwardReader(padded))
+        self.assertEqual(txid, tx.hash())
+        self.assertEqual(parsed.tx_ins[1].witness, tx.tx_ins[1].witness)
+        # a non-canonical input count is hashed as read
+        legacy = bytes.fromhex(self.unsigned_tx)
+        padded = legacy[:4] + bytes.fromhex('fd0200') + legacy[5:]
+        self.assertEqual(Transaction.parse_transaction_with_hash(ForwardReader(padded))[1], hash256(padded)[::-1])
+
+    def test_sig_hash_bip143(self):
+        tx = Transaction.parse_transaction(BytesIO(bytes.fromhex(self.unsigned_tx)))
+        self.assertEqual(tx.hash_prevouts().hex(), '96b827c8483d4e9b96712b6713a7b68d6e8003a781feba36c31143470b4efd37')
+        self.assertEqual(tx.hash_sequence().hex(), '52b0a642eea2fb7ae638c36f6252b6750293dbe574a806984b8e4d8548339a3b')
+        self.assertEqual(tx.hash_outputs().hex(), '863ef3e1a92afbfdb97f31ad0fc7683ee943e9abcf2501590ff8f6551f47e5e5')
+        self.assertEqual(tx.sig_hash_bip143(1, p2pkh_script(self.h160)), self.z)
+        self.assertEqual(tx.sig_hash_bip143(1, p2pkh_script(self.h160), tx.bip143_hashes()), self.z)
+        # changing an output after a sig_hash changes the next one
+        tx.tx_outs[0].amount += 1
+        self.assertNotEqual(tx.hash_outputs().hex(), '863ef3e1a92afbfdb97f31ad0fc7683ee943e9abcf2501590ff8f6551f47e5e5')
+        self.assertNotEqual(tx.sig_hash_bip143(1, p2pkh_script(self.h160)), self.z)
+
+    def test_verify_p2wpkh(self):
+        tx = Transaction.parse_transaction(BytesIO(bytes.fromhex(self.signed_tx)))
+        signature, sec = tx.tx_ins[1].witness
+        SIGNATURE_CACHE.add(self.z, signature[:-1], sec)
+        self.assertTrue(tx.verify_input(1))
+        # a signature deferred to a batch
+        SCRIPT_EXECUTION_CACHE.clear()
+        batch = SignatureBatch()
+        self.assertTrue(tx.verify_input(1, batch=batch))
+        self.assertEqual(len(batch), 1)
+        # another key, a ScriptSig on a native program and a missing witness all fail
+        tx.tx_ins[1].witness = [signature, b'\x03' + sec[1:]]
+        self.assertFalse(tx.verify_input(1))
+        tx.tx_ins[1].witness = [signature, sec]
+        tx.tx_ins[1].script_sig = Script([0x51])
+        self.assertFalse(tx.verify_input(1))
+        tx.tx_ins[1].script_sig = Script()
+        tx.tx_ins[1].witness = []
+        self.assertFalse(tx.verify_input(1))
+
+    def test_verify_p2wsh(self):
+        witness_script = Script([0x52, 0x87]).raw_serialize()
+        program = hashlib.sha256(witness_script).digest()
+        prev_tx = Transaction(1, [TransactionInput(b'\x00' * 32, 0)], [TransactionOutput(1000, p2wsh_script(program)), TransactionOutput(1000, p2sh_script(hash160(p2wsh_script(program).raw_serialize())))], 0)
+        TransactionFetcher.cache[prev_tx.id()] = prev_tx
+        tx = Transaction(1, [TransactionInput(prev_tx.hash(), 0, witness=[b'\x02', witness_script])], [TransactionOutput(500, Script([0x51]))], 0)
+        self.assertTrue(tx.verify_input(0))
+        tx.tx_ins[0].witness = [b'\x03', witness_script]
+        self.assertFalse(tx.verify_input(0))
+        # the witness script must leave exactly one element
+        tx.tx_ins[0].witness = [b'\x01', b'\x02', witness_script]
+        self.assertFalse(tx.verify_input(0))
+        # nested in p2sh, the ScriptSig only pushes the witness program
+        nested = TransactionInput(prev_tx.hash(), 1, Script([p2wsh_script(program).raw_serialize()]), witness=[b'\x02', witness_script])
+        tx = Transaction(1, [nested], [TransactionOutput(500, Script([0x51]))], 0)
+        self.assertTrue(tx.verify_input(0))
+        nested.script_sig = Script([0x51, p2wsh_script(program).raw_serialize()])
+        self.assertFalse(tx.verify_input(0))
+
+    def test_witness_versions(self):
+        taproot = Script([0x51, b'\x02' * 32])
+        unknown = Script([0x52, b'\x02' * 20])
+        short_v0 = Script([0x00, b'\x02' * 25])
+        prev_tx = Transaction(1, [TransactionInput(b'\x00' * 32, 0)], [TransactionOutput(1000, taproot), TransactionOutput(1000, unknown), TransactionOutput(1000, short_v0), TransactionOutput(1000, p2sh_script(hash160(taproot.raw_serialize())))], 0)
+        TransactionFetcher.cache[prev_tx.id()] = prev_tx
+        tx = Transaction(1, [TransactionInput(prev_tx.hash(), i, witness=[b'\x01' * 64]) for i in range(3)], [TransactionOutput(500, Script([0x51]))], 0)
+        # Taproot is not verified, so it does not pass
+        self.assertFalse(tx.verify_input_scripts(0, taproot))
+        self.assertFalse(tx.verify_input(0))
+        self.assertFalse(tx.verify())
+        # versions no soft fork defines yet succeed, so does a version 1 program of another length
+        self.assertTrue(tx.verify_input(1))
+        self.assertTrue(tx.verify_input_scripts(1, Script([0x51, b'\x02' * 20])))
+        # version 0 programs are 20 or 32 bytes
+        self.assertFalse(tx.verify_input(2))
+        # a P2TR program nested in p2sh is not Taproot (BIP341) and stays anyone can spend
+        nested = TransactionInput(prev_tx.hash(), 3, Script([taproot.raw_serialize()]), witness=[b'\x01' * 64])
+        self.assertTrue(Transaction(1, [nested], [TransactionOutput(500, Script([0x51]))], 0).verify_input(0))
+        # but still spent with an empty ScriptSig when native
+        tx.tx_ins[0].script_sig = Script([0x51])
+        self.assertFalse(tx.verify_input(0))
+
+    def test_unexpected_witness(self):
+        prev_tx = Transaction(1, [TransactionInput(b'\x00' * 32, 0)], [TransactionOutput(1000, Script([0x51]))], 0)
+        TransactionFetcher.cache[prev_tx.id()] = prev_tx
+        tx = Transaction(1, [TransactionInput(prev_tx.hash(), 0)], [TransactionOutput(500, Script([0x51]))], 0)
+        self.assertTrue(tx.verify_input(0))
+        tx.tx_ins[0].witness = [b'\x01']
+        self.assertFalse(tx.verify_input(0))
+
 if __name__ == '__main__':
     unittest.main()
@@ -55,6 +55,15 @@ class TestUtils(unittest.TestCase):
         want = '2N3u1R6uwQfuobCqbCgBkpsgBxvr1tZpe7B'
         self.assertEqual(hash160_to_p2sh_address(h160, testnet=True), want)
 
+    def test_segwit_address(self):
+        tests = [
+            ('751e76e8199196d454941c45d1b3a323f1433bd6', 0, False, 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4'),
+            ('1863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262', 0, True, 'tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7'),
+            ('79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798', 1, False, 'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0'),
+        ]
+        for program, version, testnet, want in tests:
+            self.assertEqual(witness_program_to_segwit_address(bytes.fromhex(program), version, testnet), want)
+
     def test_calculate_new_bits(self):
         prev_bits = bytes.fromhex('54d80118')
         time_differential = 302400